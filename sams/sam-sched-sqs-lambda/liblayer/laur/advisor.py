@@ -0,0 +1,427 @@
+"""
+A tuning advisor for a SQS event source mapping, driven by the depth of the queue and the duration of invocations.
+
+Samples of the queue, taken at an interval, record ApproximateNumberOfMessages, ...NotVisible and ...Delayed,
+and with a CloudWatch client the invocations and Duration of the function and the messages sent to and deleted
+from the queue during the interval. From samples, recorded or taken from any client including laur.localsqs,
+the advisor estimates
+ * the throughput achieved: messages deleted per second or, without CloudWatch, messages in flight divided by
+   the time an invocation takes (Little's law),
+ * the arrival rate, and how long the backlog takes to drain at the current throughput,
+and recommends BatchSize, MaximumBatchingWindowInSeconds, ScalingConfig.MaximumConcurrency, VisibilityTimeout
+and the function Timeout of template.yaml to drain the backlog within a target time.
+
+    python -m laur.advisor sample QUEUE_URL --function-name FUNCTION --count 30 --interval 60 > samples.jsonl
+    python -m laur.advisor advise samples.jsonl --target-drain-seconds 300
+
+A sample is a JSON line: {"at": 1700000000.0, "visible": 120, "notVisible": 30, "delayed": 0, "invocations": 12,
+"records": 110, "sent": 150, "deleted": 140, "durationMs": {"avg": 300.0, "p99": 900.0, "max": 1200.0}}.
+Fields but at and the numbers of messages are optional.
+
+For the settings, see https://docs.aws.amazon.com/lambda/latest/dg/services-sqs-configure.html
+"""
+import json
+import logging
+import math
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from laur.drain import COUNT_ATTRIBUTE_NAMES
+from laur.eventsource import (DEFAULT_BATCH_SIZE, DEFAULT_FUNCTION_TIMEOUT, DEFAULT_MAXIMUM_BATCHING_WINDOW,
+                              DEFAULT_MAXIMUM_CONCURRENCY, DEFAULT_VISIBILITY_TIMEOUT)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 60
+DEFAULT_TARGET_DRAIN_SECONDS = 300
+# How long an invocation may take at the recommended batch size.
+DEFAULT_TARGET_INVOCATION_SECONDS = 5
+# The latency a batching window may add to a message.
+DEFAULT_MAX_WINDOW_SECONDS = 5
+# Head room over the estimates for concurrency and timeouts.
+CONCURRENCY_HEADROOM = 1.2
+TIMEOUT_HEADROOM = 2
+# VisibilityTimeout is at least 6 times the function timeout plus the batching window, as AWS recommends.
+VISIBILITY_TIMEOUT_FACTOR = 6
+
+MAX_FIFO_BATCH_SIZE = 10
+MAX_STANDARD_BATCH_SIZE = 10000
+# A standard queue takes a batch larger than 10 only with a batching window of 1 second or more.
+MAX_BATCH_SIZE_WITHOUT_WINDOW = 10
+MAX_BATCHING_WINDOW = 300
+MIN_MAXIMUM_CONCURRENCY = 2
+MAX_MAXIMUM_CONCURRENCY = 1000
+MAX_FUNCTION_TIMEOUT = 900
+MAX_VISIBILITY_TIMEOUT = 43200
+
+
+class Settings:
+    """
+    Settings of the event source mapping, the function and the queue. The defaults are those of template.yaml.
+    """
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE,
+                 maximum_batching_window: int = DEFAULT_MAXIMUM_BATCHING_WINDOW,
+                 maximum_concurrency: int = DEFAULT_MAXIMUM_CONCURRENCY,
+                 function_timeout: int = DEFAULT_FUNCTION_TIMEOUT,
+                 visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT, fifo: bool = True):
+        self.batch_size = batch_size
+        self.maximum_batching_window = maximum_batching_window
+        self.maximum_concurrency = maximum_concurrency
+        self.function_timeout = function_timeout
+        self.visibility_timeout = visibility_timeout
+        self.fifo = fifo
+
+    def to_dict(self) -> dict:
+        return {
+            'BatchSize': self.batch_size,
+            'MaximumBatchingWindowInSeconds': self.maximum_batching_window,
+            'MaximumConcurrency': self.maximum_concurrency,
+            'Timeout': self.function_timeout,
+            'VisibilityTimeout': self.visibility_timeout,
+        }
+
+
+def sample_queue(client, queue_url: str, clock=time) -> dict:
+    """
+    The numbers of messages of a queue now.
+    """
+    attributes = client.get_queue_attributes(QueueUrl=queue_url,
+                                             AttributeNames=COUNT_ATTRIBUTE_NAMES).get('Attributes', {})
+    return {
+        'at': clock.time(),
+        'visible': int(attributes.get('ApproximateNumberOfMessages', 0)),
+        'notVisible': int(attributes.get('ApproximateNumberOfMessagesNotVisible', 0)),
+        'delayed': int(attributes.get('ApproximateNumberOfMessagesDelayed', 0)),
+    }
+
+
+def _statistic(cloudwatch, namespace: str, metric_name: str, dimensions: dict, start: float, end: float,
+               statistics: Iterable[str] = (), extended_statistics: Iterable[str] = ()) -> dict:
+    kwargs = {}
+    if statistics:
+        kwargs['Statistics'] = list(statistics)
+    if extended_statistics:
+        kwargs['ExtendedStatistics'] = list(extended_statistics)
+    period = max(60, int(math.ceil((end - start) / 60)) * 60)
+    datapoints = cloudwatch.get_metric_statistics(
+        Namespace=namespace, MetricName=metric_name,
+        Dimensions=[{'Name': name, 'Value': value} for name, value in dimensions.items()],
+        StartTime=datetime.fromtimestamp(start, timezone.utc), EndTime=datetime.fromtimestamp(end, timezone.utc),
+        Period=period, **kwargs,
+    ).get('Datapoints', [])
+    if not datapoints:
+        return {}
+    datapoint = max(datapoints, key=lambda d: d['Timestamp'])
+    values = {name: datapoint[name] for name in statistics if name in datapoint}
+    values.update(datapoint.get('ExtendedStatistics', {}))
+    return values
+
+
+def sample_metrics(cloudwatch, start: float, end: float, function_name: Optional[str] = None,
+                   queue_name: Optional[str] = None, metrics_namespace: Optional[str] = None,
+                   metrics_dimensions: Optional[Dict[str, str]] = None) -> dict:
+    """
+    Invocations and Duration of a function, messages sent to and deleted from a queue, and records of batches
+    from the BatchSize metric of laur.metrics in metrics_namespace, between start and end.
+    metrics_dimensions are all dimensions of the metrics of laur.metrics, the function name only by default.
+    Missing metrics are left out.
+    """
+    sample = {}
+    if function_name:
+        dimensions = {'FunctionName': function_name}
+        invocations = _statistic(cloudwatch, 'AWS/Lambda', 'Invocations', dimensions, start, end, ['Sum'])
+        if invocations:
+            sample['invocations'] = int(invocations['Sum'])
+        duration = _statistic(cloudwatch, 'AWS/Lambda', 'Duration', dimensions, start, end, ['Average', 'Maximum'],
+                              ['p99'])
+        if duration:
+            sample['durationMs'] = {'avg': duration.get('Average'), 'p99': duration.get('p99'),
+                                    'max': duration.get('Maximum')}
+        if metrics_namespace:
+            records = _statistic(cloudwatch, metrics_namespace, 'BatchSize', metrics_dimensions or dimensions,
+                                 start, end, ['Sum'])
+            if records:
+                sample['records'] = int(records['Sum'])
+    if queue_name:
+        dimensions = {'QueueName': queue_name}
+        for name, metric_name in (('sent', 'NumberOfMessagesSent'), ('deleted', 'NumberOfMessagesDeleted')):
+            value = _statistic(cloudwatch, 'AWS/SQS', metric_name, dimensions, start, end, ['Sum'])
+            if value:
+                sample[name] = int(value['Sum'])
+    return sample
+
+
+def collect(client, queue_url: str, count: int, interval: float = DEFAULT_INTERVAL, cloudwatch=None,
+            function_name: Optional[str] = None, metrics_namespace: Optional[str] = None,
+            metrics_dimensions: Optional[Dict[str, str]] = None, stream=None, clock=time) -> List[dict]:
+    """
+    Take count samples interval seconds apart, writing each to stream as a JSON line as it is taken.
+    """
+    queue_name = queue_url.rstrip('/').rsplit('/', 1)[-1]
+    samples = []
+    previous_at = None
+    for idx in range(count):
+        if idx:
+            clock.sleep(interval)
+        sample = sample_queue(client, queue_url, clock)
+        if cloudwatch is not None and previous_at is not None:
+            sample.update(sample_metrics(cloudwatch, previous_at, sample['at'], function_name, queue_name,
+                                         metrics_namespace, metrics_dimensions))
+        previous_at = sample['at']
+        samples.append(sample)
+        if stream is not None:
+            stream.write(json.dumps(sample) + '\n')
+            stream.flush()
+    return samples
+
+
+def load_samples(paths: Iterable[str]) -> List[dict]:
+    samples = []
+    for path in paths:
+        with open(path) as f:
+            samples.extend(json.loads(line) for line in f if line.strip())
+    return sorted(samples, key=lambda sample: sample['at'])
+
+
+class Advice:
+    """
+    Measurements of samples, and the recommended settings with the reasons for them.
+    """
+
+    def __init__(self, settings: Settings):
+        self.current = settings
+        self.recommended = Settings(settings.batch_size, settings.maximum_batching_window,
+                                    settings.maximum_concurrency, settings.function_timeout,
+                                    settings.visibility_timeout, settings.fifo)
+        self.measured = {}
+        self.reasons: List[str] = []
+
+    @property
+    def changes(self) -> dict:
+        current = self.current.to_dict()
+        return {name: value for name, value in self.recommended.to_dict().items() if current[name] != value}
+
+    def to_dict(self) -> dict:
+        return {
+            'measured': self.measured,
+            'current': self.current.to_dict(),
+            'recommended': self.recommended.to_dict(),
+            'changes': self.changes,
+            'reasons': self.reasons,
+        }
+
+
+def _sum_of(samples: List[dict], name: str) -> Optional[float]:
+    values = [sample[name] for sample in samples if sample.get(name) is not None]
+    return sum(values) if values else None
+
+
+def _duration_of(samples: List[dict], statistic: str) -> Optional[float]:
+    """
+    The mean of a statistic of Duration in milliseconds, weighted by invocations, or the maximum for max.
+    """
+    pairs = [(sample['durationMs'][statistic], sample.get('invocations') or 1) for sample in samples
+             if (sample.get('durationMs') or {}).get(statistic) is not None]
+    if not pairs:
+        return None
+    if statistic == 'max':
+        return max(value for value, _ in pairs)
+    return sum(value * weight for value, weight in pairs) / sum(weight for _, weight in pairs)
+
+
+def _round(value: Optional[float], digits: int = 3) -> Optional[float]:
+    return None if value is None else round(value, digits)
+
+
+def advise(samples: List[dict], settings: Optional[Settings] = None,
+           target_drain_seconds: float = DEFAULT_TARGET_DRAIN_SECONDS,
+           target_invocation_seconds: float = DEFAULT_TARGET_INVOCATION_SECONDS,
+           max_window_seconds: float = DEFAULT_MAX_WINDOW_SECONDS, groups: Optional[int] = None) -> Advice:
+    """
+    Recommend settings from samples in time order. groups is the number of active message groups of a FIFO queue,
+    which bounds its concurrency.
+    """
+    settings = settings or Settings()
+    advice = Advice(settings)
+    if len(samples) < 2:
+        raise ValueError('At least 2 samples are needed')
+    first, last = samples[0], samples[-1]
+    elapsed = last['at'] - first['at']
+    if elapsed <= 0:
+        raise ValueError('Samples must span some time')
+    # Metrics of an interval are recorded with the sample at its end.
+    intervals = samples[1:]
+
+    backlog = last['visible'] + last.get('delayed', 0)
+    backlog_change = backlog - (first['visible'] + first.get('delayed', 0))
+    mean_in_flight = sum(sample['notVisible'] for sample in samples) / len(samples)
+    avg_ms, p99_ms, max_ms = (_duration_of(intervals, statistic) for statistic in ('avg', 'p99', 'max'))
+    invocations = _sum_of(intervals, 'invocations')
+    records = _sum_of(intervals, 'records')
+    deleted = _sum_of(intervals, 'deleted')
+    sent = _sum_of(intervals, 'sent')
+
+    if records is not None and invocations:
+        mean_batch_size = records / invocations
+    elif deleted is not None and invocations:
+        mean_batch_size = deleted / invocations
+    else:
+        mean_batch_size = settings.batch_size
+    mean_batch_size = max(mean_batch_size, 1)
+
+    if deleted is not None:
+        throughput = deleted / elapsed
+    elif avg_ms:
+        # Little's law: messages in flight are each held for about an invocation.
+        throughput = mean_in_flight / (avg_ms / 1000)
+    else:
+        throughput = None
+    if sent is not None:
+        arrival_rate = sent / elapsed
+    elif throughput is not None:
+        arrival_rate = max(throughput + backlog_change / elapsed, 0)
+    else:
+        arrival_rate = None
+
+    drain_seconds = None
+    if throughput is not None and arrival_rate is not None and backlog:
+        net = throughput - arrival_rate
+        drain_seconds = backlog / net if net > 0 else None
+    elif not backlog:
+        drain_seconds = 0
+    concurrency = invocations * (avg_ms / 1000) / elapsed if invocations and avg_ms else None
+
+    advice.measured = {
+        'samples': len(samples),
+        'elapsedSeconds': round(elapsed, 3),
+        'backlog': backlog,
+        'backlogChangePerSecond': round(backlog_change / elapsed, 3),
+        'meanInFlight': round(mean_in_flight, 3),
+        'throughputPerSecond': _round(throughput),
+        'arrivalRatePerSecond': _round(arrival_rate),
+        'drainSeconds': _round(drain_seconds, 1),
+        'meanBatchSize': round(mean_batch_size, 3),
+        'meanConcurrency': _round(concurrency),
+        'durationMs': {'avg': _round(avg_ms), 'p99': _round(p99_ms), 'max': _round(max_ms)},
+    }
+    reasons = advice.reasons
+    recommended = advice.recommended
+    if backlog and drain_seconds is None:
+        reasons.append(f'The backlog of {backlog} messages is not draining at the current throughput')
+    if avg_ms is None:
+        reasons.append('No durations in the samples: only VisibilityTimeout is checked against Timeout')
+    else:
+        # Duration per record, with the overhead of an invocation spread over its records, which overestimates
+        # the duration of larger batches.
+        record_seconds = avg_ms / 1000 / mean_batch_size
+        max_batch_size = MAX_FIFO_BATCH_SIZE if settings.fifo else MAX_STANDARD_BATCH_SIZE
+        batch_size = max(1, min(max_batch_size, int(target_invocation_seconds / record_seconds)))
+        if not settings.fifo and batch_size > MAX_BATCH_SIZE_WITHOUT_WINDOW and max_window_seconds < 1:
+            batch_size = MAX_BATCH_SIZE_WITHOUT_WINDOW
+        recommended.batch_size = batch_size
+        if batch_size != settings.batch_size:
+            reasons.append(f'BatchSize {batch_size}: a record takes about {record_seconds * 1000:.1f} ms, '
+                           f'so a batch takes about {target_invocation_seconds} s at most')
+
+        if settings.fifo:
+            recommended.maximum_batching_window = 0
+        elif arrival_rate and arrival_rate < batch_size:
+            # Wait for a fuller batch when messages arrive slower than a batch per second.
+            window = min(max_window_seconds, MAX_BATCHING_WINDOW, math.ceil(batch_size / arrival_rate))
+            if batch_size > MAX_BATCH_SIZE_WITHOUT_WINDOW:
+                window = max(window, 1)
+            recommended.maximum_batching_window = int(window)
+        else:
+            recommended.maximum_batching_window = 1 if batch_size > MAX_BATCH_SIZE_WITHOUT_WINDOW else 0
+        if recommended.maximum_batching_window != settings.maximum_batching_window:
+            reasons.append(f'MaximumBatchingWindowInSeconds {recommended.maximum_batching_window}: messages arrive '
+                           f'at {arrival_rate or 0:.2f}/s for batches of {batch_size}'
+                           + (', and FIFO queues take no batching window' if settings.fifo else ''))
+
+        invocation_seconds = record_seconds * batch_size
+        if throughput is not None and arrival_rate is not None:
+            required = arrival_rate + backlog / target_drain_seconds
+            needed = math.ceil(required * invocation_seconds / batch_size * CONCURRENCY_HEADROOM)
+            maximum_concurrency = max(MIN_MAXIMUM_CONCURRENCY, min(MAX_MAXIMUM_CONCURRENCY, needed))
+            if settings.fifo and groups:
+                if needed > groups:
+                    reasons.append(f'A FIFO queue with {groups} active message groups runs at most {groups} '
+                                   f'invocations at once, short of the {needed} needed')
+                maximum_concurrency = max(MIN_MAXIMUM_CONCURRENCY, min(maximum_concurrency, groups))
+            recommended.maximum_concurrency = maximum_concurrency
+            if maximum_concurrency != settings.maximum_concurrency:
+                reasons.append(f'MaximumConcurrency {maximum_concurrency}: {required:.2f} messages/s drain the '
+                               f'backlog within {target_drain_seconds} s at {invocation_seconds:.2f} s per batch')
+
+        slowest_ms = max(value for value in (avg_ms, p99_ms, max_ms) if value is not None)
+        timeout = math.ceil(slowest_ms / 1000 * batch_size / mean_batch_size * TIMEOUT_HEADROOM)
+        recommended.function_timeout = max(3, min(MAX_FUNCTION_TIMEOUT, timeout))
+        if recommended.function_timeout != settings.function_timeout:
+            reasons.append(f'Timeout {recommended.function_timeout}: twice the slowest invocation, '
+                           f'{slowest_ms:.0f} ms, at the recommended batch size')
+
+    visibility_timeout = min(MAX_VISIBILITY_TIMEOUT, VISIBILITY_TIMEOUT_FACTOR * recommended.function_timeout
+                             + recommended.maximum_batching_window)
+    recommended.visibility_timeout = visibility_timeout
+    if visibility_timeout != settings.visibility_timeout:
+        reasons.append(f'VisibilityTimeout {visibility_timeout}: {VISIBILITY_TIMEOUT_FACTOR} times the Timeout '
+                       f'plus the batching window, so that a batch is not received again while it is processed')
+    return advice
+
+
+def main(argv=None):
+    """
+    Sample the depth of a queue, or recommend settings of its event source mapping from samples.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m laur.advisor', description=main.__doc__)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sample_parser = subparsers.add_parser('sample', help='Print samples of a queue as JSON lines')
+    sample_parser.add_argument('queue_url')
+    sample_parser.add_argument('--count', type=int, default=10)
+    sample_parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='Seconds between samples')
+    sample_parser.add_argument('--function-name', help='The function to get Invocations and Duration of')
+    sample_parser.add_argument('--metrics-namespace', help='The METRICS_NAMESPACE of the function, for BatchSize')
+    sample_parser.add_argument('--metrics-dimension', action='append', default=[],
+                               help='NAME=VALUE, e.g. AppId=tryaws, a dimension of the metrics of the function')
+    sample_parser.add_argument('--no-cloudwatch', action='store_true', help='Sample the queue only')
+
+    advise_parser = subparsers.add_parser('advise', help='Print recommended settings as JSON')
+    advise_parser.add_argument('samples', nargs='+', help='Files of samples as JSON lines')
+    advise_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    advise_parser.add_argument('--maximum-batching-window', type=int, default=DEFAULT_MAXIMUM_BATCHING_WINDOW)
+    advise_parser.add_argument('--maximum-concurrency', type=int, default=DEFAULT_MAXIMUM_CONCURRENCY)
+    advise_parser.add_argument('--timeout', type=int, default=DEFAULT_FUNCTION_TIMEOUT, help='The function timeout')
+    advise_parser.add_argument('--visibility-timeout', type=int, default=DEFAULT_VISIBILITY_TIMEOUT)
+    advise_parser.add_argument('--standard', action='store_true', help='The queue is a standard queue, not FIFO')
+    advise_parser.add_argument('--groups', type=int, help='Active message groups of a FIFO queue')
+    advise_parser.add_argument('--target-drain-seconds', type=float, default=DEFAULT_TARGET_DRAIN_SECONDS)
+    advise_parser.add_argument('--target-invocation-seconds', type=float, default=DEFAULT_TARGET_INVOCATION_SECONDS)
+    advise_parser.add_argument('--max-window-seconds', type=float, default=DEFAULT_MAX_WINDOW_SECONDS)
+    args = parser.parse_args(argv)
+
+    if args.command == 'sample':
+        from laur.runtime import get_client
+
+        cloudwatch = None if args.no_cloudwatch else get_client('cloudwatch')
+        dimensions = dict(dimension.split('=', 1) for dimension in args.metrics_dimension)
+        collect(get_client('sqs'), args.queue_url, args.count, args.interval, cloudwatch=cloudwatch,
+                function_name=args.function_name, metrics_namespace=args.metrics_namespace,
+                metrics_dimensions=dimensions or None, stream=sys.stdout)
+        return 0
+
+    settings = Settings(args.batch_size, args.maximum_batching_window, args.maximum_concurrency, args.timeout,
+                        args.visibility_timeout, fifo=not args.standard)
+    advice = advise(load_samples(args.samples), settings, args.target_drain_seconds,
+                    args.target_invocation_seconds, args.max_window_seconds, args.groups)
+    print(json.dumps(advice.to_dict(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
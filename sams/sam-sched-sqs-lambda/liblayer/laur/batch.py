@@ -0,0 +1,203 @@
+"""
+Batch processing of SQS records for a Lambda function invoked by an event source mapping.
+
+Records that share a MessageGroupId are processed one by one in the order they were received,
+while different groups are processed in parallel on a bounded worker pool.
+
+Given the context of the invocation, no record is started once the remaining time is less than a safety margin
+plus the average time a record has taken so far. Records not started are reported as failures and the handler
+returns in time, so that only they are received again instead of the whole batch after a timeout.
+
+Given a sink, e.g. laur.sink.BatchSink, the writes records put to it are flushed once all records are processed,
+and records whose writes failed are reported as failures, with the records after them in their groups.
+Only then is success_handler, e.g. laur.claimcheck.ClaimCheck.discard_blobs, given the records that succeeded.
+
+For partial batch responses of FIFO queues,
+see https://docs.aws.amazon.com/lambda/latest/dg/services-sqs-errorhandling.html#services-sqs-batchfailurereporting
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 10
+# Time left for returning the response and for a record that takes longer than the average.
+DEFAULT_SAFETY_MARGIN_MS = 500
+
+
+def group_id_of(record: dict) -> str:
+    """
+    Get the key that orders the record.
+    A record from a standard queue has no MessageGroupId, so it makes a group by itself.
+    """
+    group_id = record.get('attributes', {}).get('MessageGroupId')
+    if group_id is None:
+        return record['messageId']
+    return group_id
+
+
+def group_records(records: Iterable[dict]) -> List[List[dict]]:
+    """
+    Split records into groups by MessageGroupId, keeping the order of records in each group.
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault(group_id_of(record), []).append(record)
+    return list(groups.values())
+
+
+class Deadline:
+    """
+    The deadline of an invocation, and a running average of the time a record takes, shared by all workers.
+    """
+
+    def __init__(self, context, safety_margin_ms: int = DEFAULT_SAFETY_MARGIN_MS, clock=time):
+        self.context = context
+        self.safety_margin_ms = safety_margin_ms
+        self.clock = clock
+        self.records = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def average_ms(self) -> float:
+        return self.total_ms / self.records if self.records else 0.0
+
+    def can_start(self) -> bool:
+        """
+        Whether a record started now is expected to finish before the safety margin.
+        """
+        return self.context.get_remaining_time_in_millis() - self.safety_margin_ms >= self.average_ms
+
+    def run(self, func: Callable[[dict], None], record: dict):
+        started_at = self.clock.monotonic()
+        try:
+            func(record)
+        finally:
+            elapsed_ms = (self.clock.monotonic() - started_at) * 1000
+            with self._lock:
+                self.records += 1
+                self.total_ms += elapsed_ms
+
+
+class BatchProcessor:
+    """
+    Process SQS records with a record handler and build the response for ReportBatchItemFailures.
+
+    Once a record fails, every following record in the same group is reported as a failure without being attempted,
+    since Lambda must not process a later message of a FIFO group before an earlier one succeeds.
+    The same goes for records not started because the deadline of the invocation is close.
+
+    failure_handler, e.g. laur.retry.RetryHandler, gets the failed records and the message ids of those that raised,
+    and returns the message ids to report as failures. A record whose writes to the sink failed counts as raised.
+    success_handler gets the records that succeeded, with their writes to the sink flushed, once failure_handler
+    returns. A failed record is not passed to it even if failure_handler does not report it, e.g. moved to a DLQ.
+    """
+
+    def __init__(self, record_handler: Callable[[dict], None], max_workers: int = DEFAULT_MAX_WORKERS,
+                 safety_margin_ms: int = DEFAULT_SAFETY_MARGIN_MS, clock=time,
+                 failure_handler: Optional[Callable[[List[dict], Set[str]], Iterable[str]]] = None, sink=None,
+                 success_handler: Optional[Callable[[List[dict]], None]] = None):
+        if max_workers < 1:
+            raise ValueError(f'max_workers must be 1 or more: {max_workers}')
+        self.record_handler = record_handler
+        self.max_workers = max_workers
+        self.safety_margin_ms = safety_margin_ms
+        self.clock = clock
+        self.failure_handler = failure_handler
+        self.sink = sink
+        self.success_handler = success_handler
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        The worker pool, created at first use and reused across warm invocations.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='laur-batch')
+        return self._executor
+
+    def process_group(self, records: List[dict], deadline: Optional[Deadline] = None,
+                      raised: Optional[Set[str]] = None) -> List[str]:
+        """
+        Process records of a group in order and return message ids of the failed and not started records.
+        The message id of a record that raised is added to raised.
+        """
+        for idx, record in enumerate(records):
+            if deadline is not None and not deadline.can_start():
+                logger.warning('Not starting %d records to return before the deadline', len(records) - idx)
+                return [r['messageId'] for r in records[idx:]]
+            try:
+                if deadline is None:
+                    self.record_handler(record)
+                else:
+                    deadline.run(self.record_handler, record)
+            except Exception:
+                logger.exception('Failed to process a record: %s', record.get('messageId'))
+                if raised is not None:
+                    raised.add(record['messageId'])
+                return [r['messageId'] for r in records[idx:]]
+        return []
+
+    def process(self, records: Iterable[dict], context=None) -> dict:
+        """
+        Process records and return a response with batchItemFailures in the order of the records.
+        Given the context of the invocation, records are not started when they would risk its timeout.
+        """
+        records = list(records)
+        groups = group_records(records)
+        deadline = None
+        if hasattr(context, 'get_remaining_time_in_millis'):
+            deadline = Deadline(context, self.safety_margin_ms, self.clock)
+
+        raised = set()
+        if len(groups) <= 1 or self.max_workers == 1:
+            results = [self.process_group(group, deadline, raised) for group in groups]
+        else:
+            results = list(self.executor.map(self.process_group, groups, [deadline] * len(groups),
+                                             [raised] * len(groups)))
+
+        failed = set()
+        for message_ids in results:
+            failed.update(message_ids)
+        if self.sink is not None:
+            self._flush_sink(groups, failed, raised, deadline)
+        succeeded = [record for record in records if record['messageId'] not in failed]
+        if failed and self.failure_handler is not None:
+            failed = set(self.failure_handler([record for record in records if record['messageId'] in failed], raised))
+        if succeeded and self.success_handler is not None:
+            self.success_handler(succeeded)
+
+        return {
+            'batchItemFailures': [
+                {'itemIdentifier': record['messageId']} for record in records if record['messageId'] in failed
+            ]
+        }
+
+    def _flush_sink(self, groups: List[List[dict]], failed: Set[str], raised: Set[str],
+                    deadline: Optional[Deadline]):
+        """
+        Flush the writes of the records that succeeded, and add records whose writes failed to failed and raised,
+        with the records after them in their groups.
+        """
+        write_failed = {record['messageId'] for record in self.sink.flush(exclude=failed, deadline=deadline)}
+        if not write_failed:
+            return
+        raised.update(write_failed)
+        for group in groups:
+            for idx, record in enumerate(group):
+                if record['messageId'] in write_failed:
+                    failed.update(r['messageId'] for r in group[idx:])
+                    break
+
+    def shutdown(self):
+        """
+        Shut down the worker pool if it was created.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,132 @@
+"""
+Capture of live SQS invocations as JSON lines, to be replayed through a handler by laur.replay.
+
+A capture is one JSON object per line: the event of an invocation, when it started, how long it took
+and the message ids it reported in batchItemFailures.
+
+    {"capturedAt": 1672531200.123, "durationMs": 12.5, "batchItemFailures": [], "event": {"Records": [...]}}
+
+A Recorder wraps a handler and writes a sample of its invocations to a file, or to stdout, where each line
+is wrapped in {"laurCapture": ...} to be found in CloudWatch Logs. A log event is at most 256 KB,
+so a larger invocation is not captured to stdout.
+
+    capture = Recorder.from_env()
+    if capture is not None:
+        lambda_handler = capture.record(lambda_handler)
+
+This module is part of the layer, whereas laur.replay is a tool for development only.
+
+Environment variables: CAPTURE_PATH and CAPTURE_SAMPLE_RATE.
+
+For the limits of CloudWatch Logs, see https://docs.aws.amazon.com/AmazonCloudWatch/latest/logs/cloudwatch_limits_cwl.html
+"""
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from functools import wraps
+from typing import Callable, List, Optional
+
+from laur.codec import json_dumps
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_KEY = 'laurCapture'
+# The maximum size of a log event of CloudWatch Logs, less its 26 bytes of overhead.
+MAX_LOG_EVENT_BYTES = 256 * 1024 - 26
+
+
+class Recorder:
+    """
+    Write a sample of the invocations of a handler as captures, to path, or to stream, stdout by default.
+    Thread safe.
+    """
+
+    def __init__(self, path: Optional[str] = None, stream=None, sample_rate: float = 1.0,
+                 rng: Optional[random.Random] = None, clock=time):
+        self.path = path
+        self.stream = stream
+        self.sample_rate = sample_rate
+        self.rng = rng or random.Random()
+        self.clock = clock
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> Optional['Recorder']:
+        """
+        Capture CAPTURE_SAMPLE_RATE of invocations, 1 by default, to CAPTURE_PATH, or to stdout.
+        Return None if neither is set, or the rate is 0.
+        """
+        path = os.environ.get('CAPTURE_PATH') or None
+        rate = os.environ.get('CAPTURE_SAMPLE_RATE')
+        if path is None and not rate:
+            return None
+        sample_rate = float(rate) if rate else 1.0
+        if sample_rate <= 0:
+            return None
+        return cls(path=path, sample_rate=sample_rate, **kwargs)
+
+    def record(self, handler: Callable[[dict, object], dict]) -> Callable[[dict, object], dict]:
+        """
+        A decorator capturing the invocations of handler, whether it returns or raises.
+        """
+        @wraps(handler)
+        def wrapper(event, context):
+            if self.sample_rate < 1 and self.rng.random() >= self.sample_rate:
+                return handler(event, context)
+            captured_at = self.clock.time()
+            started_at = time.perf_counter()
+            capture = {'capturedAt': captured_at}
+            try:
+                response = handler(event, context)
+                capture['batchItemFailures'] = failures_of(response)
+                return response
+            except Exception as e:
+                capture['error'] = type(e).__name__
+                raise
+            finally:
+                capture['durationMs'] = round((time.perf_counter() - started_at) * 1000, 3)
+                capture['event'] = event
+                try:
+                    self.write(capture)
+                except Exception:
+                    # A capture is never worth failing an invocation for.
+                    logger.warning('Failed to write a capture', exc_info=True)
+
+        return wrapper
+
+    def write(self, capture: dict):
+        if self.path is not None:
+            line = json_dumps(capture) + '\n'
+            with self._lock:
+                if self._file is None:
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(line)
+                self._file.flush()
+            return
+        line = json_dumps({CAPTURE_KEY: capture}) + '\n'
+        if len(line.encode('utf-8')) > MAX_LOG_EVENT_BYTES:
+            logger.warning('Not capturing an invocation of %d bytes to the log', len(line))
+            return
+        with self._lock:
+            stream = self.stream or sys.stdout
+            stream.write(line)
+            stream.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def failures_of(response) -> List[str]:
+    """
+    The message ids of the batchItemFailures of a response.
+    """
+    if not isinstance(response, dict):
+        return []
+    return [failure['itemIdentifier'] for failure in response.get('batchItemFailures') or ()]
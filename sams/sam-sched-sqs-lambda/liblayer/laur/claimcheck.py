@@ -0,0 +1,287 @@
+"""
+Claim check of large SQS payloads: a body above a threshold is stored as a blob and only a pointer is sent.
+
+A producer stores the body, already encoded by laur.codec, in a blob store and sends instead
+a small JSON pointer with the message attribute ClaimCheck, the URI of the blob.
+A consumer reads the attribute without parsing the body, and fetches the blob only when the payload is accessed,
+so a record filtered out or skipped as a duplicate never downloads it.
+Blobs are deleted once their record has been processed successfully, and its writes to the sink flushed,
+or dropped by laur.filters, so a record reported in batchItemFailures or moved to a dead-letter queue keeps its blob.
+Add a lifecycle rule to the bucket as well, for blobs of messages that expired or were dead-lettered.
+
+    claim_check = ClaimCheck(S3BlobStore('my-bucket', prefix='claim-check/'))
+    producer = BatchProducer(queue_url, claim_check=claim_check)
+
+    def process_record(record):
+        process(SqsRecord(record, claim_check=claim_check).body)
+
+    processor = BatchProcessor(process_record, success_handler=claim_check.discard_blobs)
+
+For the claim check pattern, see https://www.enterpriseintegrationpatterns.com/patterns/messaging/StoreInLibrary.html
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Iterable, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CHECK = 'ClaimCheck'
+DEFAULT_THRESHOLD = 64 * 1024
+DEFAULT_CACHE_BYTES = 16 * 1024 * 1024
+
+
+class BlobStore(ABC):
+    """
+    A store of blobs by key. open returns a binary stream to read a blob without loading it all.
+    """
+
+    @abstractmethod
+    def uri(self, key: str) -> str:
+        """
+        The URI of a blob, sent in the ClaimCheck attribute.
+        """
+
+    @abstractmethod
+    def key_of(self, uri: str) -> str:
+        """
+        The key of a blob by its URI.
+        """
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        """
+        Store a blob, replacing any of the key.
+        """
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """
+        A binary stream of a blob, read as it is consumed.
+        """
+
+    @abstractmethod
+    def delete(self, key: str):
+        """
+        Delete a blob, if any.
+        """
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Blobs as files in a directory, for local runs and tests.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f'A key must be under the root: {key}')
+        return path
+
+    def uri(self, key: str) -> str:
+        return f'file://{self._path(key)}'
+
+    def key_of(self, uri: str) -> str:
+        return os.path.relpath(unquote(urlparse(uri).path), self.root)
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.claim-check.')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), 'rb')
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore(BlobStore):
+    """
+    Blobs as objects in a bucket of S3, or of a S3 compatible store given a client with its endpoint_url.
+    """
+
+    def __init__(self, bucket: str, prefix: str = '', client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from laur.runtime import get_client
+
+            self._client = get_client('s3')
+        return self._client
+
+    def uri(self, key: str) -> str:
+        return f's3://{self.bucket}/{self.prefix}{key}'
+
+    def key_of(self, uri: str) -> str:
+        parsed = urlparse(uri)
+        if parsed.netloc != self.bucket:
+            raise ValueError(f'{uri} is not in bucket {self.bucket}')
+        key = parsed.path.lstrip('/')
+        return key[len(self.prefix):] if key.startswith(self.prefix) else key
+
+    def put(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def open(self, key: str) -> BinaryIO:
+        # The body of GetObject is a stream read from the connection as it is consumed.
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body']
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+class BlobCache:
+    """
+    An LRU of blobs by URI up to max_bytes in total, reused across warm invocations.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._blobs: Dict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uri: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._blobs.get(uri)
+            if data is not None:
+                self._blobs.move_to_end(uri)
+            return data
+
+    def put(self, uri: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._blobs.pop(uri, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._blobs[uri] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._blobs.popitem(last=False)
+                self.size -= len(evicted)
+
+    def discard(self, uri: str):
+        with self._lock:
+            data = self._blobs.pop(uri, None)
+            if data is not None:
+                self.size -= len(data)
+
+
+def claim_check_uri(record: dict) -> Optional[str]:
+    """
+    The URI of the blob of a record of a Lambda event, or None if the body is the payload itself.
+    """
+    attribute = record.get('messageAttributes', {}).get(CLAIM_CHECK)
+    return None if attribute is None else attribute.get('stringValue')
+
+
+class ClaimCheck:
+    """
+    Offload bodies longer than threshold bytes to a blob store, and fetch them back.
+    """
+
+    def __init__(self, store: BlobStore, threshold: int = DEFAULT_THRESHOLD, cache_bytes: int = DEFAULT_CACHE_BYTES):
+        self.store = store
+        self.threshold = threshold
+        self.cache = BlobCache(cache_bytes)
+
+    @classmethod
+    def from_env(cls, **kwargs) -> Optional['ClaimCheck']:
+        """
+        Use the bucket CLAIM_CHECK_BUCKET with prefix CLAIM_CHECK_PREFIX, or the directory CLAIM_CHECK_DIR.
+        Return None if neither is set.
+        """
+        if os.environ.get('CLAIM_CHECK_BUCKET'):
+            store = S3BlobStore(os.environ['CLAIM_CHECK_BUCKET'], os.environ.get('CLAIM_CHECK_PREFIX', ''))
+        elif os.environ.get('CLAIM_CHECK_DIR'):
+            store = LocalBlobStore(os.environ['CLAIM_CHECK_DIR'])
+        else:
+            return None
+        if os.environ.get('CLAIM_CHECK_THRESHOLD'):
+            kwargs.setdefault('threshold', int(os.environ['CLAIM_CHECK_THRESHOLD']))
+        return cls(store, **kwargs)
+
+    # Producing
+
+    def offload(self, entry: dict) -> Tuple[dict, Optional[str]]:
+        """
+        Store the body of an entry of SendMessage(Batch) if it is too long,
+        and return the entry to send and the URI of the blob, or the entry as it is and None.
+        """
+        data = entry['MessageBody'].encode('utf-8')
+        if len(data) <= self.threshold:
+            return entry, None
+        key = uuid.uuid4().hex
+        self.store.put(key, data)
+        uri = self.store.uri(key)
+        attributes = dict(entry.get('MessageAttributes', {}))
+        attributes[CLAIM_CHECK] = {'DataType': 'String', 'StringValue': uri}
+        pointer = dict(entry, MessageAttributes=attributes)
+        pointer['MessageBody'] = json.dumps({CLAIM_CHECK: uri, 'size': len(data)})
+        return pointer, uri
+
+    def discard(self, uri: str):
+        """
+        Delete a blob, e.g. of a message that failed to be sent.
+        """
+        self.cache.discard(uri)
+        self.store.delete(self.store.key_of(uri))
+
+    # Consuming
+
+    def open(self, uri: str) -> BinaryIO:
+        """
+        Stream a blob. Nothing is cached, so use this for a payload read once from start to end.
+        """
+        return self.store.open(self.store.key_of(uri))
+
+    def read(self, uri: str) -> bytes:
+        """
+        Read a blob, through the cache.
+        """
+        data = self.cache.get(uri)
+        if data is None:
+            stream = self.open(uri)
+            try:
+                data = stream.read()
+            finally:
+                stream.close()
+            self.cache.put(uri, data)
+        return data
+
+    def discard_blobs(self, records: Iterable[dict]):
+        """
+        Delete the blobs of records processed successfully, as the success_handler of laur.batch.BatchProcessor,
+        which calls it once their writes to the sink are flushed, or of records dropped by an event filter.
+        Failing to delete a blob is only logged.
+        """
+        for record in records:
+            uri = claim_check_uri(record)
+            if uri is None:
+                continue
+            try:
+                self.discard(uri)
+            except Exception:
+                logger.warning('Failed to delete the blob %s', uri, exc_info=True)
+
@@ -0,0 +1,129 @@
+"""
+Codecs of SQS message bodies and attributes.
+
+A body goes through a pipeline: JSON, then optional compression, then base64 since a SQS body must be text.
+The compression is recorded in the message attribute ContentEncoding, so that a consumer knows how to decode it.
+
+    entry = encode_message({'RecordNumber': 1234}, compress_threshold=1024)
+    producer.send([dict(entry, MessageGroupId=group_id)])
+
+orjson is used for JSON and zstandard for zstd compression when they are installed.
+"""
+import base64
+import gzip
+import json
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CONTENT_ENCODING = 'ContentEncoding'
+DEFAULT_COMPRESS_THRESHOLD = 8192
+
+
+if orjson is not None:
+    def json_loads(data):
+        return orjson.loads(data)
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+else:
+    def json_loads(data):
+        return json.loads(data)
+
+    def json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    if zstandard is None:
+        raise RuntimeError('zstandard is not installed')
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    if zstandard is None:
+        raise RuntimeError('zstandard is not installed')
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# content encoding -> (compress, decompress)
+ENCODINGS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    'gzip': (lambda data: gzip.compress(data, compresslevel=6), gzip.decompress),
+    'zstd': (_zstd_compress, _zstd_decompress),
+}
+
+
+def register_encoding(name: str, compress: Callable[[bytes], bytes], decompress: Callable[[bytes], bytes]):
+    ENCODINGS[name] = (compress, decompress)
+
+
+def _encoding(name: str):
+    try:
+        return ENCODINGS[name]
+    except KeyError:
+        raise ValueError(f'Unknown content encoding: {name}') from None
+
+
+def encode_body(obj, compress_threshold: Optional[int] = DEFAULT_COMPRESS_THRESHOLD,
+                encoding: str = 'gzip') -> Tuple[str, Optional[str]]:
+    """
+    Encode an object into a body and its content encoding, which is None unless compressed.
+    A body longer than compress_threshold bytes is compressed if it gets shorter.
+    """
+    body = obj if isinstance(obj, str) else json_dumps(obj)
+    if compress_threshold is None:
+        return body, None
+    data = body.encode('utf-8')
+    if len(data) <= compress_threshold:
+        return body, None
+    compress, _ = _encoding(encoding)
+    compressed = base64.b64encode(compress(data)).decode('ascii')
+    if len(compressed) >= len(data):
+        return body, None
+    return compressed, encoding
+
+
+def decode_body(body: str, content_encoding: Optional[str] = None) -> str:
+    """
+    Decode a body into text, decompressing it if it has a content encoding.
+    """
+    if not content_encoding:
+        return body
+    _, decompress = _encoding(content_encoding)
+    return decompress(base64.b64decode(body)).decode('utf-8')
+
+
+def encode_message(obj, compress_threshold: Optional[int] = DEFAULT_COMPRESS_THRESHOLD, encoding: str = 'gzip',
+                   message_attributes: Optional[dict] = None) -> dict:
+    """
+    Encode an object into the parameters of SendMessage or an entry of SendMessageBatch.
+    """
+    body, content_encoding = encode_body(obj, compress_threshold, encoding)
+    message = {'MessageBody': body}
+    attributes = dict(message_attributes or {})
+    if content_encoding is not None:
+        attributes[CONTENT_ENCODING] = {'DataType': 'String', 'StringValue': content_encoding}
+    if attributes:
+        message['MessageAttributes'] = attributes
+    return message
+
+
+def decode_attribute(attribute: dict):
+    """
+    Decode a message attribute of a Lambda event: a Binary into bytes, a Number into int or float and others into str.
+    """
+    data_type = attribute.get('dataType', '')
+    if data_type.startswith('Binary'):
+        return base64.b64decode(attribute['binaryValue'])
+    value = attribute.get('stringValue')
+    if data_type.startswith('Number') and value is not None:
+        return float(value) if any(c in value for c in '.eE') else int(value)
+    return value
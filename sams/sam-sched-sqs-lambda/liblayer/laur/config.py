@@ -0,0 +1,292 @@
+"""
+Runtime configuration, e.g. feature flags, endpoints and thresholds, cached across warm invocations.
+
+Keys are resolved by APP_ID and APP_ENV: the key `features/new-parser` is looked up as
+/APP_ID/APP_ENV/features/new-parser, then as /APP_ID/default/features/new-parser, shared by all environments.
+ * All parameters under both paths are fetched at once, a few calls per refresh instead of one per key,
+ * values are cached for ttl_seconds, after which the next access refreshes them in a background thread
+   while still serving the cached values, so that only the first access of an execution environment waits
+   for the backend,
+ * when the backend fails the last known values are kept, and a refresh is tried again after retry_seconds.
+   If the first load fails, every key has its default until a refresh succeeds.
+
+    config = Config.from_env()
+
+    def process_message(message):
+        if config.get_bool('features/new-parser'):
+            ...
+
+Backends: SsmBackend for SSM Parameter Store, and FileBackend, a JSON file standing in for it locally.
+
+    python -m laur.config --file config.json --app-id tryaws --app-env dev
+
+Environment variables: APP_ID, APP_ENV, CONFIG_BACKEND (ssm), CONFIG_FILE, CONFIG_TTL_SECONDS
+and CONFIG_RETRY_SECONDS.
+
+For GetParametersByPath, see https://docs.aws.amazon.com/systems-manager/latest/APIReference/API_GetParametersByPath.html
+"""
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENV = 'default'
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_RETRY_SECONDS = 30
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'off', '')
+
+
+def paths_of(app_id: str, app_env: str) -> List[str]:
+    """
+    The paths a key is looked up under, the most specific first.
+    """
+    return [f'/{app_id}/{app_env}', f'/{app_id}/{DEFAULT_ENV}']
+
+
+class ConfigBackend(ABC):
+    """
+    A store of string parameters named like paths.
+    """
+
+    @abstractmethod
+    def load(self, path: str) -> Dict[str, str]:
+        """
+        All parameters under path, recursively, by their names relative to path.
+        """
+
+
+class SsmBackend(ConfigBackend):
+    """
+    Parameters of SSM Parameter Store. SecureString parameters are decrypted, StringList ones are left comma separated.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from laur.runtime import get_client
+
+            self._client = get_client('ssm')
+        return self._client
+
+    def load(self, path: str) -> Dict[str, str]:
+        values = {}
+        kwargs = {'Path': path, 'Recursive': True, 'WithDecryption': True, 'MaxResults': 10}
+        while True:
+            response = self.client.get_parameters_by_path(**kwargs)
+            for parameter in response.get('Parameters', ()):
+                values[parameter['Name'][len(path):].lstrip('/')] = parameter['Value']
+            if not response.get('NextToken'):
+                return values
+            kwargs['NextToken'] = response['NextToken']
+
+
+def _to_string(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return json.dumps(value)
+
+
+def _flatten(document: dict, prefix: str, values: Dict[str, str]):
+    for name, value in document.items():
+        path = f'{prefix}/{name.strip("/")}'
+        if isinstance(value, dict):
+            _flatten(value, path, values)
+        else:
+            values[path] = _to_string(value)
+
+
+class FileBackend(ConfigBackend):
+    """
+    A JSON file standing in for Parameter Store, read again on every load so that edits show up after the TTL.
+    Nested objects are joined into paths, and values other than strings are stored as JSON.
+
+        {"tryaws": {"default": {"features": {"new-parser": false}}, "dev": {"features/new-parser": true}}}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self, path: str) -> Dict[str, str]:
+        with open(self.path) as f:
+            values: Dict[str, str] = {}
+            _flatten(json.load(f), '', values)
+        prefix = path.rstrip('/') + '/'
+        return {name[len(prefix):]: value for name, value in values.items() if name.startswith(prefix)}
+
+
+class Config:
+    """
+    Values of the keys under the paths of app_id and app_env in backend, cached for ttl_seconds.
+    Without a backend every key has its default.
+    """
+
+    def __init__(self, backend: Optional[ConfigBackend] = None, app_id: str = 'app', app_env: str = 'dev',
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS, retry_seconds: float = DEFAULT_RETRY_SECONDS, clock=time):
+        self.backend = backend
+        self.paths = paths_of(app_id, app_env)
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self.loaded_at: Optional[float] = None
+        self.loads = 0
+        self.failures = 0
+        self._values: Optional[Dict[str, str]] = None if backend is not None else {}
+        self._expires_at = 0.0
+        self._refreshing: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._first_load = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> 'Config':
+        """
+        The config of APP_ID and APP_ENV in Parameter Store if CONFIG_BACKEND is ssm, or in the file CONFIG_FILE.
+        Without either, every key has its default.
+        """
+        if os.environ.get('CONFIG_BACKEND') == 'ssm':
+            kwargs.setdefault('backend', SsmBackend())
+        elif os.environ.get('CONFIG_FILE'):
+            kwargs.setdefault('backend', FileBackend(os.environ['CONFIG_FILE']))
+        for name, env, convert in (('app_id', 'APP_ID', str),
+                                   ('app_env', 'APP_ENV', str),
+                                   ('ttl_seconds', 'CONFIG_TTL_SECONDS', float),
+                                   ('retry_seconds', 'CONFIG_RETRY_SECONDS', float)):
+            if os.environ.get(env):
+                kwargs.setdefault(name, convert(os.environ[env]))
+        return cls(**kwargs)
+
+    def refresh(self) -> bool:
+        """
+        Load the values from the backend now. Keep the last known values and return False if it fails.
+        """
+        try:
+            loaded = [self.backend.load(path) for path in self.paths]
+        except Exception:
+            self.failures += 1
+            logger.warning('Failed to load the config from %s, keeping the last known values', self.paths,
+                           exc_info=True)
+            with self._lock:
+                if self._values is None:
+                    self._values = {}
+                self._expires_at = self.clock.monotonic() + self.retry_seconds
+            return False
+        values: Dict[str, str] = {}
+        for entries in reversed(loaded):
+            values.update(entries)
+        with self._lock:
+            self._values = values
+            self._expires_at = self.clock.monotonic() + self.ttl_seconds
+            self.loaded_at = self.clock.time()
+            self.loads += 1
+        return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing is not None:
+                return
+            # Lambda freezes a background thread between invocations, so a refresh may finish in the next one.
+            self._refreshing = threading.Thread(target=self._run_refresh, name='laur-config', daemon=True)
+            self._refreshing.start()
+
+    def _run_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = None
+
+    def join(self, timeout: Optional[float] = None):
+        """
+        Wait for a refresh running in the background, if any.
+        """
+        thread = self._refreshing
+        if thread is not None:
+            thread.join(timeout)
+
+    def values(self) -> Dict[str, str]:
+        """
+        The resolved values, loaded on the first call and refreshed in the background once expired.
+        """
+        values = self._values
+        if values is None:
+            # Workers of laur.batch wait for a single first load.
+            with self._first_load:
+                if self._values is None:
+                    self.refresh()
+            values = self._values
+        elif self.backend is not None and self.clock.monotonic() >= self._expires_at:
+            self._refresh_in_background()
+        return values
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return self.values().get(key.strip('/'), default)
+
+    def _convert(self, key: str, default, convert: Callable[[str], Any]):
+        value = self.get(key)
+        if value is None:
+            return default
+        try:
+            return convert(value)
+        except ValueError:
+            logger.warning('Invalid value of the config key %s: %r, using the default %r', key, value, default)
+            return default
+
+    def get_int(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        return self._convert(key, default, int)
+
+    def get_float(self, key: str, default: Optional[float] = None) -> Optional[float]:
+        return self._convert(key, default, float)
+
+    def get_bool(self, key: str, default: bool = False) -> bool:
+        def convert(value: str) -> bool:
+            value = value.strip().lower()
+            if value in TRUE_VALUES:
+                return True
+            if value in FALSE_VALUES:
+                return False
+            raise ValueError(value)
+
+        return self._convert(key, default, convert)
+
+    def get_list(self, key: str, default: Optional[List[str]] = None) -> Optional[List[str]]:
+        """
+        A comma separated value, e.g. of a StringList parameter.
+        """
+        return self._convert(key, default, lambda value: [item.strip() for item in value.split(',') if item.strip()])
+
+    def get_json(self, key: str, default: Any = None) -> Any:
+        return self._convert(key, default, json.loads)
+
+
+def main(argv=None) -> int:
+    """
+    Print the config of an application and environment as resolved by laur.config.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m laur.config', description=main.__doc__)
+    parser.add_argument('--file', help='A JSON file of parameters instead of Parameter Store')
+    parser.add_argument('--app-id', default=os.environ.get('APP_ID', 'app'))
+    parser.add_argument('--app-env', default=os.environ.get('APP_ENV', 'dev'))
+    args = parser.parse_args(argv)
+
+    backend = FileBackend(args.file) if args.file else SsmBackend()
+    config = Config(backend, app_id=args.app_id, app_env=args.app_env)
+    if not config.refresh():
+        return 1
+    print(json.dumps(config.values(), indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,204 @@
+"""
+Drain all messages of a queue with concurrent receivers.
+
+Receivers long-poll the queue and delete what they receive with DeleteMessageBatch.
+The queue is considered empty when ApproximateNumberOfMessages, ...NotVisible and ...Delayed are all 0
+for consecutive checks, since the approximate numbers may lag behind.
+
+Messages that another consumer holds in flight cannot be deleted until their visibility timeout expires.
+A FIFO group whose message is in flight is locked, so nothing more of it is received until then.
+The drainer cannot release those messages early: ChangeMessageVisibility takes the receipt handle of the receive
+that made a message invisible, and only the consumer that received it has it. So a drain started while messages
+are in flight waits their visibility timeout out, which a consumer that stops should avoid by releasing
+the messages it holds.
+Receivers never hold a group lock longer than needed themselves: a message they received but could not delete,
+whether some entries of DeleteMessageBatch failed or the call raised, is released by setting its visibility timeout
+to 0 instead of waiting it out.
+
+    result = drain_queue(queue_url)
+
+For the approximate numbers of messages,
+see https://docs.aws.amazon.com/AWSSimpleQueueService/latest/SQSDeveloperGuide/sqs-available-cloudwatch-metrics.html
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECEIVERS = 4
+DEFAULT_WAIT_TIME_SECONDS = 1
+DEFAULT_TIMEOUT = 120
+EMPTY_CHECKS = 2
+COUNT_ATTRIBUTE_NAMES = [
+    'ApproximateNumberOfMessages',
+    'ApproximateNumberOfMessagesNotVisible',
+    'ApproximateNumberOfMessagesDelayed',
+]
+
+
+class DrainResult:
+    def __init__(self):
+        self.deleted = 0
+        self.released = 0
+        self.receives = 0
+        self.empty = False
+        self._lock = threading.Lock()
+
+    def add(self, deleted: int = 0, released: int = 0, receives: int = 0):
+        with self._lock:
+            self.deleted += deleted
+            self.released += released
+            self.receives += receives
+
+    def __repr__(self):
+        return f'<DrainResult deleted={self.deleted} released={self.released} empty={self.empty}>'
+
+
+class QueueDrainer:
+    """
+    Drain a queue. clock is for tests and must have time() and sleep().
+    """
+
+    def __init__(self, queue_url: str, client=None, receivers: int = DEFAULT_RECEIVERS,
+                 wait_time_seconds: int = DEFAULT_WAIT_TIME_SECONDS, timeout: float = DEFAULT_TIMEOUT, clock=time):
+        if receivers < 1:
+            raise ValueError(f'receivers must be 1 or more: {receivers}')
+        self.queue_url = queue_url
+        self.receivers = receivers
+        self.wait_time_seconds = wait_time_seconds
+        self.timeout = timeout
+        self.clock = clock
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from laur.runtime import get_client
+
+            self._client = get_client('sqs')
+        return self._client
+
+    def counts(self) -> dict:
+        """
+        The approximate numbers of messages by attribute name.
+        """
+        response = self.client.get_queue_attributes(QueueUrl=self.queue_url, AttributeNames=COUNT_ATTRIBUTE_NAMES)
+        attributes = response.get('Attributes', {})
+        return {name: int(attributes.get(name, 0)) for name in COUNT_ATTRIBUTE_NAMES}
+
+    def _release(self, entries: list) -> int:
+        """
+        Make messages visible again now, releasing the locks of their groups. Return how many were released.
+        """
+        releases = [{'Id': entry['Id'], 'ReceiptHandle': entry['ReceiptHandle'], 'VisibilityTimeout': 0}
+                    for entry in entries]
+        try:
+            response = self.client.change_message_visibility_batch(QueueUrl=self.queue_url, Entries=releases)
+        except Exception:
+            logger.warning('Failed to release %d messages, they are visible again after the visibility timeout',
+                           len(releases), exc_info=True)
+            return 0
+        return len(response.get('Successful', releases))
+
+    def _delete(self, messages: list, result: DrainResult):
+        entries = [{'Id': str(idx), 'ReceiptHandle': m['ReceiptHandle']} for idx, m in enumerate(messages)]
+        try:
+            response = self.client.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+        except Exception:
+            # Release the group locks now rather than after the visibility timeout.
+            logger.warning('Failed to delete %d messages, releasing them', len(entries), exc_info=True)
+            result.add(released=self._release(entries))
+            return
+        failed = response.get('Failed', [])
+        released = 0
+        if failed:
+            released = self._release([entries[int(f['Id'])] for f in failed])
+            logger.warning('Failed to delete %d messages, released %d of them: %s', len(failed), released, failed)
+        result.add(deleted=len(response.get('Successful', [])), released=released)
+
+    def _receive_until_idle(self, deadline: float, stop: threading.Event, result: DrainResult):
+        while not stop.is_set() and self.clock.time() < deadline:
+            response = self.client.receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=10,
+                WaitTimeSeconds=self.wait_time_seconds,
+            )
+            result.add(receives=1)
+            messages = response.get('Messages', [])
+            if not messages:
+                return
+            self._delete(messages, result)
+
+    def drain(self, executor: Optional[ThreadPoolExecutor] = None) -> DrainResult:
+        """
+        Receive and delete messages until the queue is empty or the timeout passes.
+        """
+        result = DrainResult()
+        deadline = self.clock.time() + self.timeout
+        stop = threading.Event()
+        own_executor = executor is None and self.receivers > 1
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=self.receivers, thread_name_prefix='laur-drain')
+        try:
+            empty_checks = 0
+            while self.clock.time() < deadline:
+                if executor is None:
+                    self._receive_until_idle(deadline, stop, result)
+                else:
+                    futures = [executor.submit(self._receive_until_idle, deadline, stop, result)
+                               for _ in range(self.receivers)]
+                    for future in futures:
+                        future.result()
+                counts = self.counts()
+                if not any(counts.values()):
+                    empty_checks += 1
+                    if empty_checks >= EMPTY_CHECKS:
+                        result.empty = True
+                        break
+                    continue
+                empty_checks = 0
+                if not counts['ApproximateNumberOfMessages']:
+                    # Only messages in flight or delayed remain, wait until some of them become visible.
+                    logger.info('Waiting for messages in flight or delayed: %s', counts)
+                    self.clock.sleep(min(self.wait_time_seconds or 1, max(deadline - self.clock.time(), 0)))
+        finally:
+            stop.set()
+            if own_executor:
+                executor.shutdown()
+        logger.info('Drained %s: %s', self.queue_url, result)
+        return result
+
+
+def drain_queue(queue_url: str, client=None, receivers: int = DEFAULT_RECEIVERS, timeout: float = DEFAULT_TIMEOUT,
+                **kwargs) -> DrainResult:
+    """
+    Drain a queue and return the result.
+    """
+    return QueueDrainer(queue_url, client=client, receivers=receivers, timeout=timeout, **kwargs).drain()
+
+
+def main(argv=None):
+    """
+    Drain a queue from the command line, e.g. to clean up a queue after an incident.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m laur.drain', description=main.__doc__)
+    parser.add_argument('queue_url')
+    parser.add_argument('--receivers', type=int, default=DEFAULT_RECEIVERS)
+    parser.add_argument('--wait-time-seconds', type=int, default=DEFAULT_WAIT_TIME_SECONDS)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    result = drain_queue(args.queue_url, receivers=args.receivers, timeout=args.timeout,
+                         wait_time_seconds=args.wait_time_seconds)
+    print(f'deleted={result.deleted} released={result.released} empty={result.empty}')
+    return 0 if result.empty else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
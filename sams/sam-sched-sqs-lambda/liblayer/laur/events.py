@@ -0,0 +1,128 @@
+"""
+Synthetic SQS events in the shape Lambda invokes a function with, for tests, benchmarks and simulations.
+
+    event = make_sqs_event(batch_size=10, body_size=1024, groups=3)
+"""
+import base64
+import hashlib
+import json
+import random
+import time
+import uuid
+from typing import Optional
+
+DEFAULT_QUEUE_ARN = 'arn:aws:sqs:us-west-2:123456789012:my-queue'
+SENDER_ID = 'AIDAIENQZJOLO23YVJ4VO'
+
+
+def make_body(size: int, rng: random.Random, record_number: int = 0) -> str:
+    """
+    A JSON body of about size bytes.
+    """
+    body = {
+        'RecordNumber': record_number,
+        'TimeStamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'RequestCode': 'AAAA',
+    }
+    padding = size - len(json.dumps(body)) - len(', "Payload": ""')
+    if padding > 0:
+        body['Payload'] = ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=padding))
+    return json.dumps(body)
+
+
+def make_sqs_record(body: str, group_id: Optional[str] = None, queue_arn: str = DEFAULT_QUEUE_ARN,
+                    receive_count: int = 1, sent_timestamp: Optional[int] = None, message_id: Optional[str] = None,
+                    message_attributes: Optional[dict] = None) -> dict:
+    """
+    A record of a SQS event. A group_id makes it a record of a FIFO queue.
+    """
+    sent_timestamp = int(time.time() * 1000) if sent_timestamp is None else sent_timestamp
+    attributes = {
+        'ApproximateReceiveCount': str(receive_count),
+        'SentTimestamp': str(sent_timestamp),
+        'SenderId': SENDER_ID,
+        'ApproximateFirstReceiveTimestamp': str(sent_timestamp + 2),
+    }
+    if group_id is not None:
+        attributes['MessageGroupId'] = group_id
+        attributes['MessageDeduplicationId'] = hashlib.sha256(body.encode('utf-8')).hexdigest()
+        attributes['SequenceNumber'] = str(sent_timestamp * 1000)
+    return {
+        'messageId': message_id or str(uuid.uuid4()),
+        'receiptHandle': uuid.uuid4().hex,
+        'body': body,
+        'attributes': attributes,
+        'messageAttributes': message_attributes or {},
+        'md5OfBody': hashlib.md5(body.encode('utf-8')).hexdigest(),
+        'eventSource': 'aws:sqs',
+        'eventSourceARN': queue_arn,
+        'awsRegion': queue_arn.split(':')[3],
+    }
+
+
+def make_sqs_event(batch_size: int = 1, body_size: int = 128, groups: Optional[int] = None,
+                   seed: Optional[int] = None, queue_arn: Optional[str] = None) -> dict:
+    """
+    A SQS event of batch_size records. With groups, records of a FIFO queue are spread round robin over that many groups.
+    """
+    rng = random.Random(seed)
+    if queue_arn is None:
+        queue_arn = DEFAULT_QUEUE_ARN + ('.fifo' if groups else '')
+    records = []
+    for idx in range(batch_size):
+        group_id = f'message-group-id-{idx % groups}' if groups else None
+        records.append(make_sqs_record(make_body(body_size, rng, idx), group_id=group_id, queue_arn=queue_arn))
+    return {'Records': records}
+
+
+def _record_attribute(attribute: dict) -> dict:
+    converted = {
+        'stringListValues': [],
+        'binaryListValues': [],
+        'dataType': attribute['DataType'],
+    }
+    if 'StringValue' in attribute:
+        converted['stringValue'] = attribute['StringValue']
+    if 'BinaryValue' in attribute:
+        value = attribute['BinaryValue']
+        converted['binaryValue'] = base64.b64encode(value).decode() if isinstance(value, bytes) else value
+    return converted
+
+
+def record_from_message(message: dict, queue_arn: str) -> dict:
+    """
+    The record Lambda makes of a message of a ReceiveMessage response with all attributes.
+    """
+    return {
+        'messageId': message['MessageId'],
+        'receiptHandle': message['ReceiptHandle'],
+        'body': message['Body'],
+        'attributes': dict(message.get('Attributes', {})),
+        'messageAttributes': {name: _record_attribute(attribute)
+                              for name, attribute in message.get('MessageAttributes', {}).items()},
+        'md5OfBody': message['MD5OfBody'],
+        'eventSource': 'aws:sqs',
+        'eventSourceARN': queue_arn,
+        'awsRegion': queue_arn.split(':')[3],
+    }
+
+
+class LambdaContext:
+    """
+    A stand-in of the context object of a Lambda invocation, whose deadline is timeout_ms after it is created.
+    """
+
+    def __init__(self, timeout_ms: int = 10000, function_name: str = 'hello-world', memory_limit_in_mb: int = 128,
+                 clock=time):
+        self.aws_request_id = str(uuid.uuid4())
+        self.function_name = function_name
+        self.function_version = '$LATEST'
+        self.memory_limit_in_mb = memory_limit_in_mb
+        self.invoked_function_arn = f'arn:aws:lambda:us-west-2:123456789012:function:{function_name}'
+        self.log_group_name = f'/aws/lambda/{function_name}'
+        self.log_stream_name = uuid.uuid4().hex
+        self._clock = clock
+        self._deadline = clock.time() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(int((self._deadline - self._clock.time()) * 1000), 0)
@@ -0,0 +1,366 @@
+"""
+A local stand-in for the SQS event source mapping of Lambda,
+to size BatchSize, MaximumBatchingWindowInSeconds and ScalingConfig.MaximumConcurrency before deploying them.
+
+Messages arrive at a LocalSqs queue at a given rate in virtual time. Like the pollers of Lambda, the simulator
+ * assembles a batch until it has BatchSize records, 6 MB of payload, or the batching window has passed,
+ * invokes the handler, at most MaximumConcurrency at once, and
+ * deletes the records the handler processed. Records reported in batchItemFailures, and all records of an invocation
+   that raised or timed out, are left to be received again after the visibility timeout.
+A FIFO message group whose messages are in flight is locked by the queue, so a FIFO queue is processed
+by at most as many concurrent invocations as it has active groups.
+
+The handler is called directly. An invocation lasts as long as the handler really ran, or a modeled duration,
+so that minutes of traffic are simulated in seconds.
+
+    python -m laur.eventsource lambda_handlers.hello_world.app:lambda_handler --rate 200 --seconds 60 --groups 20
+
+For the scaling behaviour, see https://docs.aws.amazon.com/lambda/latest/dg/services-sqs-scaling.html
+"""
+import heapq
+import importlib
+import json
+import logging
+import random
+import time
+from typing import Callable, List, Optional
+
+from laur.events import LambdaContext, make_body, record_from_message
+from laur.localsqs import LocalSqs, VirtualClock
+
+logger = logging.getLogger(__name__)
+
+# The defaults are those of template.yaml.
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_MAXIMUM_BATCHING_WINDOW = 0
+DEFAULT_MAXIMUM_CONCURRENCY = 100
+DEFAULT_FUNCTION_TIMEOUT = 10
+DEFAULT_VISIBILITY_TIMEOUT = 10
+DEFAULT_POLL_INTERVAL = 0.1
+MAX_RECEIVE_ENTRIES = 10
+MAX_PAYLOAD_BYTES = 6 * 1024 * 1024
+
+_ARRIVAL, _COMPLETION, _POLL = 'arrival', 'completion', 'poll'
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+class SimulationReport:
+    """
+    What happened in a simulation. Times are in virtual seconds.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.processed = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.remaining = 0
+        self.invocations = 0
+        self.errors = 0
+        self.batch_sizes: List[int] = []
+        self.queue_ages: List[float] = []
+        self.max_concurrency = 0
+        self.concurrency_seconds = 0.0
+        self.saturated_seconds = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def expired(self) -> int:
+        """
+        Messages dropped beyond the retention period.
+        """
+        return max(self.sent - self.processed - self.dead_lettered - self.remaining, 0)
+
+    @property
+    def throughput(self) -> float:
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mean_concurrency(self) -> float:
+        return self.concurrency_seconds / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'sent': self.sent,
+            'processed': self.processed,
+            'failed': self.failed,
+            'deadLettered': self.dead_lettered,
+            'expired': self.expired,
+            'remaining': self.remaining,
+            'invocations': self.invocations,
+            'errors': self.errors,
+            'meanBatchSize': round(sum(self.batch_sizes) / len(self.batch_sizes), 3) if self.batch_sizes else 0,
+            'elapsedSeconds': round(self.elapsed, 3),
+            'throughputPerSecond': round(self.throughput, 3),
+            'queueAgeSeconds': {
+                'p50': _percentile(self.queue_ages, 50),
+                'p99': _percentile(self.queue_ages, 99),
+                'max': max(self.queue_ages) if self.queue_ages else None,
+            },
+            'maxConcurrency': self.max_concurrency,
+            'meanConcurrency': round(self.mean_concurrency, 3),
+            'saturatedSeconds': round(self.saturated_seconds, 3),
+        }
+
+
+class _Invocation:
+    __slots__ = ('messages', 'failed_ids')
+
+    def __init__(self, messages: List[dict], failed_ids: set):
+        self.messages = messages
+        self.failed_ids = failed_ids
+
+
+class EventSourceMappingSimulator:
+    """
+    Simulate an event source mapping from a queue to a handler.
+
+    duration models how long an invocation takes from its records, instead of measuring the handler.
+    max_receive_count adds a dead-letter queue with the RedrivePolicy of that maxReceiveCount.
+    """
+
+    def __init__(self, handler: Callable[[dict, object], Optional[dict]], fifo: bool = True,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 maximum_batching_window: float = DEFAULT_MAXIMUM_BATCHING_WINDOW,
+                 maximum_concurrency: int = DEFAULT_MAXIMUM_CONCURRENCY,
+                 function_timeout: float = DEFAULT_FUNCTION_TIMEOUT,
+                 visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT,
+                 message_retention_period: Optional[int] = None, max_receive_count: Optional[int] = None,
+                 duration: Optional[Callable[[List[dict]], float]] = None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, clock: Optional[VirtualClock] = None,
+                 backend: Optional[LocalSqs] = None):
+        self.handler = handler
+        self.fifo = fifo
+        self.batch_size = batch_size
+        self.maximum_batching_window = maximum_batching_window
+        self.maximum_concurrency = maximum_concurrency
+        self.function_timeout = function_timeout
+        self.duration = duration
+        self.poll_interval = poll_interval
+        self.clock = clock or VirtualClock()
+        self.backend = backend or LocalSqs(clock=self.clock)
+
+        name = 'simulated-queue' + ('.fifo' if fifo else '')
+        attributes = {'VisibilityTimeout': str(visibility_timeout)}
+        if fifo:
+            attributes['FifoQueue'] = 'true'
+        if message_retention_period is not None:
+            attributes['MessageRetentionPeriod'] = str(message_retention_period)
+        self.dead_letter_queue_url = None
+        if max_receive_count is not None:
+            dead_letter_name = 'simulated-dead-letter-queue' + ('.fifo' if fifo else '')
+            self.dead_letter_queue_url = self.backend.create_queue(
+                QueueName=dead_letter_name, Attributes={'FifoQueue': 'true'} if fifo else {})['QueueUrl']
+            attributes['RedrivePolicy'] = json.dumps({
+                'deadLetterTargetArn': self.backend.queue_arn(dead_letter_name),
+                'maxReceiveCount': str(max_receive_count),
+            })
+        self.queue_url = self.backend.create_queue(QueueName=name, Attributes=attributes)['QueueUrl']
+        self.queue_arn = self.backend.queue_arn(name)
+
+        self._events = []
+        self._sequence = 0
+        self._running = 0
+        self._gathering: List[dict] = []
+        self._gathering_bytes = 0
+        self._gathering_since = 0.0
+
+    def _schedule(self, at: float, kind: str, payload=None):
+        self._sequence += 1
+        heapq.heappush(self._events, (at, self._sequence, kind, payload))
+
+    def _count(self, queue_url: str) -> int:
+        attributes = self.backend.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['All'])['Attributes']
+        return sum(int(attributes[name]) for name in (
+            'ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible', 'ApproximateNumberOfMessagesDelayed'))
+
+    # Polling
+
+    def _fill(self):
+        while len(self._gathering) < self.batch_size and self._gathering_bytes < MAX_PAYLOAD_BYTES:
+            received = self.backend.receive_message(
+                QueueUrl=self.queue_url, AttributeNames=['All'], MessageAttributeNames=['All'], WaitTimeSeconds=0,
+                MaxNumberOfMessages=min(MAX_RECEIVE_ENTRIES, self.batch_size - len(self._gathering)),
+            ).get('Messages', [])
+            if not received:
+                return
+            if not self._gathering:
+                self._gathering_since = self.clock.time()
+            self._gathering.extend(received)
+            self._gathering_bytes += sum(len(message['Body'].encode('utf-8')) for message in received)
+
+    def _dispatch(self, report: SimulationReport):
+        while self._running < self.maximum_concurrency:
+            self._fill()
+            if not self._gathering:
+                return
+            full = len(self._gathering) >= self.batch_size or self._gathering_bytes >= MAX_PAYLOAD_BYTES
+            if not full and self.clock.time() - self._gathering_since < self.maximum_batching_window:
+                return
+            batch, self._gathering, self._gathering_bytes = self._gathering, [], 0
+            self._invoke(batch, report)
+
+    # Invoking
+
+    def _invoke(self, messages: List[dict], report: SimulationReport):
+        now = self.clock.time()
+        records = [record_from_message(message, self.queue_arn) for message in messages]
+        report.invocations += 1
+        report.batch_sizes.append(len(records))
+        report.queue_ages.extend(now - int(record['attributes']['SentTimestamp']) / 1000 for record in records)
+
+        message_ids = {record['messageId'] for record in records}
+        started_at = time.perf_counter()
+        try:
+            response = self.handler({'Records': records}, LambdaContext(int(self.function_timeout * 1000),
+                                                                       clock=self.clock))
+        except Exception:
+            logger.exception('The invocation failed')
+            report.errors += 1
+            failed_ids = message_ids
+        else:
+            failures = (response or {}).get('batchItemFailures', []) if isinstance(response, dict) else []
+            failed_ids = {failure.get('itemIdentifier') for failure in failures}
+            if not failed_ids <= message_ids:
+                # An unknown itemIdentifier fails the whole batch.
+                failed_ids = message_ids
+        elapsed = time.perf_counter() - started_at
+        duration = self.duration(records) if self.duration is not None else elapsed
+        if duration >= self.function_timeout:
+            report.errors += 1
+            failed_ids = message_ids
+            duration = self.function_timeout
+
+        self._running += 1
+        report.max_concurrency = max(report.max_concurrency, self._running)
+        self._schedule(now + duration, _COMPLETION, _Invocation(messages, failed_ids))
+
+    def _complete(self, invocation: _Invocation, report: SimulationReport):
+        self._running -= 1
+        report.failed += len(invocation.failed_ids)
+        succeeded = [message for message in invocation.messages if message['MessageId'] not in invocation.failed_ids]
+        for start in range(0, len(succeeded), MAX_RECEIVE_ENTRIES):
+            entries = [{'Id': str(idx), 'ReceiptHandle': message['ReceiptHandle']}
+                       for idx, message in enumerate(succeeded[start:start + MAX_RECEIVE_ENTRIES])]
+            response = self.backend.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            report.processed += len(response['Successful'])
+
+    # Running
+
+    def run(self, rate: float, seconds: float, groups: int = 10, body_size: int = 128, seed: Optional[int] = None,
+            timeout: Optional[float] = None) -> SimulationReport:
+        """
+        Send messages at rate per second for seconds with exponentially distributed gaps, and process them.
+        FIFO messages are spread round robin over groups.
+        The simulation ends when the queue is empty, or timeout seconds after the last arrival.
+        """
+        rng = random.Random(seed)
+        report = SimulationReport()
+        started_at = self.clock.time()
+        last_arrival_at = started_at + seconds
+        ends_at = last_arrival_at + (timeout if timeout is not None else max(seconds, 900))
+        self._schedule(started_at + rng.expovariate(rate), _ARRIVAL)
+        self._schedule(started_at, _POLL)
+
+        now = started_at
+        while self._events:
+            at, _, kind, payload = heapq.heappop(self._events)
+            if at > ends_at:
+                break
+            report.concurrency_seconds += self._running * (at - now)
+            if self._running >= self.maximum_concurrency:
+                report.saturated_seconds += at - now
+            self.clock.advance(at - now)
+            now = at
+
+            if kind == _ARRIVAL:
+                self._send(report.sent, groups, body_size, rng)
+                report.sent += 1
+                next_at = at + rng.expovariate(rate)
+                if next_at <= last_arrival_at:
+                    self._schedule(next_at, _ARRIVAL)
+            elif kind == _COMPLETION:
+                self._complete(payload, report)
+            self._dispatch(report)
+            if kind == _POLL:
+                if (at >= last_arrival_at and not self._running and not self._gathering
+                        and not self._count(self.queue_url)):
+                    break
+                self._schedule(at + self.poll_interval, _POLL)
+
+        report.elapsed = now - started_at
+        report.remaining = self._count(self.queue_url) + len(self._gathering)
+        if self.dead_letter_queue_url is not None:
+            report.dead_lettered = self._count(self.dead_letter_queue_url)
+        return report
+
+    def _send(self, number: int, groups: int, body_size: int, rng: random.Random):
+        kwargs = {}
+        if self.fifo:
+            kwargs = {'MessageGroupId': f'message-group-id-{number % groups}', 'MessageDeduplicationId': str(number)}
+        self.backend.send_message(QueueUrl=self.queue_url, MessageBody=make_body(body_size, rng, number), **kwargs)
+
+
+def load_handler(spec: str) -> Callable:
+    """
+    Import a handler by its 'module:function' path.
+    """
+    module_name, _, function_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), function_name or 'lambda_handler')
+
+
+def main(argv=None):
+    """
+    Simulate an event source mapping of a SQS queue to a handler and print the report as JSON.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m laur.eventsource', description=main.__doc__)
+    parser.add_argument('handler', help="'module:function', e.g. lambda_handlers.hello_world.app:lambda_handler")
+    parser.add_argument('--rate', type=float, required=True, help='Messages per second')
+    parser.add_argument('--seconds', type=float, default=60, help='How long messages arrive')
+    parser.add_argument('--groups', type=int, default=10, help='Message groups of a FIFO queue. 0 for a standard queue')
+    parser.add_argument('--body-size', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--maximum-batching-window', type=float, default=DEFAULT_MAXIMUM_BATCHING_WINDOW)
+    parser.add_argument('--maximum-concurrency', type=int, default=DEFAULT_MAXIMUM_CONCURRENCY)
+    parser.add_argument('--function-timeout', type=float, default=DEFAULT_FUNCTION_TIMEOUT)
+    parser.add_argument('--visibility-timeout', type=int, default=DEFAULT_VISIBILITY_TIMEOUT)
+    parser.add_argument('--message-retention-period', type=int)
+    parser.add_argument('--max-receive-count', type=int)
+    parser.add_argument('--duration', type=float, help='Seconds of an invocation, instead of measuring the handler')
+    parser.add_argument('--duration-per-record', type=float, default=0.0,
+                        help='Seconds added to --duration for each record')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--verbose', action='store_true', help='Keep INFO logs of the handler')
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    duration = None
+    if args.duration is not None:
+        duration = lambda records: args.duration + args.duration_per_record * len(records)  # noqa: E731
+    simulator = EventSourceMappingSimulator(
+        load_handler(args.handler), fifo=args.groups > 0, batch_size=args.batch_size,
+        maximum_batching_window=args.maximum_batching_window, maximum_concurrency=args.maximum_concurrency,
+        function_timeout=args.function_timeout, visibility_timeout=args.visibility_timeout,
+        message_retention_period=args.message_retention_period, max_receive_count=args.max_receive_count,
+        duration=duration,
+    )
+    try:
+        report = simulator.run(args.rate, args.seconds, groups=max(args.groups, 1), body_size=args.body_size,
+                               seed=args.seed)
+    finally:
+        logging.disable(logging.NOTSET)
+    print(json.dumps(report.to_dict(), indent=2))
+    return 0 if not report.remaining else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
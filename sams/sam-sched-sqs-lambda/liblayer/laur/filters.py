@@ -0,0 +1,329 @@
+"""
+Lambda event filtering of SQS records, compiled once and applied in process.
+
+A pattern is parsed and compiled into one matcher per key path, e.g. ('body', 'RequestCode'),
+and the matchers of all patterns share the lookup of each path in a record.
+A record is kept if any pattern matches it, and a pattern matches if all of its key paths match.
+Conditions on attributes are checked before conditions on the body, so that a body is parsed only if needed,
+and then once for all the key paths in it.
+
+Supported syntax: exact values and null, prefix, suffix, equals-ignore-case, numeric ranges, exists and anything-but.
+As in Lambda, a body that is not JSON can only be matched as a plain string.
+
+The body of a message offloaded by laur.claimcheck is a pointer to its payload. FilterCriteria of Lambda only ever
+sees the pointer, so body conditions of FilterCriteria cannot match such messages. Given a ClaimCheck,
+EventFilter matches body conditions against the payload instead, downloading it only if the attribute conditions
+matched. The payload is cached by the ClaimCheck, so the record handler does not download it again.
+
+    event_filter = EventFilter(['{"body": {"RequestCode": ["AAAA"]}}'])
+    records = event_filter.filter(event['Records'])
+
+    python -m laur.filters --pattern '{"body": {"RequestCode": [{"prefix": "A"}]}}' events/sqs_event.json
+
+For the syntax, see https://docs.aws.amazon.com/lambda/latest/dg/invocation-eventfiltering.html#filtering-syntax
+"""
+import json
+import os
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+from laur.claimcheck import claim_check_uri
+from laur.codec import CONTENT_ENCODING, decode_body, json_loads
+
+_MISSING = object()
+NUMERIC_OPERATORS = {
+    '=': lambda value, operand: value == operand,
+    '<': lambda value, operand: value < operand,
+    '<=': lambda value, operand: value <= operand,
+    '>': lambda value, operand: value > operand,
+    '>=': lambda value, operand: value >= operand,
+}
+
+
+class FilterPatternError(ValueError):
+    """
+    A filter pattern is invalid.
+    """
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _compile_numeric(spec) -> Callable[[object], bool]:
+    if not isinstance(spec, list) or not spec or len(spec) % 2:
+        raise FilterPatternError(f'numeric takes pairs of an operator and a number: {spec!r}')
+    comparisons = []
+    for operator, operand in zip(spec[::2], spec[1::2]):
+        if operator not in NUMERIC_OPERATORS or not _is_number(operand):
+            raise FilterPatternError(f'Invalid numeric comparison: {operator!r} {operand!r}')
+        comparisons.append((NUMERIC_OPERATORS[operator], operand))
+
+    def match(value) -> bool:
+        return _is_number(value) and all(compare(value, operand) for compare, operand in comparisons)
+
+    return match
+
+
+def _compile_anything_but(spec) -> Callable[[object], bool]:
+    if isinstance(spec, dict):
+        if len(spec) != 1 or not isinstance(next(iter(spec.values())), str):
+            raise FilterPatternError(f'Invalid anything-but: {spec!r}')
+        (kind, operand), = spec.items()
+        if kind == 'prefix':
+            return lambda value: isinstance(value, str) and not value.startswith(operand)
+        if kind == 'suffix':
+            return lambda value: isinstance(value, str) and not value.endswith(operand)
+        if kind == 'equals-ignore-case':
+            folded = operand.casefold()
+            return lambda value: isinstance(value, str) and value.casefold() != folded
+        raise FilterPatternError(f'Invalid anything-but: {spec!r}')
+    excluded = spec if isinstance(spec, list) else [spec]
+    if any(isinstance(value, (dict, list)) for value in excluded):
+        raise FilterPatternError(f'Invalid anything-but: {spec!r}')
+    keys = {_literal_key(value) for value in excluded}
+    return lambda value: _literal_key(value) not in keys
+
+
+def _literal_key(value) -> tuple:
+    # 1 and 1.0 are the same number, but neither is True.
+    if _is_number(value):
+        return 'number', float(value)
+    return type(value).__name__, value
+
+
+class _LeafMatcher:
+    """
+    The matchers of one key path, OR-ed.
+    """
+
+    __slots__ = ('literals', 'prefixes', 'suffixes', 'folded', 'predicates', 'exists', 'not_exists')
+
+    def __init__(self, matchers: list):
+        literals, prefixes, suffixes, folded, predicates = set(), [], [], set(), []
+        self.exists = self.not_exists = False
+        for matcher in matchers:
+            if not isinstance(matcher, dict):
+                if isinstance(matcher, list):
+                    raise FilterPatternError(f'A matcher must not be an array: {matcher!r}')
+                literals.add(_literal_key(matcher))
+                continue
+            if len(matcher) != 1:
+                raise FilterPatternError(f'A matcher must have exactly one key: {matcher!r}')
+            (kind, spec), = matcher.items()
+            if kind in ('prefix', 'suffix', 'equals-ignore-case') and not isinstance(spec, str):
+                raise FilterPatternError(f'{kind} takes a string: {spec!r}')
+            if kind == 'prefix':
+                prefixes.append(spec)
+            elif kind == 'suffix':
+                suffixes.append(spec)
+            elif kind == 'equals-ignore-case':
+                folded.add(spec.casefold())
+            elif kind == 'numeric':
+                predicates.append(_compile_numeric(spec))
+            elif kind == 'anything-but':
+                predicates.append(_compile_anything_but(spec))
+            elif kind == 'exists':
+                if not isinstance(spec, bool):
+                    raise FilterPatternError(f'exists takes true or false: {spec!r}')
+                if spec:
+                    self.exists = True
+                else:
+                    self.not_exists = True
+            else:
+                raise FilterPatternError(f'Unsupported matcher: {kind}')
+        self.literals = frozenset(literals)
+        self.prefixes = tuple(prefixes)
+        self.suffixes = tuple(suffixes)
+        self.folded = frozenset(folded)
+        self.predicates = tuple(predicates)
+
+    def match_value(self, value) -> bool:
+        if isinstance(value, (dict, list)):
+            return False
+        if _literal_key(value) in self.literals:
+            return True
+        if isinstance(value, str):
+            if self.prefixes and value.startswith(self.prefixes):
+                return True
+            if self.suffixes and value.endswith(self.suffixes):
+                return True
+            if self.folded and value.casefold() in self.folded:
+                return True
+        return any(predicate(value) for predicate in self.predicates)
+
+    def __call__(self, values) -> bool:
+        if values is _MISSING:
+            return self.not_exists
+        if self.exists:
+            return True
+        return any(self.match_value(value) for value in values)
+
+
+def _flatten(pattern: dict, prefix: Tuple[str, ...] = ()) -> List[Tuple[Tuple[str, ...], list]]:
+    if not isinstance(pattern, dict) or not pattern:
+        raise FilterPatternError(f'A pattern must be a non-empty object: {pattern!r}')
+    leaves = []
+    for key, value in pattern.items():
+        path = prefix + (key,)
+        if isinstance(value, dict):
+            leaves.extend(_flatten(value, path))
+        elif isinstance(value, list):
+            if not value:
+                raise FilterPatternError(f'Empty array of {".".join(path)}')
+            leaves.append((path, value))
+        else:
+            raise FilterPatternError(f'The value of {".".join(path)} must be an object or an array: {value!r}')
+    return leaves
+
+
+def parse_pattern(pattern: Union[str, dict]) -> List[Tuple[Tuple[str, ...], list]]:
+    """
+    Parse a pattern, given as in FilterCriteria as a JSON string or as an object, into key paths and their matchers.
+    """
+    if isinstance(pattern, str):
+        try:
+            pattern = json.loads(pattern)
+        except ValueError as e:
+            raise FilterPatternError(f'A pattern must be JSON: {e}') from None
+    return _flatten(pattern)
+
+
+def _decode_body(body: str):
+    try:
+        decoded = json_loads(body)
+    except ValueError:
+        return body
+    # A body that is a JSON string or number is matched as a plain string, like any body that is not an object.
+    return decoded if isinstance(decoded, dict) else body
+
+
+def _payload(record: dict, claim_check) -> str:
+    """
+    The body of a record, or the payload it points to if it was offloaded by laur.claimcheck.
+    """
+    uri = claim_check_uri(record)
+    if uri is None or claim_check is None:
+        return record['body']
+    attribute = record.get('messageAttributes', {}).get(CONTENT_ENCODING)
+    content_encoding = None if attribute is None else attribute.get('stringValue')
+    return decode_body(claim_check.read(uri).decode('utf-8'), content_encoding)
+
+
+def _resolve(record: dict, path: Tuple[str, ...], claim_check=None, decoded: Optional[dict] = None):
+    """
+    The leaf values at the path, flattening arrays on the way, or _MISSING.
+    The body decoded on the way is kept in decoded, if given, for the other paths of the record.
+    """
+    nodes = [record]
+    for depth, key in enumerate(path):
+        found = []
+        for node in nodes:
+            if isinstance(node, dict) and key in node:
+                value = node[key]
+                if depth == 0 and key == 'body' and isinstance(value, str):
+                    if decoded is None:
+                        value = _decode_body(_payload(record, claim_check))
+                    else:
+                        if 'body' not in decoded:
+                            decoded['body'] = _decode_body(_payload(record, claim_check))
+                        value = decoded['body']
+                if isinstance(value, list):
+                    found.extend(value)
+                else:
+                    found.append(value)
+        if not found:
+            return _MISSING
+        nodes = found
+    return nodes
+
+
+class EventFilter:
+    """
+    Filter patterns compiled into matchers indexed by key path. Patterns are OR-ed, as in FilterCriteria.
+    Without a claim_check, body conditions are matched against the pointer of an offloaded message, as in Lambda.
+    """
+
+    def __init__(self, patterns: Iterable[Union[str, dict]], claim_check=None):
+        self.claim_check = claim_check
+        self.paths: List[Tuple[str, ...]] = []
+        index = {}
+        self.patterns: List[List[Tuple[int, _LeafMatcher]]] = []
+        for pattern in patterns:
+            conditions = []
+            for path, matchers in parse_pattern(pattern):
+                if path not in index:
+                    index[path] = len(self.paths)
+                    self.paths.append(path)
+                conditions.append((index[path], _LeafMatcher(matchers)))
+            # Check attributes before the body, which may have to be parsed.
+            conditions.sort(key=lambda condition: self.paths[condition[0]][0] == 'body')
+            self.patterns.append(conditions)
+        if not self.patterns:
+            raise FilterPatternError('No patterns')
+
+    @classmethod
+    def from_env(cls, name: str = 'EVENT_FILTER_PATTERNS', claim_check=None) -> Optional['EventFilter']:
+        """
+        Compile patterns in an environment variable as a JSON array, or return None if it is not set.
+        """
+        patterns = os.environ.get(name)
+        if not patterns:
+            return None
+        return cls(json.loads(patterns), claim_check=claim_check)
+
+    def matches(self, record: dict) -> bool:
+        values = [None] * len(self.paths)
+        decoded = {}
+        for conditions in self.patterns:
+            for idx, matcher in conditions:
+                value = values[idx]
+                if value is None:
+                    value = values[idx] = _resolve(record, self.paths[idx], self.claim_check, decoded)
+                if not matcher(value):
+                    break
+            else:
+                return True
+        return False
+
+    def filter(self, records: Iterable[dict]) -> List[dict]:
+        return [record for record in records if self.matches(record)]
+
+
+def main(argv=None):
+    """
+    Test filter patterns against SQS events captured as JSON files, and print the records that match.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m laur.filters', description=main.__doc__)
+    parser.add_argument('events', nargs='+', help='JSON files of events with Records')
+    parser.add_argument('--pattern', action='append', default=[], help='A pattern. Repeat to OR patterns')
+    parser.add_argument('--patterns-file', help='A JSON file of an array of patterns')
+    args = parser.parse_args(argv)
+
+    patterns = list(args.pattern)
+    if args.patterns_file:
+        with open(args.patterns_file) as f:
+            patterns.extend(json.load(f))
+    try:
+        event_filter = EventFilter(patterns)
+    except FilterPatternError as e:
+        parser.error(str(e))
+
+    matched = total = 0
+    for path in args.events:
+        with open(path) as f:
+            event = json.load(f)
+        for record in event.get('Records', ()):
+            total += 1
+            if event_filter.matches(record):
+                matched += 1
+                print(f'MATCH {path} {record.get("messageId")}')
+            else:
+                print(f'DROP  {path} {record.get("messageId")}')
+    print(f'{matched} of {total} records matched')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,257 @@
+"""
+An HTTP client for downstream calls of Lambda functions, reusing connections across records and warm invocations.
+
+A requests Session created per call opens a new connection, with a TCP and a TLS handshake, for every request.
+The client keeps one Session for the execution environment instead, whose pools hold a connection per worker,
+so records processed in parallel by laur.batch reuse connections rather than opening and dropping extra ones.
+ * Sockets are kept alive with SO_KEEPALIVE, and a connection dropped while the environment was frozen
+   is detected and replaced by urllib3 when it is taken from the pool.
+ * Idempotent requests are retried on connection errors and on 429 and 5xx responses, with full jitter backoff.
+ * Given the context of the invocation, a request never waits past its deadline, retries included.
+ * stats counts requests, new connections, i.e. handshakes, and retries.
+
+    from laur.httpclient import get_http_client
+
+    http = get_http_client()
+
+    def lambda_handler(event, context):
+        http.bind(context)
+        ...
+        http.request('GET', 'https://example.com/items/1').json()
+
+Environment variables: HTTP_TIMEOUT, HTTP_MAX_RETRIES, and BATCH_MAX_WORKERS for the size of the pools.
+
+For the retries, see https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_CONNECT_TIMEOUT = 2.0
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_BACKOFF_BASE = 0.05
+DEFAULT_BACKOFF_CAP = 2.0
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+# Time left for handling a response before the invocation times out.
+DEFAULT_SAFETY_MARGIN_MS = 200
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+SOCKET_OPTIONS = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised instead of sending a request, or retrying it, with no time left before the deadline of the invocation.
+    """
+
+
+class HttpStats:
+    """
+    Counters of a client since it was created or reset. Thread safe.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def add(self, requests: int = 0, connections: int = 0, retries: int = 0):
+        with self._lock:
+            self.requests += requests
+            self.connections += connections
+            self.retries += retries
+
+    @property
+    def reused(self) -> int:
+        """
+        Requests sent on a connection opened by an earlier request.
+        """
+        return max(self.requests - self.connections, 0)
+
+    def to_dict(self) -> dict:
+        return {'requests': self.requests, 'connections': self.connections, 'reused': self.reused,
+                'retries': self.retries}
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.connections = self.retries = 0
+
+
+class _CountingAdapter(HTTPAdapter):
+    """
+    An adapter counting the requests it sends and the connections its pools open.
+    """
+
+    def __init__(self, stats: HttpStats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs.setdefault('socket_options', SOCKET_OPTIONS)
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        stats = self.stats
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                stats.add(connections=1)
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                stats.add(connections=1)
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        self.stats.add(requests=1)
+        return super().send(request, **kwargs)
+
+
+class HttpClient:
+    """
+    A requests Session with pools of pool_maxsize connections for each of pool_connections hosts,
+    and bounded retries. Thread safe as long as the session is only used through request.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 backoff_cap: float = DEFAULT_BACKOFF_CAP, pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE, safety_margin_ms: int = DEFAULT_SAFETY_MARGIN_MS,
+                 clock=time):
+        if max_retries < 0:
+            raise ValueError(f'max_retries must be 0 or more: {max_retries}')
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.safety_margin_ms = safety_margin_ms
+        self.clock = clock
+        self.context = None
+        self.stats = HttpStats()
+        self.session = requests.Session()
+        # Retries are made by request, so that they are counted and bounded by the deadline.
+        adapter = _CountingAdapter(self.stats, pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_env(cls, **kwargs) -> 'HttpClient':
+        if os.environ.get('HTTP_TIMEOUT'):
+            kwargs.setdefault('timeout', float(os.environ['HTTP_TIMEOUT']))
+        if os.environ.get('HTTP_MAX_RETRIES'):
+            kwargs.setdefault('max_retries', int(os.environ['HTTP_MAX_RETRIES']))
+        # Every worker of the batch processor may call the same host at once.
+        kwargs.setdefault('pool_maxsize', int(os.environ.get('BATCH_MAX_WORKERS', DEFAULT_POOL_MAXSIZE)))
+        return cls(**kwargs)
+
+    def bind(self, context):
+        """
+        Bound timeouts and retries of the following requests by the deadline of an invocation.
+        """
+        self.context = context
+
+    def remaining(self) -> Optional[float]:
+        """
+        Seconds left for a request before the deadline, or None without a deadline.
+        """
+        if not hasattr(self.context, 'get_remaining_time_in_millis'):
+            return None
+        return (self.context.get_remaining_time_in_millis() - self.safety_margin_ms) / 1000
+
+    def _timeout(self, timeout: Optional[float]) -> Tuple[float, float]:
+        read_timeout = self.timeout if timeout is None else timeout
+        remaining = self.remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                raise DeadlineExceeded('No time left to send a request before the deadline')
+            read_timeout = min(read_timeout, remaining)
+        return min(self.connect_timeout, read_timeout), read_timeout
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Seconds to wait before a retry, with full jitter.
+        """
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def request(self, method: str, url: str, timeout: Optional[float] = None, retry: Optional[bool] = None,
+                **kwargs) -> requests.Response:
+        """
+        Send a request by requests.Session.request. timeout is the read timeout in seconds.
+        Requests of idempotent methods are retried, unless retry is False.
+        A response with a status to retry is returned once retries are exhausted.
+        """
+        method = method.upper()
+        retries = self.max_retries if (method in IDEMPOTENT_METHODS if retry is None else retry) else 0
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, timeout=self._timeout(timeout), **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retries:
+                    raise
+                logger.warning('Retrying %s %s', method, url, exc_info=True)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                logger.warning('Retrying %s %s after status %d', method, url, response.status_code)
+                response.close()
+
+            delay = self.backoff(attempt)
+            remaining = self.remaining()
+            if remaining is not None and delay >= remaining:
+                raise DeadlineExceeded(f'No time left to retry {method} {url} before the deadline')
+            self.clock.sleep(delay)
+            attempt += 1
+            self.stats.add(retries=1)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """
+    The client of the execution environment, created from the environment variables on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient.from_env()
+    return _client
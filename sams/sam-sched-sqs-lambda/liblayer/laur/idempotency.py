@@ -0,0 +1,345 @@
+"""
+Idempotency of record handlers, so that a redelivered message is not processed again.
+
+SQS delivers a message at least once: a message is redelivered after its visibility timeout
+when the batch it was in failed partly or timed out, even if the message itself was processed.
+A record handler wrapped by `Idempotency.record_handler` remembers the records it completed and skips them.
+
+There are two tiers.
+ * An in-memory LRU with TTL, which survives warm invocations of an execution environment.
+ * An optional persistent store shared by all execution environments: SqliteStore locally, DynamoDbStore in prod.
+
+Before a record is processed an "in progress" lease is taken,
+so that a duplicate processed concurrently elsewhere fails with IdempotencyInProgressError and is retried later.
+
+    idempotency = Idempotency(store=DynamoDbStore('my-table'))
+
+    @idempotency.record_handler
+    def process_record(record):
+        ...
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_ITEMS = 10000
+
+
+class IdempotencyInProgressError(Exception):
+    """
+    The same key is being processed elsewhere.
+    """
+
+
+class Entry:
+    __slots__ = ('key', 'status', 'expires_at', 'result')
+
+    def __init__(self, key: str, status: str, expires_at: float, result=None):
+        self.key = key
+        self.status = status
+        self.expires_at = expires_at
+        self.result = result
+
+    def __repr__(self):
+        return f'<Entry {self.key} {self.status} expires_at={self.expires_at}>'
+
+
+def message_id_key(record: dict) -> str:
+    return record['messageId']
+
+
+def deduplication_id_key(record: dict) -> str:
+    """
+    MessageDeduplicationId of a FIFO message, or messageId of a standard one.
+    """
+    return record.get('attributes', {}).get('MessageDeduplicationId') or record['messageId']
+
+
+class MemoryTier:
+    """
+    An LRU of entries with TTL.
+    """
+
+    def __init__(self, max_items: int = DEFAULT_MAX_ITEMS):
+        self.max_items = max_items
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, now: float) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, entry: Entry):
+        self._entries[entry.key] = entry
+        self._entries.move_to_end(entry.key)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+
+    def put(self, entry: Entry):
+        with self._lock:
+            self._put(entry)
+
+    def acquire(self, entry: Entry, now: float) -> bool:
+        """
+        Put the entry unless a live one exists, atomically.
+        """
+        with self._lock:
+            existing = self._entries.get(entry.key)
+            if existing is not None and existing.expires_at > now:
+                return False
+            self._put(entry)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class IdempotencyStore(ABC):
+    """
+    A persistent store. acquire must be atomic: it puts the entry only if no live entry of the key exists.
+    """
+
+    @abstractmethod
+    def get(self, key: str, now: float) -> Optional[Entry]:
+        """
+        The live entry of key, None if there is none.
+        """
+
+    @abstractmethod
+    def acquire(self, entry: Entry, now: float) -> bool:
+        """
+        Put the entry unless a live one of its key exists, and return whether it was put.
+        """
+
+    @abstractmethod
+    def put(self, entry: Entry):
+        """
+        Put the entry, replacing any of its key.
+        """
+
+    @abstractmethod
+    def delete(self, key: str):
+        """
+        Delete the entry of key, if any.
+        """
+
+
+class SqliteStore(IdempotencyStore):
+    """
+    A store in a SQLite database, for local runs and tests.
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS idempotency ('
+            'key TEXT PRIMARY KEY, status TEXT NOT NULL, expires_at REAL NOT NULL, result TEXT)'
+        )
+
+    def get(self, key: str, now: float) -> Optional[Entry]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT status, expires_at, result FROM idempotency WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+        if row is None:
+            return None
+        status, expires_at, result = row
+        return Entry(key, status, expires_at, None if result is None else json.loads(result))
+
+    def acquire(self, entry: Entry, now: float) -> bool:
+        with self._lock:
+            cursor = self._connection.execute(
+                'INSERT INTO idempotency (key, status, expires_at, result) VALUES (?, ?, ?, NULL) '
+                'ON CONFLICT (key) DO UPDATE SET status = excluded.status, expires_at = excluded.expires_at, '
+                'result = NULL WHERE idempotency.expires_at <= ?',
+                (entry.key, entry.status, entry.expires_at, now)
+            )
+            return cursor.rowcount == 1
+
+    def put(self, entry: Entry):
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO idempotency (key, status, expires_at, result) VALUES (?, ?, ?, ?)',
+                (entry.key, entry.status, entry.expires_at, json.dumps(entry.result, default=str))
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._connection.execute('DELETE FROM idempotency WHERE key = ?', (key,))
+
+
+class DynamoDbStore(IdempotencyStore):
+    """
+    A store in a DynamoDB table whose partition key is a string attribute `id`.
+    Enable TTL on the attribute `expiration` of the table to remove expired entries.
+    """
+
+    def __init__(self, table_name: str, client=None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from laur.runtime import get_client
+
+            self._client = get_client('dynamodb')
+        return self._client
+
+    @staticmethod
+    def _item(entry: Entry) -> dict:
+        item = {
+            'id': {'S': entry.key},
+            'status': {'S': entry.status},
+            'expiration': {'N': str(int(entry.expires_at))},
+            'expires_at': {'N': repr(entry.expires_at)},
+        }
+        if entry.result is not None:
+            item['result'] = {'S': json.dumps(entry.result, default=str)}
+        return item
+
+    def get(self, key: str, now: float) -> Optional[Entry]:
+        item = self.client.get_item(TableName=self.table_name, Key={'id': {'S': key}}, ConsistentRead=True).get('Item')
+        if item is None or float(item['expires_at']['N']) <= now:
+            return None
+        result = item.get('result')
+        return Entry(key, item['status']['S'], float(item['expires_at']['N']),
+                     None if result is None else json.loads(result['S']))
+
+    def acquire(self, entry: Entry, now: float) -> bool:
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item=self._item(entry),
+                ConditionExpression='attribute_not_exists(id) OR expires_at <= :now',
+                ExpressionAttributeValues={':now': {'N': repr(now)}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def put(self, entry: Entry):
+        self.client.put_item(TableName=self.table_name, Item=self._item(entry))
+
+    def delete(self, key: str):
+        self.client.delete_item(TableName=self.table_name, Key={'id': {'S': key}})
+
+
+class Idempotency:
+    """
+    Skip work already completed for a key.
+    lease_seconds should be longer than the processing of a record, ttl_seconds how long completion is remembered.
+    """
+
+    def __init__(self, store: Optional[IdempotencyStore] = None, key_of: Callable[[dict], str] = message_id_key,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_items: int = DEFAULT_MAX_ITEMS, clock=time):
+        self.store = store
+        self.key_of = key_of
+        self.lease_seconds = lease_seconds
+        self.ttl_seconds = ttl_seconds
+        self.memory = MemoryTier(max_items)
+        self.clock = clock
+
+    @classmethod
+    def from_env(cls, **kwargs) -> 'Idempotency':
+        """
+        Use DynamoDB if IDEMPOTENCY_TABLE_NAME is set, SQLite if IDEMPOTENCY_SQLITE_PATH is set and memory only otherwise.
+        """
+        store = None
+        if os.environ.get('IDEMPOTENCY_TABLE_NAME'):
+            store = DynamoDbStore(os.environ['IDEMPOTENCY_TABLE_NAME'])
+        elif os.environ.get('IDEMPOTENCY_SQLITE_PATH'):
+            store = SqliteStore(os.environ['IDEMPOTENCY_SQLITE_PATH'])
+        return cls(store=store, **kwargs)
+
+    def completed(self, key: str) -> Optional[Entry]:
+        """
+        The completed entry of a key if any.
+        """
+        now = self.clock.time()
+        entry = self.memory.get(key, now)
+        if entry is None and self.store is not None:
+            entry = self.store.get(key, now)
+            if entry is not None and entry.status == COMPLETED:
+                self.memory.put(entry)
+        if entry is not None and entry.status == COMPLETED:
+            return entry
+        return None
+
+    def run(self, key: str, func: Callable, *args, **kwargs):
+        """
+        Call func unless it has completed for the key, and return its result or the remembered one.
+        """
+        entry = self.completed(key)
+        if entry is not None:
+            logger.info('Skipped completed %s', key)
+            return entry.result
+
+        now = self.clock.time()
+        lease = Entry(key, IN_PROGRESS, now + self.lease_seconds)
+        if not self.memory.acquire(lease, now):
+            raise IdempotencyInProgressError(f'{key} is in progress')
+        if self.store is not None and not self.store.acquire(lease, now):
+            self.memory.delete(key)
+            raise IdempotencyInProgressError(f'{key} is in progress')
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            # Release the lease so that a retry can process it.
+            self.memory.delete(key)
+            if self.store is not None:
+                self.store.delete(key)
+            raise
+
+        done = Entry(key, COMPLETED, self.clock.time() + self.ttl_seconds, result)
+        if self.store is not None:
+            self.store.put(done)
+        self.memory.put(done)
+        return result
+
+    def forget(self, record: dict):
+        """
+        Forget that a record completed, e.g. when its buffered writes failed, so that it is processed again.
+        """
+        key = self.key_of(record)
+        self.memory.delete(key)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def record_handler(self, func: Callable[[dict], object]) -> Callable[[dict], object]:
+        """
+        Wrap a record handler to skip records already completed.
+        """
+        @wraps(func)
+        def wrapper(record: dict):
+            return self.run(self.key_of(record), func, record)
+
+        return wrapper
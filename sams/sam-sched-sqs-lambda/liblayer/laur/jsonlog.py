@@ -0,0 +1,197 @@
+"""
+Structured logging as JSON lines for the hot path of a Lambda function.
+
+ * Nothing is serialized unless the level is enabled: fields are handed over as they are and formatted by the handler.
+ * Long strings are truncated and sensitive keys are redacted when formatted.
+ * Per-record debug logs can be sampled at a rate, LOG_SAMPLE_RATE, and a sampled line is emitted
+   whatever LOG_LEVEL is, so that a sample of debug logs is seen in production at INFO.
+ * Invocation context (request id, APP_ID, APP_ENV) is bound once per invocation and record context
+   (messageId, MessageGroupId) once per record, and they are merged only into lines that are emitted.
+
+    logger = get_logger('tryaws.sams.sam-sched-sqs-lambda')
+
+    def lambda_handler(event, context):
+        logger.bind_invocation(context)
+        for record in event['Records']:
+            logger.bind_record(record)
+            logger.sampled_debug('Processing a record', body=record['body'])
+
+Environment variables: LOG_LEVEL, LOG_SAMPLE_RATE, LOG_MAX_FIELD_LENGTH and LOG_REDACT_KEYS (comma separated).
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from typing import Iterable, Optional
+
+DEFAULT_MAX_FIELD_LENGTH = 1024
+DEFAULT_REDACT_KEYS = ('receiptHandle', 'password', 'secret', 'token', 'authorization')
+REDACTED = '[REDACTED]'
+
+
+class LogContext:
+    """
+    Fields merged into every emitted line: static ones from env variables, the current invocation's and the current record's.
+    The record context is per thread, since records may be processed in parallel.
+    """
+
+    def __init__(self):
+        self.static = {k: v for k, v in (('appId', os.environ.get('APP_ID')), ('appEnv', os.environ.get('APP_ENV')),
+                                         ('function', os.environ.get('AWS_LAMBDA_FUNCTION_NAME'))) if v}
+        self.invocation = {}
+        self._local = threading.local()
+
+    def bind_invocation(self, context=None, **fields):
+        invocation = {}
+        request_id = getattr(context, 'aws_request_id', None)
+        if request_id:
+            invocation['requestId'] = request_id
+        invocation.update(fields)
+        # Replaced as a whole, so that threads never see a half updated dict.
+        self.invocation = invocation
+        self.clear_record()
+
+    def bind_record(self, message_id: Optional[str], group_id: Optional[str] = None):
+        self._local.record = (message_id, group_id)
+
+    def clear_record(self):
+        self._local.record = None
+
+    def fields(self) -> dict:
+        fields = dict(self.static)
+        fields.update(self.invocation)
+        record = getattr(self._local, 'record', None)
+        if record is not None:
+            message_id, group_id = record
+            fields['messageId'] = message_id
+            if group_id is not None:
+                fields['messageGroupId'] = group_id
+        return fields
+
+
+log_context = LogContext()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format a log record into a JSON line, truncating long strings and redacting sensitive keys.
+    """
+
+    def __init__(self, context: LogContext = log_context, max_field_length: int = DEFAULT_MAX_FIELD_LENGTH,
+                 redact_keys: Iterable[str] = DEFAULT_REDACT_KEYS):
+        super().__init__()
+        self.context = context
+        self.max_field_length = max_field_length
+        self.redact_keys = {key.lower() for key in redact_keys}
+
+    def _shorten(self, value, depth: int = 0):
+        if isinstance(value, str):
+            if len(value) > self.max_field_length:
+                return f'{value[:self.max_field_length]}...(+{len(value) - self.max_field_length} chars)'
+            return value
+        if isinstance(value, bytes):
+            return f'<{len(value)} bytes>'
+        if depth > 8:
+            return repr(value)[:self.max_field_length]
+        if isinstance(value, dict):
+            return {k: REDACTED if str(k).lower() in self.redact_keys else self._shorten(v, depth + 1)
+                    for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._shorten(v, depth + 1) for v in value]
+        return value
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': self._shorten(record.getMessage()),
+        }
+        line.update(self.context.fields())
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line.update(self._shorten(fields))
+        if record.exc_info:
+            line['exception'] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str, ensure_ascii=False, separators=(',', ':'))
+
+
+class StructuredLogger:
+    """
+    A logger taking fields as keyword arguments. The level is checked before anything is built.
+    Positional arguments are %-format arguments of the message as with logging.Logger.
+    """
+
+    def __init__(self, logger: logging.Logger, sample_rate: float = 0.0, context: LogContext = log_context):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.context = context
+
+    def _log(self, level: int, message: str, args: tuple, fields: dict, exc_info=None):
+        if self.logger.isEnabledFor(level):
+            self.logger._log(level, message, args, exc_info=exc_info, extra={'fields': fields}, stacklevel=3)
+
+    def _emit(self, level: int, message: str, args: tuple, fields: dict):
+        """
+        Log regardless of the level of the logger.
+        """
+        if not self.logger.disabled:
+            self.logger._log(level, message, args, extra={'fields': fields}, stacklevel=3)
+
+    def debug(self, message: str, *args, **fields):
+        self._log(logging.DEBUG, message, args, fields)
+
+    def info(self, message: str, *args, **fields):
+        self._log(logging.INFO, message, args, fields)
+
+    def warning(self, message: str, *args, **fields):
+        self._log(logging.WARNING, message, args, fields)
+
+    def error(self, message: str, *args, **fields):
+        self._log(logging.ERROR, message, args, fields)
+
+    def exception(self, message: str, *args, **fields):
+        self._log(logging.ERROR, message, args, fields, exc_info=True)
+
+    def sampled_debug(self, message: str, *args, **fields):
+        """
+        Log at debug level for a sampled fraction of calls, e.g. per record, even if the logger is at INFO or above.
+        """
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            fields['sampled'] = True
+            self._emit(logging.DEBUG, message, args, fields)
+
+    def bind_invocation(self, context=None, **fields):
+        self.context.bind_invocation(context, **fields)
+
+    def bind_record(self, record: dict):
+        self.context.bind_record(record.get('messageId'), record.get('attributes', {}).get('MessageGroupId'))
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+
+def get_logger(name: str, level: Optional[str] = None, sample_rate: Optional[float] = None,
+               stream=None) -> StructuredLogger:
+    """
+    Get a structured logger writing JSON lines to stdout.
+    It doesn't propagate to the root logger, which the Lambda runtime formats as plain text.
+    """
+    logger = logging.getLogger(name)
+    if not any(isinstance(h.formatter, JsonFormatter) for h in logger.handlers):
+        handler = logging.StreamHandler(stream or sys.stdout)
+        max_field_length = int(os.environ.get('LOG_MAX_FIELD_LENGTH', DEFAULT_MAX_FIELD_LENGTH))
+        redact_keys = os.environ.get('LOG_REDACT_KEYS')
+        handler.setFormatter(JsonFormatter(
+            max_field_length=max_field_length,
+            redact_keys=redact_keys.split(',') if redact_keys else DEFAULT_REDACT_KEYS,
+        ))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level or os.environ.get('LOG_LEVEL', 'INFO'))
+    if sample_rate is None:
+        sample_rate = float(os.environ.get('LOG_SAMPLE_RATE', '0'))
+    return StructuredLogger(logger, sample_rate=sample_rate)
@@ -0,0 +1,278 @@
+"""
+Build of the Lambda layer: slim, precompiled, and with a report of its size and import times.
+
+The python3.11 runtime already provides boto3 and its dependencies, so a layer bundling them again
+only makes the package to download and extract at a cold start larger. The build
+ * installs requirements.txt for the platform of Lambda,
+ * drops the distributions the runtime provides,
+ * strips tests, docs, type stubs and extra files of dist-info,
+ * copies laur without the modules for development only, e.g. laur.localsqs and laur.replay, which the handler
+   never imports,
+ * precompiles all modules into unchecked hash based .pyc files, since the file system of Lambda is read-only
+   and a .pyc checked against a source timestamp, which a zip may not keep, is never rewritten,
+ * reports the size of each top-level package and the import time of each module with python -X importtime.
+
+It runs as the makefile build method of SAM, see liblayer/Makefile, or by hand:
+
+    python -m laur.layerbuild --output build/python --import-path src --module lambda_handlers.hello_world.app
+
+For Python packages of layers, see https://docs.aws.amazon.com/lambda/latest/dg/python-layers.html
+"""
+import compileall
+import json
+import logging
+import os
+import py_compile
+import re
+import shutil
+import subprocess
+import sys
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TARGET_VERSION = (3, 11)
+PLATFORM = 'manylinux2014_x86_64'
+# Distributions the python3.11 runtime provides in /var/runtime.
+# urllib3 is provided too, but pinned below 2 by botocore, so the one requests is installed with is kept.
+RUNTIME_PROVIDED = frozenset(('boto3', 'botocore', 's3transfer', 'jmespath', 'python-dateutil', 'six'))
+STRIPPED_DIRECTORIES = frozenset(('tests', 'test', 'docs', 'doc', 'examples', '__pycache__'))
+STRIPPED_SUFFIXES = ('.pyi', '.pyx', '.pxd', '.c', '.h', '.md', '.rst')
+# Files of dist-info that importlib.metadata and licenses need.
+KEPT_DIST_INFO_FILES = frozenset(('METADATA', 'entry_points.txt', 'top_level.txt'))
+# Modules of laur for tests and tools run locally, left out of the layer. No module of the layer imports them.
+DEV_MODULES = frozenset(('advisor', 'drain', 'events', 'eventsource', 'layerbuild', 'localsqs', 'replay', 'stack',
+                         'testqueues'))
+IMPORT_TIME_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def normalize_name(name: str) -> str:
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def pip_install(requirements: str, target: str, platform: Optional[str] = PLATFORM,
+                python_version: str = '.'.join(map(str, TARGET_VERSION))):
+    """
+    Install requirements into target, as binary wheels for platform unless it is None.
+    """
+    command = [sys.executable, '-m', 'pip', 'install', '--quiet', '--no-compile', '--upgrade',
+               '--requirement', requirements, '--target', target]
+    if platform is not None:
+        command += ['--platform', platform, '--implementation', 'cp', '--python-version', python_version,
+                    '--only-binary=:all:']
+    subprocess.run(command, check=True)
+
+
+def distributions(target: str) -> Dict[str, str]:
+    """
+    Paths of the dist-info directories in target by normalized distribution name.
+    """
+    found = {}
+    for entry in os.listdir(target):
+        if not entry.endswith('.dist-info'):
+            continue
+        name = entry[:-len('.dist-info')].rsplit('-', 1)[0]
+        metadata = os.path.join(target, entry, 'METADATA')
+        if os.path.exists(metadata):
+            with open(metadata, encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('Name:'):
+                        name = line[len('Name:'):].strip()
+                        break
+        found[normalize_name(name)] = os.path.join(target, entry)
+    return found
+
+
+def drop_distributions(target: str, names: Iterable[str]) -> List[str]:
+    """
+    Remove the files of installed distributions, listed in their RECORD, and return the names removed.
+    """
+    wanted = {normalize_name(name) for name in names}
+    dropped = []
+    for name, dist_info in sorted(distributions(target).items()):
+        if name not in wanted:
+            continue
+        record = os.path.join(dist_info, 'RECORD')
+        top_levels = set()
+        if os.path.exists(record):
+            with open(record, encoding='utf-8') as f:
+                for line in f:
+                    path = line.rsplit(',', 2)[0]
+                    if path and not path.startswith('..'):
+                        top_levels.add(path.split('/', 1)[0])
+        for top_level in top_levels:
+            _remove(os.path.join(target, top_level))
+        _remove(dist_info)
+        dropped.append(name)
+    return dropped
+
+
+def _remove(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def strip(target: str) -> int:
+    """
+    Remove what is never imported at runtime and return the bytes removed.
+    """
+    removed = 0
+    for root, dirs, files in os.walk(target):
+        if root.endswith('.dist-info'):
+            for name in files:
+                if name not in KEPT_DIST_INFO_FILES and not name.upper().startswith(('LICENSE', 'COPYING')):
+                    removed += _size(os.path.join(root, name))
+                    os.remove(os.path.join(root, name))
+            continue
+        for name in list(dirs):
+            if name in STRIPPED_DIRECTORIES:
+                path = os.path.join(root, name)
+                removed += _size(path)
+                shutil.rmtree(path)
+                dirs.remove(name)
+        for name in files:
+            if name.endswith(STRIPPED_SUFFIXES) and not name.upper().startswith(('LICENSE', 'COPYING')):
+                removed += _size(os.path.join(root, name))
+                os.remove(os.path.join(root, name))
+    bin_dir = os.path.join(target, 'bin')
+    if os.path.isdir(bin_dir):
+        removed += _size(bin_dir)
+        shutil.rmtree(bin_dir)
+    return removed
+
+
+def _size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def copy_package(source: str, target: str, excluded: Iterable[str] = DEV_MODULES):
+    """
+    Copy a package without its caches and the excluded modules.
+    """
+    destination = os.path.join(target, os.path.basename(os.path.normpath(source)))
+    _remove(destination)
+    shutil.copytree(source, destination, ignore=shutil.ignore_patterns(
+        '__pycache__', '*.pyc', *(f'{name}.py' for name in excluded)))
+
+
+def precompile(target: str) -> bool:
+    """
+    Compile every module of target into __pycache__, if this interpreter is the version of the runtime,
+    since the runtime ignores .pyc files of other versions.
+    """
+    if sys.version_info[:2] != TARGET_VERSION:
+        logger.warning('Not precompiling with Python %d.%d for python%d.%d', *sys.version_info[:2], *TARGET_VERSION)
+        return False
+    return compileall.compile_dir(target, quiet=1, workers=0,
+                                  invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+
+
+def package_sizes(target: str) -> Dict[str, int]:
+    """
+    Bytes of each top-level entry of target, largest first.
+    """
+    sizes = {entry: _size(os.path.join(target, entry)) for entry in os.listdir(target)}
+    return dict(sorted(sizes.items(), key=lambda item: -item[1]))
+
+
+def parse_import_times(stderr: str) -> Dict[str, dict]:
+    """
+    Parse the output of python -X importtime into microseconds by module: self, and cumulative with its imports.
+    """
+    times = {}
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            times[match.group(4)] = {'selfUs': int(match.group(1)), 'cumulativeUs': int(match.group(2))}
+    return times
+
+
+def measure_import_times(modules: Iterable[str], paths: Iterable[str]) -> Dict[str, dict]:
+    """
+    Import modules in a fresh interpreter with paths first on sys.path, like /opt/python of a layer.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(paths), PYTHONDONTWRITEBYTECODE='1')
+    code = ''.join(f'import {module}\n' for module in modules)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, capture_output=True,
+                            text=True, check=True)
+    return parse_import_times(result.stderr)
+
+
+def laur_modules(package: str, excluded: Iterable[str] = DEV_MODULES) -> List[str]:
+    """
+    The modules of laur in the layer.
+    """
+    excluded = {f'{name}.py' for name in excluded}
+    return sorted(f'laur.{name[:-3]}' for name in os.listdir(package)
+                  if name.endswith('.py') and name not in ('__init__.py', '__main__.py') and name not in excluded)
+
+
+def build(output: str, requirements: Optional[str], package: str, platform: Optional[str] = PLATFORM,
+          drop: Iterable[str] = RUNTIME_PROVIDED, modules: Iterable[str] = (), import_paths: Iterable[str] = (),
+          precompiled: bool = True) -> dict:
+    """
+    Build the layer into output, the python directory of the layer, and return the report.
+    """
+    os.makedirs(output, exist_ok=True)
+    if requirements:
+        pip_install(requirements, output, platform)
+    dropped = drop_distributions(output, drop)
+    stripped = strip(output)
+    copy_package(package, output)
+    compiled = precompile(output) if precompiled else False
+
+    modules = list(modules) or laur_modules(package)
+    times = measure_import_times(modules, [output] + list(import_paths))
+    return {
+        'layerBytes': _size(output),
+        'packages': package_sizes(output),
+        'dropped': dropped,
+        'strippedBytes': stripped,
+        'precompiled': bool(compiled),
+        'importTimesUs': {module: times[module] for module in modules if module in times},
+        'slowestImportsUs': dict(sorted(((name, t['selfUs']) for name, t in times.items()),
+                                        key=lambda item: -item[1])[:20]),
+    }
+
+
+def main(argv=None):
+    """
+    Build the Lambda layer and print the report as JSON.
+    """
+    import argparse
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    liblayer = os.path.dirname(here)
+    parser = argparse.ArgumentParser(prog='python -m laur.layerbuild', description=main.__doc__)
+    parser.add_argument('--output', required=True, help='The python directory of the layer to build into')
+    parser.add_argument('--requirements', default=os.path.join(liblayer, 'requirements.txt'))
+    parser.add_argument('--platform', default=PLATFORM, help="A pip platform, or 'native' for this machine")
+    parser.add_argument('--keep', action='append', default=[], help='A runtime provided distribution to keep')
+    parser.add_argument('--module', action='append', default=[],
+                        help='A module to report the import time of, e.g. the handler. All of laur by default')
+    parser.add_argument('--import-path', action='append', default=[], help='A path to import modules from')
+    parser.add_argument('--report', help='A file to write the report to as well')
+    parser.add_argument('--no-compile', action='store_true')
+    args = parser.parse_args(argv)
+
+    modules = laur_modules(here) + args.module if args.module else []
+    report = build(
+        args.output, args.requirements, here, platform=None if args.platform == 'native' else args.platform,
+        drop=RUNTIME_PROVIDED - set(args.keep), modules=modules, import_paths=args.import_path,
+        precompiled=not args.no_compile,
+    )
+    text = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
@@ -0,0 +1,788 @@
+"""
+An in-process stand-in for Amazon SQS, driven by a controllable clock.
+
+It models what the tests in this repository depend on:
+ * FIFO message group locking and in-group ordering
+ * Deduplication by MessageDeduplicationId or content within the 5 minutes deduplication interval
+ * VisibilityTimeout, MessageRetentionPeriod, ReceiveMessageWaitTimeSeconds and DelaySeconds
+ * RedrivePolicy to a dead-letter queue
+
+There are two ways to plug it into boto3.
+ * A client factory: `LocalSqs.client()` / `LocalSqs.resource()`, or `LocalSqs.install()` for the default session.
+   Calls are answered in process through botocore's event hooks, so clients, resources and modeled exceptions are real.
+ * An endpoint: `LocalSqsServer` serves the SQS JSON protocol, to use with `endpoint_url`.
+
+For the behaviour of FIFO queues,
+see https://docs.aws.amazon.com/AWSSimpleQueueService/latest/SQSDeveloperGuide/FIFO-queues-understanding-logic.html
+"""
+import base64
+import datetime
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+DEDUPLICATION_INTERVAL = 300
+MAX_BATCH_ENTRIES = 10
+MAX_WAIT_TIME_SECONDS = 20
+
+DEFAULT_REGION = 'us-east-1'
+DEFAULT_ACCOUNT_ID = '123456789012'
+SENDER_ID = 'AIDAIENQZJOLO23YVJ4VO'
+
+DEFAULT_QUEUE_ATTRIBUTES = {
+    'DelaySeconds': '0',
+    'MaximumMessageSize': '262144',
+    'MessageRetentionPeriod': '345600',
+    'ReceiveMessageWaitTimeSeconds': '0',
+    'VisibilityTimeout': '30',
+}
+DEFAULT_FIFO_QUEUE_ATTRIBUTES = {
+    'FifoQueue': 'true',
+    'ContentBasedDeduplication': 'false',
+    'DeduplicationScope': 'queue',
+    'FifoThroughputLimit': 'perQueue',
+}
+
+
+class SystemClock:
+    """
+    The wall clock.
+    """
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def wait(self, condition: threading.Condition, timeout: float):
+        """
+        Wait on the condition, whose lock must be held, for timeout seconds at most.
+        """
+        condition.wait(timeout)
+
+
+class VirtualClock:
+    """
+    A clock that only moves when somebody sleeps or waits on it, so that waiting never takes real time.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self._now = time.time() if start is None else start
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float):
+        if seconds < 0:
+            raise ValueError('sleep length must be non-negative')
+        with self._lock:
+            self._now += seconds
+
+    advance = sleep
+
+    def wait(self, condition: threading.Condition, timeout: float):
+        self.sleep(max(timeout, 0))
+
+    @property
+    def datetime(self):
+        """
+        A datetime class whose now() reads this clock, to replace `datetime.datetime` in tests.
+        """
+        clock = self
+
+        class VirtualDatetime(datetime.datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.datetime.fromtimestamp(clock.time(), tz)
+
+            @classmethod
+            def utcnow(cls):
+                return datetime.datetime.fromtimestamp(clock.time(), datetime.timezone.utc).replace(tzinfo=None)
+
+        return VirtualDatetime
+
+
+class LocalSqsError(Exception):
+    """
+    An error response of SQS.
+    code is the error code of the JSON protocol, which is the shape name of the modeled exception.
+    query_code is the legacy error code of the query protocol.
+    """
+
+    def __init__(self, code: str, message: str, query_code: Optional[str] = None, sender_fault: bool = True):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.query_code = query_code or code
+        self.sender_fault = sender_fault
+
+    def to_response(self) -> dict:
+        """
+        The error in the form botocore parses an error response into.
+        """
+        return {
+            'Error': {
+                'Message': self.message,
+                'Code': self.query_code,
+                'QueryErrorCode': self.code,
+                'Type': 'Sender' if self.sender_fault else 'Receiver',
+            },
+        }
+
+
+def _queue_does_not_exist() -> LocalSqsError:
+    return LocalSqsError('QueueDoesNotExist', 'The specified queue does not exist.',
+                         'AWS.SimpleQueueService.NonExistentQueue')
+
+
+def _invalid_parameter(message: str) -> LocalSqsError:
+    return LocalSqsError('InvalidParameterValue', message)
+
+
+def _missing_parameter(message: str) -> LocalSqsError:
+    return LocalSqsError('MissingParameter', message)
+
+
+def md5_of_message_attributes(message_attributes: dict) -> str:
+    """
+    Calculate MD5OfMessageAttributes.
+    See https://docs.aws.amazon.com/AWSSimpleQueueService/latest/SQSDeveloperGuide/sqs-message-metadata.html
+    """
+    md5 = hashlib.md5()
+
+    def update(value: bytes):
+        md5.update(struct.pack('!I', len(value)))
+        md5.update(value)
+
+    for name in sorted(message_attributes):
+        attribute = message_attributes[name]
+        data_type = attribute['DataType']
+        update(name.encode('utf-8'))
+        update(data_type.encode('utf-8'))
+        if data_type.startswith('Binary'):
+            value = attribute['BinaryValue']
+            if isinstance(value, str):
+                value = base64.b64decode(value)
+            md5.update(b'\x02')
+            update(value)
+        else:
+            md5.update(b'\x01')
+            update(attribute['StringValue'].encode('utf-8'))
+    return md5.hexdigest()
+
+
+def _millis(seconds: float) -> str:
+    return str(int(seconds * 1000))
+
+
+class _Message:
+    __slots__ = (
+        'message_id', 'body', 'md5_of_body', 'message_attributes', 'group_id', 'deduplication_id',
+        'sequence_number', 'sent_at', 'visible_at', 'receive_count', 'first_received_at', 'receipt_handle',
+    )
+
+    def __init__(self, body: str, message_attributes: dict, group_id: Optional[str], deduplication_id: Optional[str],
+                 sequence_number: Optional[str], sent_at: float, visible_at: float):
+        self.message_id = str(uuid.uuid4())
+        self.body = body
+        self.md5_of_body = hashlib.md5(body.encode('utf-8')).hexdigest()
+        self.message_attributes = message_attributes
+        self.group_id = group_id
+        self.deduplication_id = deduplication_id
+        self.sequence_number = sequence_number
+        self.sent_at = sent_at
+        self.visible_at = visible_at
+        self.receive_count = 0
+        self.first_received_at = None
+        self.receipt_handle = None
+
+    def in_flight(self, now: float) -> bool:
+        return self.receive_count > 0 and self.visible_at > now
+
+    def delayed(self, now: float) -> bool:
+        return self.receive_count == 0 and self.visible_at > now
+
+
+class _Queue:
+    def __init__(self, name: str, attributes: dict, created_at: float):
+        self.name = name
+        self.attributes = attributes
+        self.created_at = created_at
+        self.modified_at = created_at
+        self.messages: Dict[str, _Message] = OrderedDict()
+        # deduplication id -> (expires at, message id, sequence number)
+        self.deduplications: Dict[tuple, tuple] = {}
+        # receipt handle -> message id, for every receipt handle issued
+        self.receipt_handles: Dict[str, str] = {}
+
+    @property
+    def fifo(self) -> bool:
+        return self.attributes.get('FifoQueue') == 'true'
+
+    def int_attribute(self, name: str) -> int:
+        return int(self.attributes[name])
+
+    def expire(self, now: float):
+        """
+        Drop messages beyond the retention period and deduplication ids beyond the deduplication interval.
+        """
+        retention = self.int_attribute('MessageRetentionPeriod')
+        expired = [m.message_id for m in self.messages.values() if m.sent_at + retention <= now]
+        for message_id in expired:
+            del self.messages[message_id]
+        if self.deduplications:
+            self.deduplications = {k: v for k, v in self.deduplications.items() if v[0] > now}
+
+    def next_change_at(self, now: float) -> Optional[float]:
+        """
+        The earliest time after now when a message becomes visible.
+        """
+        times = [m.visible_at for m in self.messages.values() if m.visible_at > now]
+        return min(times) if times else None
+
+
+class LocalSqs:
+    """
+    The queues and the SQS API.
+    Methods take and return the same parameters and responses as the boto3 SQS client, without ResponseMetadata.
+    """
+
+    def __init__(self, clock=None, region: str = DEFAULT_REGION, account_id: str = DEFAULT_ACCOUNT_ID,
+                 endpoint_url: Optional[str] = None):
+        self.clock = clock or SystemClock()
+        self.region = region
+        self.account_id = account_id
+        self.endpoint_url = endpoint_url or f'https://sqs.{region}.amazonaws.com'
+        self._queues: Dict[str, _Queue] = {}
+        self._sequence = 0
+        self._lock = threading.RLock()
+        self._condition = threading.Condition(self._lock)
+
+    # Queues
+
+    def queue_url(self, queue_name: str) -> str:
+        return f'{self.endpoint_url}/{self.account_id}/{queue_name}'
+
+    def queue_arn(self, queue_name: str) -> str:
+        return f'arn:aws:sqs:{self.region}:{self.account_id}:{queue_name}'
+
+    def _queue(self, queue_url: str) -> _Queue:
+        name = queue_url.rstrip('/').rsplit('/', 1)[-1]
+        queue = self._queues.get(name)
+        if queue is None:
+            raise _queue_does_not_exist()
+        queue.expire(self.clock.time())
+        return queue
+
+    def _queue_by_arn(self, arn: str) -> _Queue:
+        queue = self._queues.get(arn.rsplit(':', 1)[-1])
+        if queue is None:
+            raise _queue_does_not_exist()
+        return queue
+
+    def create_queue(self, QueueName: str, Attributes: Optional[dict] = None, tags: Optional[dict] = None) -> dict:
+        attributes = dict(DEFAULT_QUEUE_ATTRIBUTES)
+        requested = {k: str(v).lower() if isinstance(v, bool) else str(v) for k, v in (Attributes or {}).items()}
+        if requested.get('FifoQueue') == 'true':
+            if not QueueName.endswith('.fifo'):
+                raise _invalid_parameter('The name of a FIFO queue can only include alphanumeric characters, '
+                                         'hyphens, or underscores, must end with .fifo suffix.')
+            attributes.update(DEFAULT_FIFO_QUEUE_ATTRIBUTES)
+        elif QueueName.endswith('.fifo'):
+            raise _invalid_parameter('The FifoQueue attribute must be true for a queue name ending with .fifo.')
+        attributes.update(requested)
+        with self._lock:
+            existing = self._queues.get(QueueName)
+            if existing is not None:
+                if any(existing.attributes.get(k) != v for k, v in requested.items()):
+                    raise LocalSqsError('QueueNameExists',
+                                        'A queue already exists with the same name and a different value for attribute(s).',
+                                        'QueueAlreadyExists')
+            else:
+                self._queues[QueueName] = _Queue(QueueName, attributes, self.clock.time())
+        return {'QueueUrl': self.queue_url(QueueName)}
+
+    def get_queue_url(self, QueueName: str, QueueOwnerAWSAccountId: Optional[str] = None) -> dict:
+        with self._lock:
+            if QueueName not in self._queues:
+                raise _queue_does_not_exist()
+        return {'QueueUrl': self.queue_url(QueueName)}
+
+    def list_queues(self, QueueNamePrefix: str = '', MaxResults: Optional[int] = None, NextToken: Optional[str] = None) -> dict:
+        with self._lock:
+            urls = [self.queue_url(name) for name in sorted(self._queues) if name.startswith(QueueNamePrefix)]
+        if MaxResults is not None:
+            urls = urls[:MaxResults]
+        return {'QueueUrls': urls} if urls else {}
+
+    def delete_queue(self, QueueUrl: str) -> dict:
+        with self._lock:
+            queue = self._queue(QueueUrl)
+            del self._queues[queue.name]
+        return {}
+
+    def purge_queue(self, QueueUrl: str) -> dict:
+        with self._lock:
+            self._queue(QueueUrl).messages.clear()
+            self._condition.notify_all()
+        return {}
+
+    def get_queue_attributes(self, QueueUrl: str, AttributeNames: Optional[List[str]] = None) -> dict:
+        with self._lock:
+            queue = self._queue(QueueUrl)
+            now = self.clock.time()
+            attributes = dict(queue.attributes)
+            attributes.update({
+                'ApproximateNumberOfMessages': str(sum(
+                    1 for m in queue.messages.values() if m.visible_at <= now)),
+                'ApproximateNumberOfMessagesNotVisible': str(sum(
+                    1 for m in queue.messages.values() if m.in_flight(now))),
+                'ApproximateNumberOfMessagesDelayed': str(sum(
+                    1 for m in queue.messages.values() if m.delayed(now))),
+                'CreatedTimestamp': str(int(queue.created_at)),
+                'LastModifiedTimestamp': str(int(queue.modified_at)),
+                'QueueArn': self.queue_arn(queue.name),
+            })
+        names = AttributeNames or []
+        if 'All' not in names:
+            attributes = {k: v for k, v in attributes.items() if k in names}
+        return {'Attributes': attributes} if attributes else {}
+
+    def set_queue_attributes(self, QueueUrl: str, Attributes: dict) -> dict:
+        with self._lock:
+            queue = self._queue(QueueUrl)
+            if 'FifoQueue' in Attributes and str(Attributes['FifoQueue']).lower() != queue.attributes.get('FifoQueue', 'false'):
+                raise _invalid_parameter('Invalid value for the parameter FifoQueue. Reason: Modifying queue type is not supported.')
+            queue.attributes.update({k: str(v) for k, v in Attributes.items()})
+            queue.modified_at = self.clock.time()
+            self._condition.notify_all()
+        return {}
+
+    # Sending
+
+    def _enqueue(self, queue: _Queue, body: str, delay_seconds: Optional[int], message_attributes: Optional[dict],
+                 deduplication_id: Optional[str], group_id: Optional[str]) -> dict:
+        now = self.clock.time()
+        scope = None
+        if not body:
+            raise _missing_parameter('The request must contain the parameter MessageBody.')
+        if len(body.encode('utf-8')) > queue.int_attribute('MaximumMessageSize'):
+            raise _invalid_parameter('One or more parameters are invalid. '
+                                     'Reason: Message must be shorter than the maximum message size.')
+        if queue.fifo:
+            if group_id is None:
+                raise _missing_parameter('The request must contain the parameter MessageGroupId.')
+            if delay_seconds:
+                raise _invalid_parameter('Value for parameter DelaySeconds is invalid. '
+                                         'Reason: The request include parameter that is not valid for this queue type.')
+            if deduplication_id is None:
+                if queue.attributes.get('ContentBasedDeduplication') != 'true':
+                    raise _invalid_parameter('The queue should either have ContentBasedDeduplication enabled '
+                                             'or MessageDeduplicationId provided explicitly')
+                deduplication_id = hashlib.sha256(body.encode('utf-8')).hexdigest()
+            scope = group_id if queue.attributes.get('DeduplicationScope') == 'messageGroup' else None
+            duplicate = queue.deduplications.get((scope, deduplication_id))
+            if duplicate is not None:
+                _, message_id, sequence_number = duplicate
+                return {
+                    'MD5OfMessageBody': hashlib.md5(body.encode('utf-8')).hexdigest(),
+                    'MessageId': message_id,
+                    'SequenceNumber': sequence_number,
+                }
+        elif group_id is not None or deduplication_id is not None:
+            raise _invalid_parameter('The request include parameter that is not valid for this queue type.')
+
+        if delay_seconds is None:
+            delay_seconds = queue.int_attribute('DelaySeconds')
+        sequence_number = None
+        if queue.fifo:
+            self._sequence += 1
+            sequence_number = f'{self._sequence:020d}'
+        message = _Message(body, message_attributes or {}, group_id, deduplication_id, sequence_number, now,
+                           now + int(delay_seconds))
+        queue.messages[message.message_id] = message
+        if queue.fifo:
+            queue.deduplications[(scope, deduplication_id)] = (
+                now + DEDUPLICATION_INTERVAL, message.message_id, sequence_number)
+        self._condition.notify_all()
+
+        sent = {'MD5OfMessageBody': message.md5_of_body, 'MessageId': message.message_id}
+        if message.message_attributes:
+            sent['MD5OfMessageAttributes'] = md5_of_message_attributes(message.message_attributes)
+        if sequence_number is not None:
+            sent['SequenceNumber'] = sequence_number
+        return sent
+
+    def send_message(self, QueueUrl: str, MessageBody: str, DelaySeconds: Optional[int] = None,
+                     MessageAttributes: Optional[dict] = None, MessageSystemAttributes: Optional[dict] = None,
+                     MessageDeduplicationId: Optional[str] = None, MessageGroupId: Optional[str] = None) -> dict:
+        with self._lock:
+            queue = self._queue(QueueUrl)
+            return self._enqueue(queue, MessageBody, DelaySeconds, MessageAttributes, MessageDeduplicationId,
+                                 MessageGroupId)
+
+    @staticmethod
+    def _check_batch(entries: List[dict]):
+        if not entries:
+            raise LocalSqsError('EmptyBatchRequest', 'There should be at least one SendMessageBatchRequestEntry in the request.',
+                                'AWS.SimpleQueueService.EmptyBatchRequest')
+        if len(entries) > MAX_BATCH_ENTRIES:
+            raise LocalSqsError('TooManyEntriesInBatchRequest',
+                                f'Maximum number of entries per request are {MAX_BATCH_ENTRIES}. '
+                                f'You have sent {len(entries)}.',
+                                'AWS.SimpleQueueService.TooManyEntriesInBatchRequest')
+        ids = [entry['Id'] for entry in entries]
+        if len(set(ids)) != len(ids):
+            raise LocalSqsError('BatchEntryIdsNotDistinct', 'Id should be unique in a single batch request.',
+                                'AWS.SimpleQueueService.BatchEntryIdsNotDistinct')
+
+    @staticmethod
+    def _batch_failure(entry: dict, error: LocalSqsError) -> dict:
+        return {'Id': entry['Id'], 'SenderFault': error.sender_fault, 'Code': error.query_code, 'Message': error.message}
+
+    def send_message_batch(self, QueueUrl: str, Entries: List[dict]) -> dict:
+        self._check_batch(Entries)
+        with self._lock:
+            queue = self._queue(QueueUrl)
+            total = sum(len(entry['MessageBody'].encode('utf-8')) for entry in Entries)
+            if total > queue.int_attribute('MaximumMessageSize'):
+                raise LocalSqsError('BatchRequestTooLong', 'Batch requests cannot be longer than 262144 bytes.',
+                                    'AWS.SimpleQueueService.BatchRequestTooLong')
+            successful, failed = [], []
+            for entry in Entries:
+                try:
+                    sent = self._enqueue(queue, entry['MessageBody'], entry.get('DelaySeconds'),
+                                         entry.get('MessageAttributes'), entry.get('MessageDeduplicationId'),
+                                         entry.get('MessageGroupId'))
+                except LocalSqsError as e:
+                    failed.append(self._batch_failure(entry, e))
+                else:
+                    successful.append(dict(sent, Id=entry['Id']))
+        return {'Successful': successful, 'Failed': failed}
+
+    # Receiving
+
+    def _receivable(self, queue: _Queue, now: float, max_number: int) -> List[_Message]:
+        """
+        Pick messages to receive. In a FIFO queue, a group whose earlier message is in flight or delayed is locked.
+        """
+        picked = []
+        locked = set()
+        for message in queue.messages.values():
+            if len(picked) >= max_number:
+                break
+            if queue.fifo and message.group_id in locked:
+                continue
+            if message.visible_at > now:
+                if queue.fifo:
+                    locked.add(message.group_id)
+                continue
+            picked.append(message)
+        return picked
+
+    def _dead_letter(self, queue: _Queue, message: _Message) -> bool:
+        """
+        Move the message to the dead-letter queue if it has been received maxReceiveCount times.
+        """
+        redrive_policy = queue.attributes.get('RedrivePolicy')
+        if not redrive_policy:
+            return False
+        policy = json.loads(redrive_policy)
+        if message.receive_count < int(policy['maxReceiveCount']):
+            return False
+        dead_letter_queue = self._queue_by_arn(policy['deadLetterTargetArn'])
+        del queue.messages[message.message_id]
+        message.visible_at = self.clock.time()
+        dead_letter_queue.messages[message.message_id] = message
+        return True
+
+    def _to_response(self, message: _Message, system_attribute_names: List[str],
+                     message_attribute_names: List[str]) -> dict:
+        received = {
+            'MessageId': message.message_id,
+            'ReceiptHandle': message.receipt_handle,
+            'MD5OfBody': message.md5_of_body,
+            'Body': message.body,
+        }
+        if system_attribute_names:
+            attributes = {
+                'SenderId': SENDER_ID,
+                'SentTimestamp': _millis(message.sent_at),
+                'ApproximateReceiveCount': str(message.receive_count),
+                'ApproximateFirstReceiveTimestamp': _millis(message.first_received_at),
+            }
+            if message.sequence_number is not None:
+                attributes.update({
+                    'SequenceNumber': message.sequence_number,
+                    'MessageDeduplicationId': message.deduplication_id,
+                    'MessageGroupId': message.group_id,
+                })
+            if 'All' not in system_attribute_names:
+                attributes = {k: v for k, v in attributes.items() if k in system_attribute_names}
+            if attributes:
+                received['Attributes'] = attributes
+        if message_attribute_names and message.message_attributes:
+            patterns = [re.compile(re.escape(name[:-2]) + r'\..*' if name.endswith('.*') else re.escape(name))
+                        for name in message_attribute_names if name not in ('All', '.*')]
+            if 'All' in message_attribute_names or '.*' in message_attribute_names:
+                attributes = message.message_attributes
+            else:
+                attributes = {k: v for k, v in message.message_attributes.items()
+                              if any(p.fullmatch(k) for p in patterns)}
+            if attributes:
+                received['MessageAttributes'] = attributes
+                received['MD5OfMessageAttributes'] = md5_of_message_attributes(attributes)
+        return received
+
+    def receive_message(self, QueueUrl: str, AttributeNames: Optional[List[str]] = None,
+                        MessageSystemAttributeNames: Optional[List[str]] = None,
+                        MessageAttributeNames: Optional[List[str]] = None, MaxNumberOfMessages: int = 1,
+                        VisibilityTimeout: Optional[int] = None, WaitTimeSeconds: Optional[int] = None,
+                        ReceiveRequestAttemptId: Optional[str] = None) -> dict:
+        if not 1 <= MaxNumberOfMessages <= MAX_BATCH_ENTRIES:
+            raise _invalid_parameter(f'Value {MaxNumberOfMessages} for parameter MaxNumberOfMessages is invalid. '
+                                     f'Reason: Must be between 1 and {MAX_BATCH_ENTRIES}, if provided.')
+        system_attribute_names = list(AttributeNames or []) + list(MessageSystemAttributeNames or [])
+        with self._lock:
+            queue = self._queue(QueueUrl)
+            if WaitTimeSeconds is None:
+                WaitTimeSeconds = queue.int_attribute('ReceiveMessageWaitTimeSeconds')
+            if not 0 <= WaitTimeSeconds <= MAX_WAIT_TIME_SECONDS:
+                raise _invalid_parameter(f'Value {WaitTimeSeconds} for parameter WaitTimeSeconds is invalid. '
+                                         f'Reason: Must be >= 0 and <= {MAX_WAIT_TIME_SECONDS}, if provided.')
+            deadline = self.clock.time() + WaitTimeSeconds
+            while True:
+                now = self.clock.time()
+                queue.expire(now)
+                picked = [m for m in self._receivable(queue, now, MaxNumberOfMessages)
+                          if not self._dead_letter(queue, m)]
+                if picked or now >= deadline:
+                    break
+                next_change_at = queue.next_change_at(now)
+                until = deadline if next_change_at is None else min(deadline, next_change_at)
+                self.clock.wait(self._condition, until - now)
+                # A queue may be deleted while waiting.
+                queue = self._queue(QueueUrl)
+
+            visibility_timeout = queue.int_attribute('VisibilityTimeout') if VisibilityTimeout is None else VisibilityTimeout
+            received = []
+            for message in picked:
+                message.receive_count += 1
+                if message.first_received_at is None:
+                    message.first_received_at = now
+                message.visible_at = now + visibility_timeout
+                message.receipt_handle = base64.b64encode(uuid.uuid4().bytes + message.message_id.encode()).decode()
+                queue.receipt_handles[message.receipt_handle] = message.message_id
+                received.append(self._to_response(message, system_attribute_names, MessageAttributeNames or []))
+        return {'Messages': received} if received else {}
+
+    # Deleting and visibility
+
+    def _message_by_receipt_handle(self, queue: _Queue, receipt_handle: str) -> Optional[_Message]:
+        message_id = queue.receipt_handles.get(receipt_handle)
+        if message_id is None:
+            raise LocalSqsError('ReceiptHandleIsInvalid', f'The input receipt handle "{receipt_handle}" is not a valid receipt handle.')
+        return queue.messages.get(message_id)
+
+    def _delete(self, queue: _Queue, receipt_handle: str):
+        message = self._message_by_receipt_handle(queue, receipt_handle)
+        queue.receipt_handles.pop(receipt_handle, None)
+        if message is not None and message.receipt_handle == receipt_handle:
+            del queue.messages[message.message_id]
+            self._condition.notify_all()
+
+    def delete_message(self, QueueUrl: str, ReceiptHandle: str) -> dict:
+        with self._lock:
+            self._delete(self._queue(QueueUrl), ReceiptHandle)
+        return {}
+
+    def delete_message_batch(self, QueueUrl: str, Entries: List[dict]) -> dict:
+        self._check_batch(Entries)
+        successful, failed = [], []
+        with self._lock:
+            queue = self._queue(QueueUrl)
+            for entry in Entries:
+                try:
+                    self._delete(queue, entry['ReceiptHandle'])
+                except LocalSqsError as e:
+                    failed.append(self._batch_failure(entry, e))
+                else:
+                    successful.append({'Id': entry['Id']})
+        return {'Successful': successful, 'Failed': failed}
+
+    def _change_visibility(self, queue: _Queue, receipt_handle: str, visibility_timeout: int):
+        now = self.clock.time()
+        message = self._message_by_receipt_handle(queue, receipt_handle)
+        if message is None or message.receipt_handle != receipt_handle or not message.in_flight(now):
+            raise LocalSqsError('MessageNotInflight', 'Message does not exist or is not available for visibility timeout change.',
+                                'AWS.SimpleQueueService.MessageNotInflight')
+        message.visible_at = now + int(visibility_timeout)
+        self._condition.notify_all()
+
+    def change_message_visibility(self, QueueUrl: str, ReceiptHandle: str, VisibilityTimeout: int) -> dict:
+        with self._lock:
+            self._change_visibility(self._queue(QueueUrl), ReceiptHandle, VisibilityTimeout)
+        return {}
+
+    def change_message_visibility_batch(self, QueueUrl: str, Entries: List[dict]) -> dict:
+        self._check_batch(Entries)
+        successful, failed = [], []
+        with self._lock:
+            queue = self._queue(QueueUrl)
+            for entry in Entries:
+                try:
+                    self._change_visibility(queue, entry['ReceiptHandle'], entry['VisibilityTimeout'])
+                except LocalSqsError as e:
+                    failed.append(self._batch_failure(entry, e))
+                else:
+                    successful.append({'Id': entry['Id']})
+        return {'Successful': successful, 'Failed': failed}
+
+    # boto3 integration
+
+    def call(self, operation_name: str, params: dict) -> dict:
+        """
+        Call an operation by its API name, e.g. SendMessage.
+        """
+        method_name = re.sub(r'(?<!^)(?=[A-Z])', '_', operation_name).lower()
+        method = getattr(self, method_name, None)
+        if method is None:
+            raise LocalSqsError('UnsupportedOperation', f'{operation_name} is not supported by LocalSqs.')
+        return method(**params)
+
+    def _capture_params(self, params, context, **kwargs):
+        context['local_sqs_params'] = dict(params)
+
+    def _answer(self, model, context, **kwargs):
+        from botocore.awsrequest import AWSResponse
+
+        metadata = {'RequestId': str(uuid.uuid4()), 'HTTPHeaders': {}, 'RetryAttempts': 0}
+        try:
+            parsed = self.call(model.name, context.pop('local_sqs_params', {}))
+            status_code = 200
+        except LocalSqsError as e:
+            parsed = e.to_response()
+            status_code = 400
+        parsed['ResponseMetadata'] = dict(metadata, HTTPStatusCode=status_code)
+        return AWSResponse(self.endpoint_url, status_code, {}, None), parsed
+
+    def attach(self, events):
+        """
+        Answer SQS calls of a boto3 session, client or resource with this instance, given its event emitter.
+        """
+        events.register('before-parameter-build.sqs', self._capture_params, unique_id='laur-local-sqs-params')
+        events.register('before-call.sqs', self._answer, unique_id='laur-local-sqs-call')
+
+    def _session(self, session=None):
+        import boto3
+
+        return session or boto3.session.Session(
+            aws_access_key_id='local', aws_secret_access_key='local', region_name=self.region)
+
+    def client(self, session=None):
+        """
+        A boto3 SQS client answered by this instance.
+        """
+        client = self._session(session).client('sqs', region_name=self.region)
+        self.attach(client.meta.events)
+        return client
+
+    def resource(self, session=None):
+        """
+        A boto3 SQS service resource answered by this instance.
+        """
+        resource = self._session(session).resource('sqs', region_name=self.region)
+        self.attach(resource.meta.client.meta.events)
+        return resource
+
+    def install(self):
+        """
+        Answer every SQS client and resource created afterwards from the boto3 default session.
+        """
+        import boto3
+
+        boto3.setup_default_session(aws_access_key_id='local', aws_secret_access_key='local', region_name=self.region)
+        self.attach(boto3.DEFAULT_SESSION.events)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    backend: LocalSqs = None
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        params = json.loads(self.rfile.read(length) or b'{}')
+        operation_name = (self.headers.get('X-Amz-Target') or '').rsplit('.', 1)[-1]
+        headers = {'x-amzn-RequestId': str(uuid.uuid4())}
+        try:
+            body = self.backend.call(operation_name, params)
+            status_code = 200
+        except LocalSqsError as e:
+            body = {'__type': f'com.amazonaws.sqs#{e.code}', 'message': e.message}
+            headers['x-amzn-query-error'] = f'{e.query_code};{"Sender" if e.sender_fault else "Receiver"}'
+            status_code = 400
+        except TypeError as e:
+            body = {'__type': 'com.amazonaws.sqs#InvalidParameterValue', 'message': str(e)}
+            headers['x-amzn-query-error'] = 'InvalidParameterValue;Sender'
+            status_code = 400
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/x-amz-json-1.0')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalSqsServer:
+    """
+    Serve a LocalSqs over HTTP with the SQS JSON protocol.
+
+        with LocalSqsServer(LocalSqs()) as server:
+            client = boto3.client('sqs', endpoint_url=server.endpoint_url)
+    """
+
+    def __init__(self, backend: LocalSqs, host: str = '127.0.0.1', port: int = 0):
+        handler = type('RequestHandler', (_RequestHandler,), {'backend': backend})
+        self.backend = backend
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'LocalSqsServer':
+        self.backend.endpoint_url = self.endpoint_url
+        self._thread = threading.Thread(target=self._server.serve_forever, name='laur-local-sqs', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,172 @@
+"""
+Metrics of a Lambda function in CloudWatch Embedded Metric Format (EMF).
+
+Metrics are aggregated in memory during an invocation and written to stdout as JSON lines once at its end.
+CloudWatch Logs extracts them into metrics, so nothing calls PutMetricData and nothing waits for CloudWatch.
+ * count() adds up a counter, e.g. failed records.
+ * observe() collects values of a distribution, e.g. processing time per record.
+   They are emitted as arrays of values, so that CloudWatch computes percentiles over all records.
+
+    metrics = EmfMetrics.from_env()
+
+    def lambda_handler(event, context):
+        metrics.observe_records(event['Records'])
+        try:
+            ...
+        finally:
+            metrics.flush()
+
+Environment variables: METRICS_NAMESPACE, and APP_ID, APP_ENV and AWS_LAMBDA_FUNCTION_NAME as dimensions.
+
+For the format, see https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional
+
+DEFAULT_NAMESPACE = 'tryaws'
+# The maximum number of values of a metric in a document.
+MAX_VALUES = 100
+MAX_DIMENSIONS = 30
+
+COUNT = 'Count'
+MILLISECONDS = 'Milliseconds'
+
+
+class EmfMetrics:
+    """
+    Counters and distributions of an invocation. Thread safe, so records processed in parallel can report to it.
+    """
+
+    def __init__(self, namespace: str = DEFAULT_NAMESPACE, dimensions: Optional[Dict[str, str]] = None, stream=None):
+        self.namespace = namespace
+        self.dimensions = OrderedDict(dimensions or {})
+        if len(self.dimensions) > MAX_DIMENSIONS:
+            raise ValueError(f'A dimension set has at most {MAX_DIMENSIONS} dimensions')
+        self.stream = stream
+        self.properties = {}
+        self._counters: Dict[str, list] = OrderedDict()
+        self._values: Dict[str, list] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> 'EmfMetrics':
+        dimensions = OrderedDict((name, os.environ[env]) for name, env in (
+            ('AppId', 'APP_ID'), ('AppEnv', 'APP_ENV'), ('FunctionName', 'AWS_LAMBDA_FUNCTION_NAME'),
+        ) if os.environ.get(env))
+        return cls(namespace=os.environ.get('METRICS_NAMESPACE', DEFAULT_NAMESPACE), dimensions=dimensions, **kwargs)
+
+    def count(self, name: str, value: float = 1, unit: str = COUNT):
+        with self._lock:
+            counter = self._counters.get(name)
+            if counter is None:
+                self._counters[name] = [unit, value]
+            else:
+                counter[1] += value
+
+    def observe(self, name: str, value: float, unit: str = MILLISECONDS):
+        with self._lock:
+            values = self._values.get(name)
+            if values is None:
+                self._values[name] = [unit, [value]]
+            else:
+                values[1].append(value)
+
+    def timed(self, name: str) -> Callable[[Callable], Callable]:
+        """
+        A decorator observing the milliseconds each call takes, whether it returns or raises.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started_at = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, (time.perf_counter() - started_at) * 1000)
+
+            return wrapper
+
+        return decorator
+
+    def observe_records(self, records: Iterable[dict], now: Optional[float] = None):
+        """
+        Count a batch and observe for each record
+         * QueueDwellTime, from when it was sent until it was first received, and
+         * MessageAge, from when it was sent until now, which includes earlier failed attempts.
+        """
+        now_ms = (time.time() if now is None else now) * 1000
+        dwell_times, ages = [], []
+        for record in records:
+            attributes = record.get('attributes', {})
+            sent_at = attributes.get('SentTimestamp')
+            if sent_at is None:
+                continue
+            sent_at = int(sent_at)
+            first_received_at = attributes.get('ApproximateFirstReceiveTimestamp')
+            if first_received_at is not None:
+                dwell_times.append(max(int(first_received_at) - sent_at, 0))
+            ages.append(max(now_ms - sent_at, 0))
+        with self._lock:
+            for name, values in (('QueueDwellTime', dwell_times), ('MessageAge', ages)):
+                if values:
+                    self._values.setdefault(name, [MILLISECONDS, []])[1].extend(values)
+        self.count('BatchSize', len(ages))
+
+    def set_property(self, name: str, value):
+        """
+        Add a field to the documents that is not a metric, e.g. a request id to search logs by.
+        """
+        self.properties[name] = value
+
+    def documents(self, timestamp: Optional[float] = None) -> List[dict]:
+        """
+        Build EMF documents of the metrics so far and clear them.
+        A distribution longer than MAX_VALUES is split over several documents.
+        """
+        with self._lock:
+            counters, self._counters = self._counters, OrderedDict()
+            values, self._values = self._values, OrderedDict()
+            properties, self.properties = self.properties, {}
+        timestamp_ms = int((time.time() if timestamp is None else timestamp) * 1000)
+
+        documents = []
+        chunks = max([(len(v) + MAX_VALUES - 1) // MAX_VALUES for _, v in values.values()] + [1 if counters else 0])
+        for chunk in range(chunks):
+            document = {name: value for name, value in properties.items() if value is not None}
+            document.update(self.dimensions)
+            definitions = []
+            if chunk == 0:
+                for name, (unit, value) in counters.items():
+                    document[name] = value
+                    definitions.append({'Name': name, 'Unit': unit})
+            for name, (unit, observed) in values.items():
+                part = observed[chunk * MAX_VALUES:(chunk + 1) * MAX_VALUES]
+                if part:
+                    document[name] = part
+                    definitions.append({'Name': name, 'Unit': unit})
+            document['_aws'] = {
+                'Timestamp': timestamp_ms,
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [list(self.dimensions)],
+                    'Metrics': definitions,
+                }],
+            }
+            documents.append(document)
+        return documents
+
+    def flush(self, timestamp: Optional[float] = None):
+        """
+        Write the metrics so far to stdout, one document per line, and clear them.
+        """
+        documents = self.documents(timestamp)
+        if documents:
+            stream = self.stream or sys.stdout
+            stream.write(''.join(json.dumps(document, separators=(',', ':')) + '\n' for document in documents))
+            stream.flush()
@@ -0,0 +1,135 @@
+"""
+Mapping of business entity keys to a fixed number of MessageGroupIds of a FIFO queue.
+
+A FIFO queue runs at most as many consumers in parallel as it has active message groups.
+One group for everything serializes all messages, while a group per entity makes groups nobody can size.
+A partitioner maps each entity key to one of N groups, so that the messages of an entity stay in order
+and the load spreads evenly over N groups. Pick N around the MaximumConcurrency of the event source mapping.
+
+Keys are placed by jump consistent hashing, which balances keys evenly and, when N changes from n to m,
+moves only the |m - n| / max(m, n) fraction of keys the minimum requires.
+Keep in mind that a moved key may have messages in both its old and new group while resizing.
+
+    partitioner = GroupPartitioner(groups=100)
+    producer.send([{'MessageBody': body, 'MessageGroupId': partitioner.group_id(order['customerId'])}])
+
+For jump consistent hashing, see https://arxiv.org/abs/1406.2294
+"""
+import hashlib
+import struct
+from typing import Callable, Iterable, List, Optional
+
+DEFAULT_PREFIX = 'message-group-id-'
+
+
+def key_hash(key: str) -> int:
+    """
+    A 64 bit hash of a key, stable across processes unlike hash().
+    """
+    return struct.unpack('<Q', hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest())[0]
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    The bucket in [0, buckets) of a 64 bit key by jump consistent hashing.
+    """
+    if buckets < 1:
+        raise ValueError(f'buckets must be 1 or more: {buckets}')
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+class SkewReport:
+    """
+    How evenly a load is spread over groups. ratio is the largest group over the mean, 1.0 is perfectly even.
+    """
+
+    def __init__(self, counts: List[float]):
+        self.counts = counts
+        self.total = sum(counts)
+        self.mean = self.total / len(counts) if counts else 0.0
+
+    @property
+    def max(self) -> float:
+        return max(self.counts) if self.counts else 0.0
+
+    @property
+    def ratio(self) -> float:
+        return self.max / self.mean if self.mean else 0.0
+
+    @property
+    def empty_groups(self) -> int:
+        return sum(1 for count in self.counts if not count)
+
+    def hot_groups(self, threshold: float = 1.5) -> List[int]:
+        """
+        Indexes of groups with more than threshold times the mean.
+        """
+        return [idx for idx, count in enumerate(self.counts) if self.mean and count > self.mean * threshold]
+
+    def to_dict(self) -> dict:
+        return {
+            'groups': len(self.counts),
+            'total': self.total,
+            'mean': round(self.mean, 3),
+            'max': self.max,
+            'ratio': round(self.ratio, 3),
+            'emptyGroups': self.empty_groups,
+            'hotGroups': self.hot_groups(),
+        }
+
+
+class GroupPartitioner:
+    """
+    Map entity keys to group ids `{prefix}{index}` for index in [0, groups).
+    """
+
+    def __init__(self, groups: int, prefix: str = DEFAULT_PREFIX):
+        if groups < 1:
+            raise ValueError(f'groups must be 1 or more: {groups}')
+        self.groups = groups
+        self.prefix = prefix
+
+    def group_index(self, key: str) -> int:
+        return jump_hash(key_hash(key), self.groups)
+
+    def group_id(self, key: str) -> str:
+        return f'{self.prefix}{self.group_index(key)}'
+
+    def assign(self, entries: Iterable[dict], key_of: Callable[[dict], str]) -> List[dict]:
+        """
+        Set MessageGroupId of send entries from their entity keys.
+        """
+        assigned = []
+        for entry in entries:
+            assigned.append(dict(entry, MessageGroupId=self.group_id(key_of(entry))))
+        return assigned
+
+    def skew(self, keys: Iterable[str], weights: Optional[Iterable[float]] = None) -> SkewReport:
+        """
+        Report the spread of keys, e.g. entity keys of a day of messages, optionally weighted e.g. by message count.
+        """
+        counts = [0] * self.groups
+        weights = iter(weights) if weights is not None else None
+        for key in keys:
+            counts[self.group_index(key)] += next(weights) if weights is not None else 1
+        return SkewReport(counts)
+
+    def resized(self, groups: int) -> 'GroupPartitioner':
+        return GroupPartitioner(groups, self.prefix)
+
+    def moved_fraction(self, keys: Iterable[str], groups: int) -> float:
+        """
+        The fraction of keys that would move to another group if the number of groups changed.
+        """
+        other = self.resized(groups)
+        total = moved = 0
+        for key in keys:
+            total += 1
+            if self.group_index(key) != other.group_index(key):
+                moved += 1
+        return moved / total if total else 0.0
@@ -0,0 +1,313 @@
+"""
+Bulk SQS producer packing messages into SendMessageBatch calls.
+
+Messages are spread over lanes, one per worker. A FIFO message group always goes to the same lane,
+and a lane sends its batches one after another, so messages of a group are sent in order
+while lanes are sent in parallel. Once a message of a FIFO group fails, the later messages of the group
+are not sent but failed with PRECEDING_MESSAGE_FAILED, so that the group is never sent out of order.
+
+    producer = BatchProducer(queue_url)
+    result = producer.send({'MessageBody': body, 'MessageGroupId': group_id} for body, group_id in items)
+
+For the limits of SendMessageBatch,
+see https://docs.aws.amazon.com/AWSSimpleQueueService/latest/APIReference/API_SendMessageBatch.html
+"""
+import hashlib
+import logging
+import random
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 262144
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_ATTEMPTS = 3
+PRECEDING_MESSAGE_FAILED = 'PrecedingMessageFailed'
+RETRYABLE_ERROR_CODES = {
+    'RequestThrottled',
+    'ThrottlingException',
+    'KmsThrottled',
+    'InternalError',
+    'ServiceUnavailable',
+}
+
+
+def entry_size(entry: dict) -> int:
+    """
+    The size of an entry counted against the limit of a batch: the body and the names, types and values of attributes.
+    """
+    size = len(entry['MessageBody'].encode('utf-8'))
+    for name, attribute in entry.get('MessageAttributes', {}).items():
+        size += len(name.encode('utf-8')) + len(attribute['DataType'].encode('utf-8'))
+        value = attribute.get('StringValue')
+        if value is not None:
+            size += len(value.encode('utf-8'))
+        else:
+            size += len(attribute.get('BinaryValue', b''))
+    return size
+
+
+def content_deduplication_id(entry: dict) -> str:
+    """
+    The same id as content-based deduplication, the SHA-256 hash of the body.
+    """
+    return hashlib.sha256(entry['MessageBody'].encode('utf-8')).hexdigest()
+
+
+def unique_deduplication_id(entry: dict) -> str:
+    """
+    An id that makes every message distinct, even with the same body.
+    """
+    return uuid.uuid4().hex
+
+
+DEDUPLICATION_ID_FACTORIES = {
+    'content': content_deduplication_id,
+    'unique': unique_deduplication_id,
+}
+
+
+class SendResult:
+    """
+    Result of sending messages. Entries of successful and failed have Id, the position of the message in the iterable.
+    """
+
+    def __init__(self):
+        self.successful: List[dict] = []
+        self.failed: List[dict] = []
+        self.calls = 0
+
+    def merge(self, other: 'SendResult'):
+        self.successful.extend(other.successful)
+        self.failed.extend(other.failed)
+        self.calls += other.calls
+
+    def __repr__(self):
+        return f'<SendResult successful={len(self.successful)} failed={len(self.failed)} calls={self.calls}>'
+
+
+def preceding_failure(entry: dict) -> dict:
+    """
+    The failure of an entry not sent since an earlier entry of its message group failed.
+    """
+    return {'Id': entry['Id'], 'Code': PRECEDING_MESSAGE_FAILED, 'SenderFault': True,
+            'Message': f'An earlier message of group {entry["MessageGroupId"]} was not sent'}
+
+
+class BatchProducer:
+    """
+    Send messages to a queue with SendMessageBatch.
+
+    deduplication decides MessageDeduplicationId of a FIFO message that has none: 'content', 'unique' or a callable.
+    The id is given before the first attempt, so that a retried entry is deduplicated by SQS if it was actually sent.
+    Only entries that failed by a fault of SQS are retried, up to max_attempts times in all. A failed FIFO entry
+    is not retried if a later entry of its group in the same batch was accepted, since it would arrive after it.
+    A laur.claimcheck.ClaimCheck offloads long bodies, and deletes the blobs of messages that failed to be sent.
+    """
+
+    def __init__(self, queue_url: str, client=None, max_workers: int = DEFAULT_MAX_WORKERS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 deduplication: Union[str, Callable[[dict], str]] = 'content', claim_check=None):
+        if max_workers < 1:
+            raise ValueError(f'max_workers must be 1 or more: {max_workers}')
+        self.queue_url = queue_url
+        self.fifo = queue_url.endswith('.fifo')
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.deduplication_id = DEDUPLICATION_ID_FACTORIES.get(deduplication, deduplication)
+        if not callable(self.deduplication_id):
+            raise ValueError(f'Unknown deduplication: {deduplication}')
+        self.claim_check = claim_check
+        self._client = client
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from laur.runtime import get_client
+
+            self._client = get_client('sqs')
+        return self._client
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='laur-producer')
+        return self._executor
+
+    def _entry(self, index: int, message: Union[str, dict]) -> dict:
+        entry = {'MessageBody': message} if isinstance(message, str) else dict(message)
+        entry['Id'] = str(index)
+        if self.fifo:
+            if 'MessageGroupId' not in entry:
+                raise ValueError(f'MessageGroupId is required for a FIFO queue: message {index}')
+            if 'MessageDeduplicationId' not in entry:
+                entry['MessageDeduplicationId'] = self.deduplication_id(entry)
+        return entry
+
+    def _lane_of(self, index: int, entry: dict) -> int:
+        if self.fifo:
+            return zlib.crc32(entry['MessageGroupId'].encode('utf-8')) % self.max_workers
+        return index % self.max_workers
+
+    @staticmethod
+    def pack(entries: Iterable[dict]) -> List[List[dict]]:
+        """
+        Pack entries in order into batches within the limits of the number of entries and the total size.
+        """
+        batches = []
+        batch, batch_size = [], 0
+        for entry in entries:
+            size = entry_size(entry)
+            if batch and (len(batch) >= MAX_BATCH_ENTRIES or batch_size + size > MAX_BATCH_BYTES):
+                batches.append(batch)
+                batch, batch_size = [], 0
+            batch.append(entry)
+            batch_size += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _send_batch(self, batch: List[dict], result: SendResult) -> List[Tuple[dict, dict]]:
+        """
+        Send a batch and return entries to retry with their failures.
+        """
+        from botocore.exceptions import ClientError
+
+        result.calls += 1
+        try:
+            response = self.client.send_message_batch(QueueUrl=self.queue_url, Entries=batch)
+        except ClientError as e:
+            error = e.response.get('Error', {})
+            code = error.get('Code', '')
+            failures = [{'Id': entry['Id'], 'Code': code, 'Message': error.get('Message', ''),
+                         'SenderFault': code not in RETRYABLE_ERROR_CODES} for entry in batch]
+            response = {'Successful': [], 'Failed': failures}
+
+        result.successful.extend(response.get('Successful', []))
+        entries = {entry['Id']: entry for entry in batch}
+        retries = []
+        for failure in response.get('Failed', []):
+            if failure.get('SenderFault'):
+                result.failed.append(failure)
+            else:
+                retries.append((entries[failure['Id']], failure))
+        # Retry in the original order to keep the order in a group as far as possible.
+        retries.sort(key=lambda retry: int(retry[0]['Id']))
+        return retries
+
+    def _skip_failed_groups(self, batch: List[dict], failed_groups: set, result: SendResult) -> List[dict]:
+        """
+        Fail the entries of groups with a failed entry and return the others.
+        """
+        if not failed_groups:
+            return batch
+        left = []
+        for entry in batch:
+            if entry['MessageGroupId'] in failed_groups:
+                result.failed.append(preceding_failure(entry))
+            else:
+                left.append(entry)
+        return left
+
+    def _retries_in_order(self, batch: List[dict], retries: List[Tuple[dict, dict]], rejected: set,
+                          failed_groups: set, result: SendResult) -> List[Tuple[dict, dict]]:
+        """
+        The retries that can be sent without overtaking an accepted entry of their group, failing the others.
+        """
+        accepted_after = set()
+        overtaken = set()
+        for entry in reversed(batch):
+            group = entry['MessageGroupId']
+            if entry['Id'] not in rejected:
+                accepted_after.add(group)
+            elif group in accepted_after:
+                overtaken.add(entry['Id'])
+        left = []
+        for entry, failure in retries:
+            if entry['Id'] in overtaken:
+                result.failed.append(failure)
+                failed_groups.add(entry['MessageGroupId'])
+            else:
+                left.append((entry, failure))
+        return left
+
+    def _send_lane(self, entries: List[dict]) -> SendResult:
+        result = SendResult()
+        failed_groups = set()
+        entries_by_id = {entry['Id']: entry for entry in entries}
+        for batch in self.pack(entries):
+            for attempt in range(1, self.max_attempts + 1):
+                if self.fifo:
+                    batch = self._skip_failed_groups(batch, failed_groups, result)
+                    if not batch:
+                        break
+                failed_before = len(result.failed)
+                retries = self._send_batch(batch, result)
+                if self.fifo:
+                    failures = result.failed[failed_before:]
+                    failed_groups.update(entries_by_id[failure['Id']]['MessageGroupId'] for failure in failures)
+                    rejected = {failure['Id'] for failure in failures} | {entry['Id'] for entry, _ in retries}
+                    retries = self._retries_in_order(batch, retries, rejected, failed_groups, result)
+                if not retries:
+                    break
+                if attempt == self.max_attempts:
+                    result.failed.extend(failure for _, failure in retries)
+                    if self.fifo:
+                        failed_groups.update(entry['MessageGroupId'] for entry, _ in retries)
+                    break
+                logger.info('Retrying %d entries of a batch, attempt %d', len(retries), attempt + 1)
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+                batch = [entry for entry, _ in retries]
+        return result
+
+    def send(self, messages: Iterable[Union[str, dict]]) -> SendResult:
+        """
+        Send messages, each of which is a body or the parameters of an entry of SendMessageBatch without Id.
+        """
+        result = SendResult()
+        lanes = [[] for _ in range(self.max_workers)]
+        blobs = {}
+        failed_groups = set()
+        for index, message in enumerate(messages):
+            entry = self._entry(index, message)
+            if self.fifo and entry['MessageGroupId'] in failed_groups:
+                result.failed.append(preceding_failure(entry))
+                continue
+            if self.claim_check is not None:
+                entry, uri = self.claim_check.offload(entry)
+                if uri is not None:
+                    blobs[entry['Id']] = uri
+            size = entry_size(entry)
+            if size > MAX_BATCH_BYTES:
+                result.failed.append({'Id': entry['Id'], 'Code': 'InvalidParameterValue', 'SenderFault': True,
+                                      'Message': f'Message must be shorter than {MAX_BATCH_BYTES} bytes: {size}'})
+                if self.fifo:
+                    failed_groups.add(entry['MessageGroupId'])
+                continue
+            lanes[self._lane_of(index, entry)].append(entry)
+
+        lanes = [lane for lane in lanes if lane]
+        if len(lanes) <= 1:
+            lane_results = [self._send_lane(lane) for lane in lanes]
+        else:
+            lane_results = self.executor.map(self._send_lane, lanes)
+        for lane_result in lane_results:
+            result.merge(lane_result)
+
+        result.successful.sort(key=lambda entry: int(entry['Id']))
+        result.failed.sort(key=lambda entry: int(entry['Id']))
+        for failure in result.failed:
+            if failure['Id'] in blobs:
+                self.claim_check.discard(blobs[failure['Id']])
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,309 @@
+"""
+An opt-in sampling profiler of a Lambda handler, dumping profiles of slow invocations.
+
+A sample of invocations is profiled with
+ * cProfile, for the functions of the handler thread by cumulative time,
+ * a stack sampler reading the frames of the handler thread and of threads it started, e.g. the workers of laur.batch,
+   every few milliseconds, into collapsed stacks: `frame;frame;frame count` lines, the input of flamegraph.pl,
+   speedscope or inferno, which cProfile cannot give since it records callers but not whole stacks,
+ * tracemalloc, for the lines that allocated the most memory.
+A profiled invocation that took threshold_ms or longer is dumped to the log as a JSON line wrapped in
+{"laurProfile": ...}, or to a directory, e.g. /tmp, as files of the request id to upload later.
+
+The profiler is created only if PROFILE_SAMPLE_RATE is set and APP_ENV is one of PROFILE_ENVS, so that a disabled
+profiler leaves the handler as it is and costs nothing, and an enabled one costs a random number per invocation
+it does not profile.
+
+    profiler = Profiler.from_env()
+    if profiler is not None:
+        lambda_handler = profiler.profile(lambda_handler)
+
+    flamegraph.pl /tmp/laur-profiles/REQUEST_ID.collapsed > flamegraph.svg
+
+Environment variables: PROFILE_SAMPLE_RATE, PROFILE_ENVS (comma separated), PROFILE_THRESHOLD_MS,
+PROFILE_OUTPUT (log or a directory) and PROFILE_INTERVAL_MS.
+
+For tracemalloc, see https://docs.python.org/3/library/tracemalloc.html
+"""
+import collections
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from functools import wraps
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+# cProfile, pstats, sysconfig, tracemalloc and laur.capture are imported only once an invocation is profiled,
+# since the handler imports this module at a cold start whether or not profiling is enabled.
+if TYPE_CHECKING:
+    import cProfile
+    import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+PROFILE_KEY = 'laurProfile'
+LOG_OUTPUT = 'log'
+DEFAULT_THRESHOLD_MS = 1000
+DEFAULT_INTERVAL_MS = 5
+DEFAULT_TOP = 20
+# Files of at most this many profiles are kept in a directory, since /tmp of Lambda is small.
+DEFAULT_MAX_PROFILES = 20
+
+
+def _label(code) -> str:
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def collapse(frame) -> str:
+    """
+    The stack of a frame, outermost first, separated by semicolons.
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code).replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def _in_stdlib(frame, stdlib: str) -> bool:
+    while frame is not None:
+        if not frame.f_code.co_filename.startswith(stdlib):
+            return False
+        frame = frame.f_back
+    return True
+
+
+class StackSampler:
+    """
+    Count the stacks of the threads of interest every interval seconds, from a thread of its own.
+    A thread other than thread_id is sampled only while it runs code outside the standard library,
+    so that idle workers of a pool are left out.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = DEFAULT_INTERVAL_MS / 1000):
+        import sysconfig
+
+        self.stdlib = sysconfig.get_paths()['stdlib']
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.counts: Dict[str, int] = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (thread_id != self.thread_id and _in_stdlib(frame, self.stdlib)):
+                continue
+            self.counts[collapse(frame)] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='laur-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> List[str]:
+        """
+        Collapsed stacks, the most frequent first.
+        """
+        return [f'{stack} {count}' for stack, count in sorted(self.counts.items(), key=lambda item: -item[1])]
+
+
+def top_functions(profile: 'cProfile.Profile', top: int = DEFAULT_TOP) -> List[dict]:
+    """
+    The functions of a profile with the longest cumulative time.
+    """
+    import pstats
+
+    stats = pstats.Stats(profile).stats
+    ordered = sorted(stats.items(), key=lambda item: -item[1][3])[:top]
+    return [{
+        'function': f'{name} ({os.path.basename(filename)}:{line})',
+        'calls': calls,
+        'totalMs': round(total * 1000, 3),
+        'cumulativeMs': round(cumulative * 1000, 3),
+    } for (filename, line, name), (_, calls, total, cumulative, _) in ordered]
+
+
+def top_allocations(snapshot: 'tracemalloc.Snapshot', top: int = DEFAULT_TOP) -> List[dict]:
+    """
+    The lines that allocated the most memory still held at the snapshot.
+    """
+    return [{
+        'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+        'sizeBytes': stat.size,
+        'count': stat.count,
+    } for stat in snapshot.statistics('lineno')[:top]]
+
+
+class Profile:
+    """
+    The profile of an invocation.
+    """
+
+    def __init__(self, request_id: str, duration_ms: float, collapsed: List[str], functions: List[dict],
+                 allocations: List[dict], samples: int):
+        self.request_id = request_id
+        self.duration_ms = duration_ms
+        self.collapsed = collapsed
+        self.functions = functions
+        self.allocations = allocations
+        self.samples = samples
+
+    def to_dict(self) -> dict:
+        return {
+            'requestId': self.request_id,
+            'durationMs': round(self.duration_ms, 3),
+            'samples': self.samples,
+            'topFunctions': self.functions,
+            'topAllocations': self.allocations,
+            'collapsed': self.collapsed,
+        }
+
+
+class Profiler:
+    """
+    Profile sample_rate of invocations, and dump those that took threshold_ms or longer to output,
+    LOG_OUTPUT for stream, stdout by default, or a directory.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, threshold_ms: float = DEFAULT_THRESHOLD_MS, output: str = LOG_OUTPUT,
+                 interval_ms: float = DEFAULT_INTERVAL_MS, top: int = DEFAULT_TOP,
+                 max_profiles: int = DEFAULT_MAX_PROFILES, stream=None, rng: Optional[random.Random] = None):
+        self.sample_rate = sample_rate
+        self.threshold_ms = threshold_ms
+        self.output = output
+        self.interval_ms = interval_ms
+        self.top = top
+        self.max_profiles = max_profiles
+        self.stream = stream
+        self.rng = rng or random.Random()
+        # cProfile and tracemalloc are process wide, so one invocation is profiled at a time.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> Optional['Profiler']:
+        """
+        A profiler if PROFILE_SAMPLE_RATE is more than 0 and APP_ENV is in PROFILE_ENVS, if set. None otherwise.
+        """
+        sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0)
+        if sample_rate <= 0:
+            return None
+        envs = [env.strip() for env in os.environ.get('PROFILE_ENVS', '').split(',') if env.strip()]
+        if envs and os.environ.get('APP_ENV') not in envs:
+            return None
+        for name, env, convert in (('threshold_ms', 'PROFILE_THRESHOLD_MS', float),
+                                   ('output', 'PROFILE_OUTPUT', str),
+                                   ('interval_ms', 'PROFILE_INTERVAL_MS', float)):
+            if os.environ.get(env):
+                kwargs.setdefault(name, convert(os.environ[env]))
+        return cls(sample_rate=sample_rate, **kwargs)
+
+    def profile(self, handler: Callable[[dict, object], object]) -> Callable[[dict, object], object]:
+        """
+        A decorator profiling a sample of the invocations of handler.
+        """
+        @wraps(handler)
+        def wrapper(event, context):
+            if self.sample_rate < 1 and self.rng.random() >= self.sample_rate:
+                return handler(event, context)
+            if not self._lock.acquire(blocking=False):
+                return handler(event, context)
+            try:
+                return self._run(handler, event, context)
+            finally:
+                self._lock.release()
+
+        return wrapper
+
+    def _run(self, handler, event, context):
+        import cProfile
+        import tracemalloc
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        sampler = StackSampler(interval=self.interval_ms / 1000)
+        profile = cProfile.Profile()
+        started_at = time.perf_counter()
+        sampler.start()
+        profile.enable()
+        try:
+            return handler(event, context)
+        finally:
+            profile.disable()
+            sampler.stop()
+            duration_ms = (time.perf_counter() - started_at) * 1000
+            try:
+                if duration_ms >= self.threshold_ms:
+                    snapshot = tracemalloc.take_snapshot().filter_traces([
+                        tracemalloc.Filter(False, tracemalloc.__file__),
+                        tracemalloc.Filter(False, __file__),
+                    ])
+                    request_id = getattr(context, 'aws_request_id', None) or f'{time.time():.6f}'
+                    self.dump(Profile(request_id, duration_ms, sampler.collapsed(), top_functions(profile, self.top),
+                                      top_allocations(snapshot, self.top), sampler.samples), profile)
+            except Exception:
+                logger.warning('Failed to dump a profile', exc_info=True)
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+
+    def dump(self, result: Profile, profile: Optional['cProfile.Profile'] = None):
+        if self.output == LOG_OUTPUT:
+            self._log(result)
+        else:
+            self._write(result, profile)
+
+    def _log(self, result: Profile):
+        from laur.capture import MAX_LOG_EVENT_BYTES
+
+        document = result.to_dict()
+        line = json.dumps({PROFILE_KEY: document}, separators=(',', ':'))
+        # Leave out the least frequent stacks to fit a log event.
+        while len(line.encode('utf-8')) >= MAX_LOG_EVENT_BYTES and document['collapsed']:
+            del document['collapsed'][len(document['collapsed']) // 2:]
+            document['truncated'] = True
+            line = json.dumps({PROFILE_KEY: document}, separators=(',', ':'))
+        stream = self.stream or sys.stdout
+        stream.write(line + '\n')
+        stream.flush()
+
+    def _write(self, result: Profile, profile: Optional['cProfile.Profile']):
+        """
+        Write REQUEST_ID.collapsed, REQUEST_ID.json and REQUEST_ID.pstats to the output directory,
+        keeping the files of the latest max_profiles profiles.
+        """
+        os.makedirs(self.output, exist_ok=True)
+        base = os.path.join(self.output, result.request_id)
+        with open(base + '.collapsed', 'w') as f:
+            f.write(''.join(line + '\n' for line in result.collapsed))
+        summary = result.to_dict()
+        del summary['collapsed']
+        with open(base + '.json', 'w') as f:
+            json.dump(summary, f)
+        if profile is not None:
+            profile.dump_stats(base + '.pstats')
+        logger.warning('Dumped the profile of a slow invocation of %.0f ms to %s.*', result.duration_ms, base)
+
+        summaries = sorted((os.path.join(self.output, name) for name in os.listdir(self.output)
+                            if name.endswith('.json')), key=os.path.getmtime)
+        for path in summaries[:-self.max_profiles]:
+            for suffix in ('.json', '.collapsed', '.pstats'):
+                try:
+                    os.remove(path[:-len('.json')] + suffix)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,139 @@
+"""
+A compact SQS record of a Lambda event, decoded lazily.
+
+Nothing of a record is converted until it is accessed, and then only once:
+a handler that filters a record out by its attributes never pays for parsing its body,
+nor for downloading it if it was offloaded by laur.claimcheck.
+
+    for record in SqsRecord.from_event(event):
+        if record.approximate_receive_count > 3:
+            continue
+        process(record.body)
+
+For the event format,
+see https://docs.aws.amazon.com/lambda/latest/dg/with-sqs.html#example-standard-queue-message-event
+"""
+import io
+from typing import BinaryIO, List, Optional
+
+from laur.claimcheck import claim_check_uri
+from laur.codec import CONTENT_ENCODING, decode_attribute, decode_body, json_loads
+
+_UNSET = object()
+
+
+class SqsRecord:
+    """
+    A record of a SQS event.
+    body is the decompressed body parsed as JSON, text is the decompressed body as it is.
+    With a claim_check, the payload of a claim check message is fetched on the first access to them.
+    """
+
+    __slots__ = ('raw', 'claim_check', '_text', '_body', '_message_attributes', '_sent_timestamp', '_receive_count',
+                 '_first_receive_timestamp')
+
+    def __init__(self, raw: dict, claim_check=None):
+        self.raw = raw
+        self.claim_check = claim_check
+        self._text = _UNSET
+        self._body = _UNSET
+        self._message_attributes = _UNSET
+        self._sent_timestamp = _UNSET
+        self._receive_count = _UNSET
+        self._first_receive_timestamp = _UNSET
+
+    @classmethod
+    def from_event(cls, event: dict, claim_check=None) -> List['SqsRecord']:
+        return [cls(raw, claim_check) for raw in event.get('Records', ())]
+
+    def __repr__(self):
+        return f'<SqsRecord {self.message_id}>'
+
+    @property
+    def message_id(self) -> str:
+        return self.raw['messageId']
+
+    @property
+    def receipt_handle(self) -> str:
+        return self.raw['receiptHandle']
+
+    @property
+    def raw_body(self) -> str:
+        return self.raw['body']
+
+    @property
+    def group_id(self) -> Optional[str]:
+        return self.raw.get('attributes', {}).get('MessageGroupId')
+
+    @property
+    def deduplication_id(self) -> Optional[str]:
+        return self.raw.get('attributes', {}).get('MessageDeduplicationId')
+
+    def _int_attribute(self, name: str) -> Optional[int]:
+        value = self.raw.get('attributes', {}).get(name)
+        return None if value is None else int(value)
+
+    @property
+    def sent_timestamp(self) -> Optional[int]:
+        """
+        Milliseconds since the epoch when the message was sent.
+        """
+        if self._sent_timestamp is _UNSET:
+            self._sent_timestamp = self._int_attribute('SentTimestamp')
+        return self._sent_timestamp
+
+    @property
+    def approximate_receive_count(self) -> Optional[int]:
+        if self._receive_count is _UNSET:
+            self._receive_count = self._int_attribute('ApproximateReceiveCount')
+        return self._receive_count
+
+    @property
+    def approximate_first_receive_timestamp(self) -> Optional[int]:
+        if self._first_receive_timestamp is _UNSET:
+            self._first_receive_timestamp = self._int_attribute('ApproximateFirstReceiveTimestamp')
+        return self._first_receive_timestamp
+
+    @property
+    def message_attributes(self) -> dict:
+        """
+        Message attributes decoded into str, int, float or bytes.
+        """
+        if self._message_attributes is _UNSET:
+            self._message_attributes = {
+                name: decode_attribute(attribute) for name, attribute in self.raw.get('messageAttributes', {}).items()
+            }
+        return self._message_attributes
+
+    @property
+    def content_encoding(self) -> Optional[str]:
+        attribute = self.raw.get('messageAttributes', {}).get(CONTENT_ENCODING)
+        return None if attribute is None else attribute.get('stringValue')
+
+    @property
+    def claim_check_uri(self) -> Optional[str]:
+        return claim_check_uri(self.raw)
+
+    def open_payload(self) -> BinaryIO:
+        """
+        Stream the payload of a claim check message as it was stored, i.e. still compressed if it has a content encoding.
+        """
+        if self.claim_check is None or self.claim_check_uri is None:
+            return io.BytesIO(self.raw['body'].encode('utf-8'))
+        return self.claim_check.open(self.claim_check_uri)
+
+    @property
+    def text(self) -> str:
+        if self._text is _UNSET:
+            body = self.raw['body']
+            uri = self.claim_check_uri
+            if uri is not None and self.claim_check is not None:
+                body = self.claim_check.read(uri).decode('utf-8')
+            self._text = decode_body(body, self.content_encoding)
+        return self._text
+
+    @property
+    def body(self):
+        if self._body is _UNSET:
+            self._body = json_loads(self.text)
+        return self._body
@@ -0,0 +1,269 @@
+"""
+Replay of SQS invocations captured by laur.capture through a handler, to check for regressions.
+
+The replay streams captures from memory mapped files through a pipeline of generators, so a capture of any size
+is never loaded as a whole, and
+ * paces invocations by their captured start times, compressed by speed, or sends them as fast as possible,
+ * invokes the handler from worker threads, with a bounded number of invocations in flight,
+ * reports records/sec and percentiles of the duration of invocations, and the batchItemFailures of each,
+ * compares them with a baseline report: different batchItemFailures, or percentiles slower than the tolerance,
+   are regressions.
+
+    aws logs tail /aws/lambda/FUNCTION --since 1h --filter-pattern '{ $.laurCapture.capturedAt > 0 }' > capture.jsonl
+    PYTHONPATH=../src python -m laur.replay lambda_handlers.hello_world.app:lambda_handler capture.jsonl \
+        --speed 10 --workers 4 --baseline baseline.json
+
+This is a tool for development, left out of the layer by laur.layerbuild.
+"""
+import collections
+import logging
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from laur.capture import CAPTURE_KEY, failures_of
+from laur.codec import json_dumps, json_loads
+from laur.events import LambdaContext
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_MS = 10000
+DEFAULT_TOLERANCE = 0.3
+# Percentiles of the duration of invocations compared with a baseline.
+PERCENTILES = (50, 95, 99)
+
+
+def iter_lines(path: str) -> Iterator[bytes]:
+    """
+    The non-blank lines of a file, read through a memory map, so that only the pages being read are in memory.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # An empty file cannot be mapped.
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            size = len(mapped)
+            start = 0
+            while start < size:
+                end = mapped.find(b'\n', start)
+                if end < 0:
+                    end = size
+                line = mapped[start:end]
+                start = end + 1
+                if line.strip():
+                    yield line
+
+
+def read_captures(paths: Iterable[str]) -> Iterator[dict]:
+    """
+    The captures of files, in order. A line may be prefixed, e.g. by the timestamp of aws logs tail,
+    and a capture may be wrapped as written to the log. Lines that are not captures are skipped.
+    """
+    for path in paths:
+        for number, line in enumerate(iter_lines(path), 1):
+            start = line.find(b'{')
+            try:
+                capture = json_loads(line[start:]) if start >= 0 else None
+            except ValueError:
+                capture = None
+            if isinstance(capture, dict) and CAPTURE_KEY in capture:
+                capture = capture[CAPTURE_KEY]
+            if not isinstance(capture, dict) or not isinstance(capture.get('event'), dict):
+                logger.warning('Skipping line %d of %s, which is not a capture', number, path)
+                continue
+            yield capture
+
+
+def paced(captures: Iterable[dict], speed: Optional[float], clock=time) -> Iterator[dict]:
+    """
+    Yield captures as far apart as they were captured, divided by speed, or at once if speed is None or 0.
+    """
+    if not speed:
+        yield from captures
+        return
+    first_at = started_at = None
+    for capture in captures:
+        captured_at = capture.get('capturedAt')
+        if captured_at is not None:
+            if first_at is None:
+                first_at, started_at = captured_at, clock.monotonic()
+            wait = (captured_at - first_at) / speed - (clock.monotonic() - started_at)
+            if wait > 0:
+                clock.sleep(wait)
+        yield capture
+
+
+class ReplayResult:
+    __slots__ = ('index', 'records', 'failures', 'captured_failures', 'duration_ms', 'error')
+
+    def __init__(self, index: int, records: int, failures: List[str], captured_failures: Optional[List[str]],
+                 duration_ms: float, error: Optional[str] = None):
+        self.index = index
+        self.records = records
+        self.failures = failures
+        self.captured_failures = captured_failures
+        self.duration_ms = duration_ms
+        self.error = error
+
+
+def _invoke(handler: Callable[[dict, object], dict], index: int, capture: dict, timeout_ms: int) -> ReplayResult:
+    event = capture['event']
+    started_at = time.perf_counter()
+    error = None
+    try:
+        failures = failures_of(handler(event, LambdaContext(timeout_ms)))
+    except Exception as e:
+        logger.warning('Invocation %d raised', index, exc_info=True)
+        # Lambda retries every record of an invocation that raised.
+        failures = [record.get('messageId') for record in event.get('Records', ())]
+        error = type(e).__name__
+    duration_ms = (time.perf_counter() - started_at) * 1000
+    return ReplayResult(index, len(event.get('Records', ())), failures, capture.get('batchItemFailures'),
+                        duration_ms, error)
+
+
+def replay(handler: Callable[[dict, object], dict], captures: Iterable[dict], workers: int = 1,
+           timeout_ms: int = DEFAULT_TIMEOUT_MS) -> Iterator[ReplayResult]:
+    """
+    Invoke handler with the event of each capture and yield the results in the order of the captures.
+    With workers, invocations run in that many threads, and at most twice as many captures are read ahead.
+    """
+    if workers <= 1:
+        for index, capture in enumerate(captures):
+            yield _invoke(handler, index, capture, timeout_ms)
+        return
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='laur-replay') as executor:
+        in_flight = collections.deque()
+        for index, capture in enumerate(captures):
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(_invoke, handler, index, capture, timeout_ms))
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    idx = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[idx]
+
+
+class ReplayReport:
+    """
+    Totals of a replay. Only the durations and the invocations with failures are kept.
+    """
+
+    def __init__(self):
+        self.invocations = 0
+        self.records = 0
+        self.failed_records = 0
+        self.errors = 0
+        # Invocations whose batchItemFailures differ from the captured ones.
+        self.capture_mismatches = 0
+        self.durations_ms: List[float] = []
+        self.failures: Dict[str, List[str]] = {}
+        self.wall_seconds = 0.0
+
+    def add(self, result: ReplayResult):
+        self.invocations += 1
+        self.records += result.records
+        self.failed_records += len(result.failures)
+        self.errors += 1 if result.error else 0
+        self.durations_ms.append(result.duration_ms)
+        if result.failures:
+            self.failures[str(result.index)] = sorted(result.failures)
+        if result.captured_failures is not None and sorted(result.captured_failures) != sorted(result.failures):
+            self.capture_mismatches += 1
+
+    def to_dict(self, failures: bool = True) -> dict:
+        report = {
+            'invocations': self.invocations,
+            'records': self.records,
+            'failedRecords': self.failed_records,
+            'errors': self.errors,
+            'captureMismatches': self.capture_mismatches,
+            'wallSeconds': round(self.wall_seconds, 3),
+            'recordsPerSec': round(self.records / self.wall_seconds, 1) if self.wall_seconds else 0,
+        }
+        if self.durations_ms:
+            for p in PERCENTILES:
+                report[f'p{p}Ms'] = round(percentile(self.durations_ms, p), 3)
+        if failures:
+            report['failures'] = self.failures
+        return report
+
+
+def run(handler: Callable[[dict, object], dict], paths: Iterable[str], speed: Optional[float] = None,
+        workers: int = 1, timeout_ms: int = DEFAULT_TIMEOUT_MS, clock=time) -> ReplayReport:
+    """
+    Replay capture files through handler.
+    """
+    report = ReplayReport()
+    started_at = time.perf_counter()
+    for result in replay(handler, paced(read_captures(paths), speed, clock), workers, timeout_ms):
+        report.add(result)
+    report.wall_seconds = time.perf_counter() - started_at
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE, max_listed: int = 10) -> List[str]:
+    """
+    Describe the differences of a report from a baseline report: invocations whose batchItemFailures differ,
+    and percentiles of durations slower by more than the tolerance.
+    """
+    found = []
+    if report['invocations'] != baseline.get('invocations'):
+        found.append(f"invocations: {report['invocations']} vs baseline {baseline.get('invocations')}")
+    failures, expected_failures = report.get('failures', {}), baseline.get('failures', {})
+    different = sorted((index for index in set(failures) | set(expected_failures)
+                        if failures.get(index, []) != expected_failures.get(index, [])), key=int)
+    for index in different[:max_listed]:
+        found.append(f'invocation {index}: batchItemFailures {failures.get(index, [])} '
+                     f'vs baseline {expected_failures.get(index, [])}')
+    if len(different) > max_listed:
+        found.append(f'... and {len(different) - max_listed} more invocations with different batchItemFailures')
+    for p in PERCENTILES:
+        name = f'p{p}Ms'
+        if name in baseline and name in report and report[name] > baseline[name] * (1 + tolerance):
+            found.append(f'{name}: {report[name]:.3f} vs baseline {baseline[name]:.3f}')
+    return found
+
+
+def main(argv=None):
+    """
+    Replay captured invocations through a handler, print the report as JSON and compare it with a baseline.
+    """
+    import argparse
+
+    from laur.eventsource import load_handler
+
+    parser = argparse.ArgumentParser(prog='python -m laur.replay', description=main.__doc__)
+    parser.add_argument('handler', help="'module:function', e.g. lambda_handlers.hello_world.app:lambda_handler")
+    parser.add_argument('captures', nargs='+', help='Capture files of JSON lines')
+    parser.add_argument('--speed', type=float, help='Replay N times faster than captured. As fast as possible if unset')
+    parser.add_argument('--workers', type=int, default=1, help='Invocations in parallel')
+    parser.add_argument('--timeout-ms', type=int, default=DEFAULT_TIMEOUT_MS, help='The timeout of the function')
+    parser.add_argument('--baseline', help='A report to compare with, or to save to with --save-baseline')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = run(load_handler(args.handler), args.captures, speed=args.speed, workers=args.workers,
+                 timeout_ms=args.timeout_ms).to_dict()
+    summary = {name: value for name, value in report.items() if name != 'failures'}
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(json_dumps(report) + '\n')
+    elif args.baseline:
+        with open(args.baseline, 'rb') as f:
+            summary['regressions'] = compare(report, json_loads(f.read()), args.tolerance)
+    print(json_dumps(summary))
+    return 1 if summary.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
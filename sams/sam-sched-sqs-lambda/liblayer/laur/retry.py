@@ -0,0 +1,273 @@
+"""
+Retry backoff and quarantine of poison messages for records reported in batchItemFailures, and a redrive tool.
+
+A failed record comes back once the visibility timeout of the queue expires, and a FIFO group is blocked until then.
+A handler after the batch processor
+ * backs off a record that raised by ChangeMessageVisibility, exponentially by its ApproximateReceiveCount,
+ * quarantines a record that has raised max_attempts times: it is sent to the dead-letter queue
+   and reported as a success, so that Lambda deletes it and its group moves on,
+ * releases records that were not attempted, e.g. following a failure in their group or close to the deadline,
+   by setting their visibility timeout to 0.
+Keep the maxReceiveCount of the RedrivePolicy of the queue above max_attempts, as a backstop for invocations
+that fail as a whole.
+
+    retry_handler = RetryHandler(RetryPolicy(max_attempts=5), dead_letter_queue_url=os.environ['DLQ_URL'])
+    processor = BatchProcessor(process_record, failure_handler=retry_handler)
+
+Messages quarantined in the dead-letter queue are moved back in batches after a fix is deployed:
+
+    python -m laur.retry redrive DEAD_LETTER_QUEUE_URL QUEUE_URL
+
+For the visibility timeout, see https://docs.aws.amazon.com/AWSSimpleQueueService/latest/SQSDeveloperGuide/sqs-visibility-timeout.html
+"""
+import base64
+import json
+import logging
+import os
+import random
+import threading
+from typing import Dict, List, Optional, Set
+
+from laur.producer import BatchProducer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_SECONDS = 10
+DEFAULT_MAX_SECONDS = 900
+DEFAULT_MAX_ATTEMPTS = 5
+# The maximum visibility timeout of SQS, 12 hours.
+MAX_VISIBILITY_TIMEOUT = 43200
+MAX_BATCH_ENTRIES = 10
+
+
+class RetryPolicy:
+    """
+    Exponential backoff: base_seconds after the first receive, doubling up to max_seconds, with equal jitter.
+    """
+
+    def __init__(self, base_seconds: int = DEFAULT_BASE_SECONDS, max_seconds: int = DEFAULT_MAX_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, rng: Optional[random.Random] = None):
+        if max_attempts < 1:
+            raise ValueError(f'max_attempts must be 1 or more: {max_attempts}')
+        self.base_seconds = base_seconds
+        self.max_seconds = min(max_seconds, MAX_VISIBILITY_TIMEOUT)
+        self.max_attempts = max_attempts
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> 'RetryPolicy':
+        for name, env in (('base_seconds', 'RETRY_BASE_SECONDS'), ('max_seconds', 'RETRY_MAX_SECONDS'),
+                          ('max_attempts', 'RETRY_MAX_ATTEMPTS')):
+            if os.environ.get(env):
+                kwargs.setdefault(name, int(os.environ[env]))
+        return cls(**kwargs)
+
+    def backoff(self, receive_count: int) -> int:
+        """
+        Seconds until a record received receive_count times is received again.
+        """
+        ceiling = min(self.max_seconds, self.base_seconds * 2 ** max(receive_count - 1, 0))
+        return int(ceiling / 2 + self.rng.uniform(0, ceiling / 2))
+
+    def exhausted(self, receive_count: int) -> bool:
+        return receive_count >= self.max_attempts
+
+
+def receive_count_of(record: dict) -> int:
+    return int(record.get('attributes', {}).get('ApproximateReceiveCount', '1'))
+
+
+def _send_attributes(message_attributes: dict) -> dict:
+    """
+    Message attributes of a record of a Lambda event, or of a received message, as SendMessage takes them.
+    """
+    converted = {}
+    for name, attribute in message_attributes.items():
+        data_type = attribute.get('DataType', attribute.get('dataType'))
+        value = {'DataType': data_type}
+        if attribute.get('StringValue', attribute.get('stringValue')) is not None:
+            value['StringValue'] = attribute.get('StringValue', attribute.get('stringValue'))
+        elif 'BinaryValue' in attribute:
+            value['BinaryValue'] = attribute['BinaryValue']
+        elif attribute.get('binaryValue') is not None:
+            value['BinaryValue'] = base64.b64decode(attribute['binaryValue'])
+        converted[name] = value
+    return converted
+
+
+def _entry(body: str, message_id: str, attributes: dict, message_attributes: dict, fifo: bool) -> dict:
+    entry = {'MessageBody': body}
+    if message_attributes:
+        entry['MessageAttributes'] = _send_attributes(message_attributes)
+    if fifo:
+        entry['MessageGroupId'] = attributes.get('MessageGroupId', message_id)
+        # The message id deduplicates a message sent twice, unlike its content which others may share.
+        entry['MessageDeduplicationId'] = message_id
+    return entry
+
+
+class RetryHandler:
+    """
+    A failure_handler of laur.batch.BatchProcessor. Without a dead-letter queue, records are only backed off.
+    """
+
+    def __init__(self, policy: Optional[RetryPolicy] = None, dead_letter_queue_url: Optional[str] = None,
+                 client=None):
+        self.policy = policy or RetryPolicy()
+        self.dead_letter_queue_url = dead_letter_queue_url
+        self._client = client
+        self._queue_urls: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> Optional['RetryHandler']:
+        """
+        Quarantine to DLQ_URL, with a policy of RETRY_BASE_SECONDS, RETRY_MAX_SECONDS and RETRY_MAX_ATTEMPTS.
+        Return None if neither DLQ_URL nor RETRY_BASE_SECONDS is set.
+        """
+        if not os.environ.get('DLQ_URL') and not os.environ.get('RETRY_BASE_SECONDS'):
+            return None
+        kwargs.setdefault('policy', RetryPolicy.from_env())
+        kwargs.setdefault('dead_letter_queue_url', os.environ.get('DLQ_URL') or None)
+        return cls(**kwargs)
+
+    @property
+    def client(self):
+        if self._client is None:
+            from laur.runtime import get_client
+
+            self._client = get_client('sqs')
+        return self._client
+
+    def queue_url_of(self, queue_arn: str) -> str:
+        queue_url = self._queue_urls.get(queue_arn)
+        if queue_url is None:
+            _, _, _, _, account_id, queue_name = queue_arn.split(':')
+            queue_url = self.client.get_queue_url(QueueName=queue_name, QueueOwnerAWSAccountId=account_id)['QueueUrl']
+            with self._lock:
+                self._queue_urls[queue_arn] = queue_url
+        return queue_url
+
+    def __call__(self, failed: List[dict], raised: Set[str]) -> List[str]:
+        """
+        Back off, quarantine or release failed records and return the message ids still to report as failures.
+        """
+        quarantined = set()
+        if self.dead_letter_queue_url is not None:
+            poison = [record for record in failed
+                      if record['messageId'] in raised and self.policy.exhausted(receive_count_of(record))]
+            if poison:
+                quarantined = self.quarantine(poison)
+
+        visibility: Dict[str, List[dict]] = {}
+        for record in failed:
+            if record['messageId'] in quarantined:
+                continue
+            timeout = self.policy.backoff(receive_count_of(record)) if record['messageId'] in raised else 0
+            entries = visibility.setdefault(record['eventSourceARN'], [])
+            entries.append({'Id': str(len(entries)), 'ReceiptHandle': record['receiptHandle'],
+                            'VisibilityTimeout': timeout})
+        for queue_arn, entries in visibility.items():
+            self._change_visibility(queue_arn, entries)
+
+        return [record['messageId'] for record in failed if record['messageId'] not in quarantined]
+
+    def quarantine(self, records: List[dict]) -> Set[str]:
+        """
+        Send records to the dead-letter queue and return the message ids of those sent.
+        """
+        producer = BatchProducer(self.dead_letter_queue_url, client=self.client, max_workers=1)
+        try:
+            result = producer.send(_entry(record['body'], record['messageId'], record.get('attributes', {}),
+                                          record.get('messageAttributes', {}), producer.fifo) for record in records)
+        except Exception:
+            # The records are backed off instead.
+            logger.exception('Failed to quarantine %d records', len(records))
+            return set()
+        for failure in result.failed:
+            logger.error('Failed to quarantine a record: %s', failure)
+        sent = {records[int(entry['Id'])]['messageId'] for entry in result.successful}
+        for message_id in sent:
+            logger.warning('Quarantined a poison record: %s', message_id)
+        return sent
+
+    def _change_visibility(self, queue_arn: str, entries: List[dict]):
+        try:
+            queue_url = self.queue_url_of(queue_arn)
+            for start in range(0, len(entries), MAX_BATCH_ENTRIES):
+                response = self.client.change_message_visibility_batch(
+                    QueueUrl=queue_url, Entries=entries[start:start + MAX_BATCH_ENTRIES])
+                for failure in response.get('Failed', []):
+                    logger.warning('Failed to change the visibility timeout of a record: %s', failure)
+        except Exception:
+            # The records come back after the visibility timeout of the queue.
+            logger.warning('Failed to change the visibility timeout of records', exc_info=True)
+
+
+class RedriveResult:
+    def __init__(self):
+        self.moved = 0
+        self.failed = 0
+
+    def to_dict(self) -> dict:
+        return {'moved': self.moved, 'failed': self.failed}
+
+
+def redrive(source_url: str, destination_url: str, client=None, max_messages: Optional[int] = None,
+            wait_time_seconds: int = 1) -> RedriveResult:
+    """
+    Move messages from a queue, e.g. a dead-letter queue, to another in batches of 10, until the source is empty.
+    A message is deleted from the source only once it has been sent. The order of a FIFO group is kept.
+    """
+    if client is None:
+        from laur.runtime import get_client
+
+        client = get_client('sqs')
+    producer = BatchProducer(destination_url, client=client, max_workers=1)
+    result = RedriveResult()
+    while max_messages is None or result.moved + result.failed < max_messages:
+        limit = MAX_BATCH_ENTRIES if max_messages is None else min(MAX_BATCH_ENTRIES,
+                                                                   max_messages - result.moved - result.failed)
+        messages = client.receive_message(QueueUrl=source_url, MaxNumberOfMessages=limit,
+                                          WaitTimeSeconds=wait_time_seconds, AttributeNames=['All'],
+                                          MessageAttributeNames=['All']).get('Messages', [])
+        if not messages:
+            break
+        sent = producer.send(_entry(message['Body'], message['MessageId'], message.get('Attributes', {}),
+                                    message.get('MessageAttributes', {}), producer.fifo) for message in messages)
+        sent_ids = {int(entry['Id']) for entry in sent.successful}
+        deleted = [{'Id': str(idx), 'ReceiptHandle': message['ReceiptHandle']}
+                   for idx, message in enumerate(messages) if idx in sent_ids]
+        if deleted:
+            client.delete_message_batch(QueueUrl=source_url, Entries=deleted)
+        result.moved += len(deleted)
+        if sent.failed:
+            for failure in sent.failed:
+                logger.error('Failed to redrive a message: %s', failure)
+            result.failed += len(sent.failed)
+            # Stop rather than move later messages of a group ahead of one that failed.
+            break
+    return result
+
+
+def main(argv=None):
+    """
+    Move messages of a dead-letter queue back to a queue and print the result as JSON.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m laur.retry', description=main.__doc__)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    redrive_parser = subparsers.add_parser('redrive', help=main.__doc__)
+    redrive_parser.add_argument('source_url', help='The URL of the dead-letter queue')
+    redrive_parser.add_argument('destination_url', help='The URL of the queue to move messages back to')
+    redrive_parser.add_argument('--max-messages', type=int)
+    args = parser.parse_args(argv)
+
+    result = redrive(args.source_url, args.destination_url, max_messages=args.max_messages)
+    print(json.dumps(result.to_dict()))
+    return 0 if not result.failed else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
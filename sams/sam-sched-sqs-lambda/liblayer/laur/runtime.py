@@ -0,0 +1,202 @@
+"""
+Runtime core of Lambda functions: lazy imports, boto3 clients reused across warm invocations and a cold start report.
+
+Module level code of a Lambda function runs once per execution environment, in the init phase,
+and everything it creates is reused by the following warm invocations.
+So heavy modules are imported, and boto3 clients are created, at most once and only when they are used.
+
+    from laur.runtime import cold_start, get_client
+
+    def lambda_handler(event, context):
+        cold_start.log_report(logger)
+        sqs = get_client('sqs')
+
+For the execution environment lifecycle,
+see https://docs.aws.amazon.com/lambda/latest/dg/lambda-runtime-environment.html
+"""
+import importlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class ColdStart:
+    """
+    Durations of the init phases of an execution environment, reported once on the first invocation.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, float] = OrderedDict()
+        self.is_cold = True
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Measure a phase. Durations of phases with the same name are added up.
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def report(self) -> dict:
+        """
+        Milliseconds since laur.runtime was imported and of each phase.
+        """
+        with self._lock:
+            return {
+                'cold': self.is_cold,
+                'sinceImportMs': round((time.perf_counter() - self.started_at) * 1000, 3),
+                'phasesMs': {name: round(elapsed * 1000, 3) for name, elapsed in self.phases.items()},
+            }
+
+    def take_report(self) -> Optional[dict]:
+        """
+        Get the report on the first call, None afterwards.
+        """
+        with self._lock:
+            if not self.is_cold:
+                return None
+            self.is_cold = False
+        report = self.report()
+        report['cold'] = True
+        return report
+
+    def log_report(self, logger):
+        """
+        Log the report if this is the first invocation of the execution environment.
+        A logging.Logger gets the report as JSON in the message, a laur.jsonlog logger as fields.
+        """
+        report = self.take_report()
+        if report is None:
+            return
+        if isinstance(logger, logging.Logger):
+            logger.info('Cold start: %s', json.dumps(report))
+        else:
+            logger.info('Cold start', **report)
+
+
+cold_start = ColdStart()
+
+
+class LazyModule:
+    """
+    A module imported on the first attribute access, and measured as a cold start phase.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            with cold_start.phase(f'import:{self._name}'):
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<LazyModule {self._name} ({state})>'
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+boto3 = lazy_import('boto3')
+
+
+class ClientRegistry:
+    """
+    boto3 clients and resources created on first use and reused across warm invocations.
+
+    All of them come from one boto3 session, so botocore's data loader reads and parses each service model only once.
+    Clients are thread safe and shared by all threads. Resources are not, so they are kept per thread.
+    """
+
+    def __init__(self, session=None):
+        self._session = session
+        self._clients = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    with cold_start.phase('session'):
+                        self._session = boto3.session.Session()
+        return self._session
+
+    @staticmethod
+    def _key(service_name: str, kwargs: dict) -> tuple:
+        return (service_name,) + tuple(sorted(kwargs.items()))
+
+    def client(self, service_name: str, **kwargs):
+        """
+        Get a client. Keyword arguments are passed to boto3 and make a distinct client, e.g. region_name.
+        """
+        key = self._key(service_name, kwargs)
+        client = self._clients.get(key)
+        if client is None:
+            session = self.session
+            # Creating clients with a session is not thread safe.
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    with cold_start.phase(f'client:{service_name}'):
+                        client = self._clients[key] = session.client(service_name, **kwargs)
+        return client
+
+    def resource(self, service_name: str, **kwargs):
+        """
+        Get a resource of the current thread.
+        """
+        resources = getattr(self._local, 'resources', None)
+        if resources is None:
+            resources = self._local.resources = {}
+        key = self._key(service_name, kwargs)
+        resource = resources.get(key)
+        if resource is None:
+            session = self.session
+            with self._lock:
+                with cold_start.phase(f'resource:{service_name}'):
+                    resource = resources[key] = session.resource(service_name, **kwargs)
+        return resource
+
+    def preload(self, *service_names: str):
+        """
+        Create clients in the init phase, which runs with a CPU boost, instead of the first invocation.
+        """
+        for service_name in service_names:
+            self.client(service_name)
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._local = threading.local()
+            self._session = None
+
+
+clients = ClientRegistry()
+
+
+def get_client(service_name: str, **kwargs):
+    return clients.client(service_name, **kwargs)
+
+
+def get_resource(service_name: str, **kwargs):
+    return clients.resource(service_name, **kwargs)
@@ -0,0 +1,293 @@
+"""
+A sink buffering the writes of a batch of records and flushing them in bulk, in the shape of DynamoDB BatchWriteItem.
+
+A record handler writing its item itself makes one call per record. Records put their writes to the sink instead,
+and the batch processor flushes them once all records are processed, in requests of up to 25 writes.
+ * Writes of a key are coalesced: the last one of the batch wins, as it would have written one by one.
+ * Writes of a record that failed are dropped, since the record is received again.
+ * Unprocessed items of a response are retried with exponential backoff, within the deadline of the invocation.
+ * A write that still fails is mapped back to the records that made it, which are reported in batchItemFailures,
+   with the records after them in their message group, and passed to on_failure, e.g. Idempotency.forget.
+
+There are two writers: DynamoDbWriter in prod, SqliteWriter locally.
+
+    sink = BatchSink(DynamoDbWriter(), key_names={'orders': ('id',)}, on_failure=idempotency.forget)
+    processor = BatchProcessor(process_record, sink=sink)
+
+    def process_record(record):
+        sink.put('orders', {'id': {'S': record['messageId']}, 'body': {'S': record['body']}}, record)
+
+Since writes land once the batch is processed, a record whose write fails may be retried after later records
+of its group have been written.
+
+For the limits of BatchWriteItem, see https://docs.aws.amazon.com/amazondynamodb/latest/APIReference/API_BatchWriteItem.html
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_WRITES = 25
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_BASE = 0.05
+DEFAULT_BACKOFF_CAP = 1.0
+DEFAULT_KEY_NAMES = ('id',)
+
+# table name -> [{'PutRequest': {'Item': item}} or {'DeleteRequest': {'Key': key}}]
+RequestItems = Dict[str, List[dict]]
+# The names of the key attributes of all tables, or by table name.
+KeyNames = Union[Sequence[str], Dict[str, Sequence[str]]]
+
+
+class BatchWriter(ABC):
+    """
+    A store taking writes in the request shape of BatchWriteItem, with items and keys as DynamoDB attribute values.
+    """
+
+    @abstractmethod
+    def batch_write(self, request_items: RequestItems) -> RequestItems:
+        """
+        Write request_items and return those left unprocessed.
+        """
+
+
+class DynamoDbWriter(BatchWriter):
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from laur.runtime import get_client
+
+            self._client = get_client('dynamodb')
+        return self._client
+
+    def batch_write(self, request_items: RequestItems) -> RequestItems:
+        return self.client.batch_write_item(RequestItems=request_items).get('UnprocessedItems', {})
+
+
+class SqliteWriter(BatchWriter):
+    """
+    A writer to a SQLite database, for local runs and tests. Items of all tables are kept as JSON in one table.
+    """
+
+    def __init__(self, path: str = ':memory:', key_names: KeyNames = DEFAULT_KEY_NAMES):
+        self.path = path
+        self.key_names = key_names
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            'table_name TEXT NOT NULL, key TEXT NOT NULL, item TEXT NOT NULL, PRIMARY KEY (table_name, key))'
+        )
+
+    def batch_write(self, request_items: RequestItems) -> RequestItems:
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                for table_name, requests in request_items.items():
+                    key_names = _key_names_of(self.key_names, table_name)
+                    for request in requests:
+                        if 'PutRequest' in request:
+                            item = request['PutRequest']['Item']
+                            self._connection.execute(
+                                'INSERT OR REPLACE INTO items (table_name, key, item) VALUES (?, ?, ?)',
+                                (table_name, _key_text(item, key_names), json.dumps(item, sort_keys=True)))
+                        else:
+                            self._connection.execute(
+                                'DELETE FROM items WHERE table_name = ? AND key = ?',
+                                (table_name, _key_text(request['DeleteRequest']['Key'], key_names)))
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+        return {}
+
+    def get(self, table_name: str, key: dict) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT item FROM items WHERE table_name = ? AND key = ?',
+                (table_name, _key_text(key, _key_names_of(self.key_names, table_name)))).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def count(self, table_name: str) -> int:
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM items WHERE table_name = ?',
+                                            (table_name,)).fetchone()[0]
+
+
+def _key_names_of(key_names: KeyNames, table_name: str) -> Sequence[str]:
+    if isinstance(key_names, dict):
+        return key_names.get(table_name, DEFAULT_KEY_NAMES)
+    return key_names
+
+
+def _key_text(item: dict, key_names: Sequence[str]) -> str:
+    try:
+        return json.dumps([item[name] for name in key_names], sort_keys=True)
+    except KeyError as e:
+        raise ValueError(f'An item has no key attribute {e}') from None
+
+
+class _Write:
+    __slots__ = ('table_name', 'request', 'record')
+
+    def __init__(self, table_name: str, request: dict, record: dict):
+        self.table_name = table_name
+        self.request = request
+        self.record = record
+
+
+class BatchSink:
+    """
+    Writes of the records of a batch, by table and key in the order they were put. Thread safe.
+    """
+
+    def __init__(self, writer: BatchWriter, key_names: KeyNames = DEFAULT_KEY_NAMES,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 backoff_cap: float = DEFAULT_BACKOFF_CAP, on_failure: Optional[Callable[[dict], None]] = None,
+                 clock=time):
+        if max_attempts < 1:
+            raise ValueError(f'max_attempts must be 1 or more: {max_attempts}')
+        self.writer = writer
+        self.key_names = key_names
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.on_failure = on_failure
+        self.clock = clock
+        self.calls = 0
+        self._writes: Dict[Tuple[str, str], List[_Write]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> Optional['BatchSink']:
+        """
+        Write to DynamoDB if SINK_BACKEND is dynamodb, to SQLite if SINK_SQLITE_PATH is set,
+        with the key attributes of SINK_KEY_NAMES, separated by commas. Return None otherwise.
+        """
+        if os.environ.get('SINK_KEY_NAMES'):
+            kwargs.setdefault('key_names', tuple(os.environ['SINK_KEY_NAMES'].split(',')))
+        if os.environ.get('SINK_BACKEND') == 'dynamodb':
+            return cls(DynamoDbWriter(), **kwargs)
+        if os.environ.get('SINK_SQLITE_PATH'):
+            return cls(SqliteWriter(os.environ['SINK_SQLITE_PATH'], kwargs.get('key_names', DEFAULT_KEY_NAMES)),
+                       **kwargs)
+        return None
+
+    def put(self, table_name: str, item: dict, record: dict):
+        """
+        Buffer a PutRequest of item, made by record.
+        """
+        self._add(table_name, item, {'PutRequest': {'Item': item}}, record)
+
+    def delete(self, table_name: str, key: dict, record: dict):
+        """
+        Buffer a DeleteRequest of key, made by record.
+        """
+        self._add(table_name, key, {'DeleteRequest': {'Key': key}}, record)
+
+    def _add(self, table_name: str, item: dict, request: dict, record: dict):
+        key = (table_name, _key_text(item, _key_names_of(self.key_names, table_name)))
+        with self._lock:
+            self._writes.setdefault(key, []).append(_Write(table_name, request, record))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._writes)
+
+    def clear(self):
+        with self._lock:
+            self._writes = OrderedDict()
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Seconds to wait before retrying unprocessed items, with full jitter.
+        """
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def flush(self, exclude: Iterable[str] = (), deadline=None) -> List[dict]:
+        """
+        Write the buffered writes, except those of records whose message id is in exclude,
+        and return the records whose writes failed. Retries stop before the deadline, a laur.batch.Deadline.
+        """
+        with self._lock:
+            writes, self._writes = self._writes, OrderedDict()
+        exclude = set(exclude)
+
+        # The last write of each key, and the records the write stands for.
+        pending: List[Tuple[_Write, List[dict]]] = []
+        for key_writes in writes.values():
+            kept = [write for write in key_writes if write.record.get('messageId') not in exclude]
+            if kept:
+                pending.append((kept[-1], [write.record for write in kept]))
+
+        failed: List[Tuple[_Write, List[dict]]] = []
+        for start in range(0, len(pending), MAX_BATCH_WRITES):
+            failed.extend(self._write_chunk(pending[start:start + MAX_BATCH_WRITES], deadline))
+
+        records: Dict[str, dict] = OrderedDict()
+        for write, sources in failed:
+            logger.error('Failed to write to %s: %s', write.table_name, write.request)
+            for record in sources:
+                records.setdefault(record['messageId'], record)
+        if self.on_failure is not None:
+            for record in records.values():
+                try:
+                    self.on_failure(record)
+                except Exception:
+                    logger.exception('Failed to handle a failed write of a record: %s', record['messageId'])
+        return list(records.values())
+
+    def _write_chunk(self, chunk: List[Tuple[_Write, List[dict]]], deadline) -> List[Tuple[_Write, List[dict]]]:
+        """
+        Write up to MAX_BATCH_WRITES writes, retrying unprocessed ones, and return those that failed.
+        """
+        attempt = 0
+        while True:
+            request_items: RequestItems = {}
+            for write, _ in chunk:
+                request_items.setdefault(write.table_name, []).append(write.request)
+            self.calls += 1
+            try:
+                unprocessed = self.writer.batch_write(request_items)
+            except Exception:
+                # e.g. a validation error of an item, which fails the whole request.
+                logger.exception('Failed to write a batch of %d items', len(chunk))
+                return chunk
+
+            left = _unprocessed_of(chunk, unprocessed)
+            if not left:
+                return []
+            attempt += 1
+            if attempt >= self.max_attempts:
+                return left
+            delay = self.backoff(attempt)
+            if deadline is not None and (deadline.context.get_remaining_time_in_millis()
+                                         - deadline.safety_margin_ms) / 1000 <= delay:
+                logger.warning('Not retrying %d unprocessed items to return before the deadline', len(left))
+                return left
+            logger.info('Retrying %d unprocessed items, attempt %d', len(left), attempt + 1)
+            self.clock.sleep(delay)
+            chunk = left
+
+
+def _unprocessed_of(chunk: List[Tuple[_Write, List[dict]]],
+                    unprocessed: RequestItems) -> List[Tuple[_Write, List[dict]]]:
+    if not unprocessed:
+        return []
+    left_requests: Set[Tuple[str, str]] = {
+        (table_name, json.dumps(request, sort_keys=True))
+        for table_name, requests in unprocessed.items() for request in requests
+    }
+    return [(write, sources) for write, sources in chunk
+            if (write.table_name, json.dumps(write.request, sort_keys=True)) in left_requests]
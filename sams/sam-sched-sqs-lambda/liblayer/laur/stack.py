@@ -0,0 +1,201 @@
+"""
+Outputs of AWS CloudFormation stacks, fetched once and cached.
+
+All outputs of a stack are fetched with a single DescribeStacks call and kept in memory and on disk.
+A disk cache entry is keyed by the stack name only and trusted for max_age seconds, an hour by default,
+without asking CloudFormation: checking LastUpdatedTime of the stack would take the same DescribeStacks call
+the cache saves. So outputs changed by a deployment are seen only once the entry expires or is invalidated.
+LastUpdatedTime is recorded to log the update a refresh finds.
+
+    outputs = stack_outputs('sam-sched-sqs-lambda-dev')
+    queue_url = outputs.get('InvokeHelloWorldFifoQueueUrl')
+
+Set env variable LAUR_STACK_OUTPUTS_REFRESH=1 to ignore cached outputs, e.g. right after `sam deploy`,
+or remove the cache entry of a stack:
+
+    python -m laur.stack invalidate sam-sched-sqs-lambda-dev
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+REFRESH_ENV = 'LAUR_STACK_OUTPUTS_REFRESH'
+CACHE_DIR_ENV = 'LAUR_STACK_OUTPUTS_CACHE_DIR'
+DEFAULT_MAX_AGE = 3600
+
+
+def default_cache_dir() -> str:
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(tempfile.gettempdir(), 'laur-stack-outputs')
+
+
+class StackOutputs:
+    """
+    A snapshot of the outputs of a stack.
+    max_age is how many seconds a disk cache entry is used without calling DescribeStacks. None disables the disk cache.
+    """
+
+    def __init__(self, stack_name: str, client=None, cache_dir: Optional[str] = None,
+                 max_age: Optional[float] = DEFAULT_MAX_AGE):
+        if stack_name is None:
+            raise ValueError('Please set the AWS_SAM_STACK_NAME environment variable to the name of your stack')
+        self.stack_name = stack_name
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_age = max_age
+        self.last_updated_time: Optional[str] = None
+        self._client = client
+        self._outputs: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client('cloudformation')
+        return self._client
+
+    @property
+    def cache_path(self) -> str:
+        return os.path.join(self.cache_dir, f'{self.stack_name}.json')
+
+    def _describe(self) -> Dict[str, str]:
+        try:
+            response = self.client.describe_stacks(StackName=self.stack_name)
+        except Exception as e:
+            raise Exception(
+                f"Cannot find stack {self.stack_name} \n"
+                f'Please make sure a stack with the name "{self.stack_name}" exists'
+            ) from e
+
+        stack = response['Stacks'][0]
+        updated_at = stack.get('LastUpdatedTime') or stack.get('CreationTime')
+        self.last_updated_time = updated_at.isoformat() if hasattr(updated_at, 'isoformat') else updated_at
+        return {output['OutputKey']: output['OutputValue'] for output in stack.get('Outputs', [])}
+
+    def _read_cache(self) -> Optional[Dict[str, str]]:
+        if self.max_age is None:
+            return None
+        try:
+            with open(self.cache_path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('StackName') != self.stack_name or time.time() - entry.get('FetchedAt', 0) > self.max_age:
+            return None
+        self.last_updated_time = entry.get('LastUpdatedTime')
+        return entry['Outputs']
+
+    def _write_cache(self, outputs: Dict[str, str]):
+        if self.max_age is None:
+            return
+        entry = {
+            'StackName': self.stack_name,
+            'LastUpdatedTime': self.last_updated_time,
+            'FetchedAt': time.time(),
+            'Outputs': outputs,
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f'.{self.stack_name}.')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            logger.warning('Cannot write the cache of stack outputs: %s', self.cache_path, exc_info=True)
+
+    def invalidate(self):
+        """
+        Forget the outputs in memory and on disk, so that the next access fetches them.
+        """
+        with self._lock:
+            self._outputs = None
+            try:
+                os.remove(self.cache_path)
+            except FileNotFoundError:
+                pass
+
+    def refresh(self) -> Dict[str, str]:
+        """
+        Fetch the outputs from CloudFormation ignoring cached ones.
+        """
+        with self._lock:
+            previous = self.last_updated_time
+            outputs = self._describe()
+            if previous is not None and previous != self.last_updated_time:
+                logger.info('Stack %s was updated at %s', self.stack_name, self.last_updated_time)
+            self._write_cache(outputs)
+            self._outputs = outputs
+            return outputs
+
+    def all(self) -> Dict[str, str]:
+        """
+        All outputs of the stack by OutputKey.
+        """
+        outputs = self._outputs
+        if outputs is not None:
+            return outputs
+        with self._lock:
+            if self._outputs is None:
+                outputs = self._read_cache()
+                if outputs is None:
+                    outputs = self._describe()
+                    self._write_cache(outputs)
+                self._outputs = outputs
+            return self._outputs
+
+    def get(self, key_name: str) -> str:
+        """
+        The value of an output.
+        """
+        outputs = self.all()
+        if key_name not in outputs:
+            raise KeyError(f"{key_name} not found in stack {self.stack_name}")
+        return outputs[key_name]
+
+
+_resolvers: Dict[str, StackOutputs] = {}
+_resolvers_lock = threading.Lock()
+
+
+def stack_outputs(stack_name: str, refresh: Optional[bool] = None) -> StackOutputs:
+    """
+    Get the shared outputs of a stack. Outputs are refreshed once per process when refresh or LAUR_STACK_OUTPUTS_REFRESH is set.
+    """
+    with _resolvers_lock:
+        resolver = _resolvers.get(stack_name)
+        created = resolver is None
+        if created:
+            resolver = _resolvers[stack_name] = StackOutputs(stack_name)
+    if refresh is None:
+        refresh = created and os.environ.get(REFRESH_ENV, '').lower() in ('1', 'true')
+    if refresh:
+        resolver.refresh()
+    return resolver
+
+
+def main(argv=None) -> int:
+    """
+    Manage the disk cache of stack outputs.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m laur.stack', description=main.__doc__)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    invalidate = subparsers.add_parser('invalidate', help='Remove the cached outputs of stacks')
+    invalidate.add_argument('stack_names', nargs='+', metavar='STACK_NAME')
+    invalidate.add_argument('--cache-dir', help=f'The cache directory, {CACHE_DIR_ENV} or a temporary one by default')
+    args = parser.parse_args(argv)
+
+    for stack_name in args.stack_names:
+        StackOutputs(stack_name, cache_dir=args.cache_dir).invalidate()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
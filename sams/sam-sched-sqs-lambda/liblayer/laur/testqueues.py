@@ -0,0 +1,179 @@
+"""
+Short-lived queues for integration tests, one per test, so that tests can run in parallel with pytest-xdist.
+
+Tests sharing the queue of a stack must drain it and wait for the locks of its FIFO groups, so they run one by one.
+A factory instead creates queues with the attributes of the queue of the stack, e.g. retention, visibility timeout,
+wait time and content-based deduplication, and deletes them when the tests are done.
+Queues are created ahead in bulk and concurrently, since CreateQueue takes a while and a new queue may not be
+usable at once, and names carry the xdist worker id so that workers never share a queue.
+It works with any client, including laur.localsqs.
+
+    factory = QueueFactory.from_queue(boto3.client('sqs'), stack_queue_url, prefix='sqs-dev-test')
+    factory.prefill(8)
+    queue = factory.take()
+    ...
+    factory.delete_all()
+
+A queue that a crashed run left behind is deleted by delete_stale, e.g. at the start of a session.
+
+For the eventual consistency of CreateQueue, see https://docs.aws.amazon.com/AWSSimpleQueueService/latest/APIReference/API_CreateQueue.html
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Attributes that CreateQueue accepts and a test queue copies from its source queue.
+COPIED_ATTRIBUTE_NAMES = [
+    'ContentBasedDeduplication',
+    'DeduplicationScope',
+    'DelaySeconds',
+    'FifoQueue',
+    'FifoThroughputLimit',
+    'MaximumMessageSize',
+    'MessageRetentionPeriod',
+    'ReceiveMessageWaitTimeSeconds',
+    'VisibilityTimeout',
+]
+DEFAULT_CONCURRENCY = 8
+# A queue name is at most 80 characters, including .fifo.
+MAX_NAME_LENGTH = 80
+
+
+def worker_id() -> str:
+    """
+    The id of the pytest-xdist worker of this process, e.g. gw0, or main without xdist.
+    """
+    return os.environ.get('PYTEST_XDIST_WORKER', 'main')
+
+
+class TestQueue:
+    """
+    A queue created by a factory.
+    """
+    __slots__ = ('name', 'url')
+    # Not a test class, despite its name.
+    __test__ = False
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+
+    def __repr__(self):
+        return f'TestQueue({self.name!r})'
+
+
+class QueueFactory:
+    """
+    Create queues named `{prefix}-{worker id}-{random}` with the same attributes, and delete them in bulk.
+    """
+
+    def __init__(self, client, attributes: Dict[str, str], prefix: str = 'test',
+                 concurrency: int = DEFAULT_CONCURRENCY, clock=time):
+        self.client = client
+        self.attributes = dict(attributes)
+        self.prefix = prefix
+        self.concurrency = concurrency
+        self.clock = clock
+        self.fifo = self.attributes.get('FifoQueue') == 'true'
+        self._ready: List[TestQueue] = []
+        self._created: List[TestQueue] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_queue(cls, client, queue_url: str, **kwargs) -> 'QueueFactory':
+        """
+        A factory of queues with the attributes of an existing queue, e.g. the queue of the stack under test.
+        """
+        attributes = client.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['All']).get('Attributes', {})
+        return cls(client, {name: attributes[name] for name in COPIED_ATTRIBUTE_NAMES if name in attributes}, **kwargs)
+
+    def new_name(self) -> str:
+        suffix = '.fifo' if self.fifo else ''
+        name = f'{self.prefix}-{worker_id()}-{uuid.uuid4().hex[:12]}'
+        return name[:MAX_NAME_LENGTH - len(suffix)] + suffix
+
+    def create(self) -> TestQueue:
+        """
+        Create a queue now, without taking a prefilled one.
+        """
+        name = self.new_name()
+        url = self.client.create_queue(QueueName=name, Attributes=self.attributes)['QueueUrl']
+        queue = TestQueue(name, url)
+        with self._lock:
+            self._created.append(queue)
+        return queue
+
+    def _map(self, func, items) -> list:
+        items = list(items)
+        if len(items) <= 1 or self.concurrency <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(items)),
+                                thread_name_prefix='laur-testqueues') as executor:
+            return list(executor.map(func, items))
+
+    def prefill(self, count: int) -> List[TestQueue]:
+        """
+        Create count queues concurrently for the following take calls.
+        """
+        queues = self._map(lambda _: self.create(), range(count))
+        with self._lock:
+            self._ready.extend(queues)
+        return queues
+
+    def take(self) -> TestQueue:
+        """
+        Take a prefilled queue, or create one if none is left. A queue is never handed out twice.
+        """
+        with self._lock:
+            if self._ready:
+                return self._ready.pop(0)
+        return self.create()
+
+    def delete(self, queue: TestQueue):
+        try:
+            self.client.delete_queue(QueueUrl=queue.url)
+        except Exception:
+            logger.warning('Failed to delete the queue %s', queue.name, exc_info=True)
+
+    def delete_all(self):
+        """
+        Delete every queue this factory created, concurrently.
+        """
+        with self._lock:
+            queues, self._created, self._ready = self._created, [], []
+        self._map(self.delete, queues)
+
+    def delete_stale(self, max_age: float = 3600) -> int:
+        """
+        Delete queues with the prefix of this factory created more than max_age seconds ago,
+        by any worker or earlier run, and return how many were deleted.
+        """
+        urls = self.client.list_queues(QueueNamePrefix=f'{self.prefix}-').get('QueueUrls', [])
+        created_before = self.clock.time() - max_age
+
+        def delete_if_stale(url: str) -> bool:
+            try:
+                attributes = self.client.get_queue_attributes(
+                    QueueUrl=url, AttributeNames=['CreatedTimestamp'])['Attributes']
+                if int(attributes['CreatedTimestamp']) >= created_before:
+                    return False
+                self.client.delete_queue(QueueUrl=url)
+                return True
+            except Exception:
+                # Deleted by another worker meanwhile.
+                logger.debug('Failed to delete the stale queue %s', url, exc_info=True)
+                return False
+
+        return sum(self._map(delete_if_stale, urls))
+
+    @property
+    def created(self) -> List[TestQueue]:
+        with self._lock:
+            return list(self._created)
+
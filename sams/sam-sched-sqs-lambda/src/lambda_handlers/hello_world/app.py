@@ -6,10 +6,89 @@ For using event filtering with an Amazon SQS event source
 see https://docs.aws.amazon.com/lambda/latest/dg/with-sqs-filtering.html
 """
 import json
-import logging
+import os
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger('tryaws.sams.sam-sched-sqs-lambda')
+# Imported first, so that the cold start report counts the init phase from here. The durations of the phases below
+# are logged on the first invocation of an execution environment.
+from laur.runtime import cold_start
+
+with cold_start.phase('import'):
+    from laur.batch import BatchProcessor
+    from laur.claimcheck import ClaimCheck
+    from laur.config import Config
+    from laur.filters import EventFilter
+    from laur.idempotency import Idempotency
+    from laur.jsonlog import get_logger
+    from laur.metrics import EmfMetrics
+    from laur.profiler import Profiler
+    from laur.records import SqsRecord
+    from laur.retry import RetryHandler
+    from laur.sink import BatchSink
+
+logger = get_logger('tryaws.sams.sam-sched-sqs-lambda')
+# Metrics of an invocation are written to stdout in EMF once at its end, see the bottom of this file.
+with cold_start.phase('metrics'):
+    metrics = EmfMetrics.from_env()
+# Parameters under /APP_ID/APP_ENV/ and /APP_ID/default/, e.g. config.get_bool('features/new-parser'),
+# cached for CONFIG_TTL_SECONDS and refreshed in the background without blocking records.
+with cold_start.phase('config'):
+    config = Config.from_env()
+
+
+def process_message(message: SqsRecord):
+    """
+    Process a SQS message. Raise an exception to report the record as a batch item failure.
+    The body is decoded on the first access to message.body, so skip a message before touching it if possible.
+    """
+    logger.sampled_debug('Processing a record', body=message.raw_body)
+
+
+# Completed records are remembered across warm invocations, and in a persistent store if configured,
+# so that a record redelivered after a partial batch failure or a timeout is not processed again.
+with cold_start.phase('idempotency'):
+    idempotency = Idempotency.from_env()
+
+# Payloads offloaded to CLAIM_CHECK_BUCKET by the producer are downloaded on the first access to message.body,
+# and deleted once the record has been processed and its writes to the sink flushed, see processor below.
+with cold_start.phase('claimCheck'):
+    claim_check = ClaimCheck.from_env()
+
+
+def process_record(record):
+    logger.bind_record(record)
+    process_message(SqsRecord(record, claim_check))
+
+
+process_record = metrics.timed('RecordProcessingTime')(process_record)
+process_record = idempotency.record_handler(process_record)
+
+
+# Writes put to the sink, e.g. sink.put(table_name, item, message.raw) in process_message, are written in bulk
+# once the batch is processed: to DynamoDB if SINK_BACKEND is dynamodb, or to SINK_SQLITE_PATH.
+# A record whose writes failed is reported as a failure and processed again.
+with cold_start.phase('sink'):
+    sink = BatchSink.from_env(on_failure=idempotency.forget)
+
+# The patterns of FilterCriteria, as a JSON array in EVENT_FILTER_PATTERNS, to drop records in the handler as well,
+# e.g. while FilterCriteria is being tried out. Dropped records are deleted from the queue like processed ones.
+# FilterCriteria only sees the pointer in the body of a message offloaded to CLAIM_CHECK_BUCKET, whereas this filter
+# matches body conditions against the payload, downloading it only if the attribute conditions match.
+with cold_start.phase('eventFilter'):
+    event_filter = EventFilter.from_env(claim_check=claim_check)
+
+# Failed records are backed off by their receive count, and moved to DLQ_URL after RETRY_MAX_ATTEMPTS attempts,
+# so that a poison message does not block its message group.
+with cold_start.phase('retryHandler'):
+    retry_handler = RetryHandler.from_env()
+
+# Records in different message groups are processed in parallel, records in a group are processed in order.
+# No record is started within BATCH_SAFETY_MARGIN_MS plus the average time of a record before the timeout,
+# so that the records left are reported as failures instead of the whole batch timing out.
+with cold_start.phase('processor'):
+    processor = BatchProcessor(process_record, max_workers=int(os.environ.get('BATCH_MAX_WORKERS', '10')),
+                               safety_margin_ms=int(os.environ.get('BATCH_SAFETY_MARGIN_MS', '500')),
+                               failure_handler=retry_handler, sink=sink,
+                               success_handler=claim_check.discard_blobs if claim_check is not None else None)
 
 
 def lambda_handler(event, context):
@@ -18,7 +97,9 @@ def lambda_handler(event, context):
     For troubleshooting,
     see also https://repost.aws/knowledge-center/lambda-sqs-report-batch-item-failures
     """
-    logger.info("Received event", event)
+    logger.bind_invocation(context)
+    cold_start.log_report(logger)
+    logger.info('Received event', records=len(event.get('Records', ())))
 
     if 'Records' not in event:
         return {
@@ -28,16 +109,24 @@ def lambda_handler(event, context):
             })
         }
 
-    batch_item_failures = []
-    sqs_batch_response = {}
-
-    for record in event["Records"]:
-        try:
-            pass
-        except Exception as e:
-            batch_item_failures.append({"itemIdentifier": record['messageId']})
+    records = event["Records"]
+    metrics.set_property('requestId', getattr(context, 'aws_request_id', None))
+    metrics.observe_records(records)
+    try:
+        if event_filter is not None:
+            records = event_filter.filter(records)
+            metrics.count('Filtered', len(event["Records"]) - len(records))
+            # Lambda deletes dropped records from the queue like processed ones, so their blobs are not needed either.
+            if claim_check is not None and len(records) < len(event["Records"]):
+                kept = {record['messageId'] for record in records}
+                claim_check.discard_blobs(record for record in event["Records"] if record['messageId'] not in kept)
 
-    sqs_batch_response["batchItemFailures"] = batch_item_failures
+        sqs_batch_response = processor.process(records, context)
+        failed = len(sqs_batch_response['batchItemFailures'])
+        metrics.count('Succeeded', len(records) - failed)
+        metrics.count('Failed', failed)
+    finally:
+        metrics.flush()
     # Lambda treats a batch as a complete success if your function returns any of the following:
     #  * An empty batchItemFailures list
     #  * A null batchItemFailures list
@@ -52,12 +141,38 @@ def lambda_handler(event, context):
     return sqs_batch_response
 
 
+# A sample of PROFILE_SAMPLE_RATE of invocations is profiled in the APP_ENV listed in PROFILE_ENVS,
+# and those slower than PROFILE_THRESHOLD_MS are dumped to the log or to PROFILE_OUTPUT. Nothing is wrapped otherwise.
+profiler = Profiler.from_env()
+if profiler is not None:
+    lambda_handler = profiler.profile(lambda_handler)
+
+# A sample of CAPTURE_SAMPLE_RATE of invocations is written to the log, or to CAPTURE_PATH,
+# to be replayed through the handler by laur.replay. laur.capture is not even imported unless either is set,
+# and a CAPTURE_SAMPLE_RATE of 0, as in template.yaml, counts as not set.
+if float(os.environ.get('CAPTURE_SAMPLE_RATE') or 0) > 0 or os.environ.get('CAPTURE_PATH'):
+    from laur.capture import Recorder
+
+    capture = Recorder.from_env()
+    if capture is not None:
+        lambda_handler = capture.record(lambda_handler)
+
+
 """
 # CloudWatch metrics
+The handler emits these metrics in the namespace METRICS_NAMESPACE with dimensions AppId, AppEnv and FunctionName.
+ * BatchSize, Succeeded, Failed and Filtered records of an invocation.
+ * RecordProcessingTime of each record processed, in milliseconds.
+ * QueueDwellTime of each record, from SentTimestamp until ApproximateFirstReceiveTimestamp, in milliseconds.
+ * MessageAge of each record, from SentTimestamp until the invocation, in milliseconds.
+
 To determine whether your function is correctly reporting batch item failures,
 you can monitor the NumberOfMessagesDeleted and ApproximateAgeOfOldestMessage Amazon SQS metrics in Amazon CloudWatch.
  * NumberOfMessagesDeleted tracks the number of messages removed from your queue.
    If this drops to 0, this is a sign that your function response is not correctly returning failed messages.
  * ApproximateAgeOfOldestMessage tracks how long the oldest message has stayed in your queue.
    A sharp increase in this metric can indicate that your function is not correctly returning failed messages.
+
+To tune BatchSize, MaximumBatchingWindowInSeconds, MaximumConcurrency, VisibilityTimeout and Timeout by the depth
+of the queue and the duration of invocations, sample them and run the advisor, see laur.advisor.
 """
@@ -0,0 +1,165 @@
+"""
+Throughput and latency benchmark of a Lambda handler driven by synthetic SQS events.
+
+A scenario invokes the handler with events of a batch size, a body size and a number of message groups,
+and measures records/sec, per-invocation latency percentiles, the peak of traced memory during an invocation
+per record, and peak RSS. Peak RSS is ru_maxrss, the peak of the whole process so far, so a scenario reports
+the peak of the largest scenario run before it, and it is reported but never compared with a baseline.
+Results are compared with saved baselines, and a result worse than its baseline by the tolerance is a regression.
+"""
+import gc
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from laur.events import LambdaContext, make_sqs_event
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', '.benchmarks', 'baselines.json')
+DEFAULT_TOLERANCE = 0.3
+
+
+# metric -> True if higher is better
+METRICS = {
+    'records_per_sec': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'traced_peak_bytes_per_record': False,
+}
+
+
+class Scenario(NamedTuple):
+    name: str
+    batch_size: int
+    body_size: int
+    groups: Optional[int]
+    invocations: int
+
+
+SCENARIOS = [
+    Scenario('fifo-1', batch_size=1, body_size=256, groups=1, invocations=200),
+    Scenario('fifo-10-1group', batch_size=10, body_size=256, groups=1, invocations=100),
+    Scenario('fifo-10-10groups', batch_size=10, body_size=256, groups=10, invocations=100),
+    Scenario('fifo-10-large-body', batch_size=10, body_size=64 * 1024, groups=3, invocations=20),
+    Scenario('standard-100', batch_size=100, body_size=256, groups=None, invocations=20),
+    Scenario('standard-10000', batch_size=10000, body_size=256, groups=None, invocations=1),
+]
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    idx = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[idx]
+
+
+def peak_rss_bytes() -> int:
+    """
+    The peak RSS of this process since it started, not of a scenario.
+    """
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class quiet_output:
+    """
+    Send stdout and log lines of loggers to /dev/null during a run,
+    so that formatting logs and metrics is measured but the console isn't flooded.
+    """
+
+    def __init__(self, *names: str):
+        self.handlers = [h for name in names for h in logging.getLogger(name).handlers
+                         if isinstance(h, logging.StreamHandler)]
+        self.streams = []
+
+    def __enter__(self):
+        self.devnull = open(os.devnull, 'w')
+        self.streams = [h.setStream(self.devnull) for h in self.handlers]
+        self.stdout, sys.stdout = sys.stdout, self.devnull
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        sys.stdout = self.stdout
+        for handler, stream in zip(self.handlers, self.streams):
+            handler.setStream(stream)
+        self.devnull.close()
+
+
+def _measure_round(handler: Callable[[dict, object], dict], events: List[dict]) -> Dict[str, float]:
+    gc.collect()
+    latencies = []
+    started_at = time.perf_counter()
+    for event in events:
+        invoked_at = time.perf_counter()
+        handler(event, LambdaContext())
+        latencies.append(time.perf_counter() - invoked_at)
+    elapsed = time.perf_counter() - started_at
+    return {
+        'records_per_sec': sum(len(event['Records']) for event in events) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def run_scenario(handler: Callable[[dict, object], dict], scenario: Scenario, rounds: int = 5,
+                 seed: int = 0) -> Dict[str, float]:
+    """
+    Run a scenario and return its measurements.
+    Each timing is the best of the rounds, since noise of a shared machine only ever makes a round slower.
+    """
+    # Every record has its own messageId, so that none is skipped as a duplicate by the handler.
+    event_rounds = [
+        [make_sqs_event(scenario.batch_size, scenario.body_size, scenario.groups, seed=seed + idx)
+         for idx in range(scenario.invocations)]
+        for _ in range(rounds)
+    ]
+    # Warm up, as in a warm execution environment.
+    handler(make_sqs_event(scenario.batch_size, scenario.body_size, scenario.groups, seed=seed), LambdaContext())
+
+    measured = [_measure_round(handler, events) for events in event_rounds]
+    result = {metric: (max if METRICS[metric] else min)(m[metric] for m in measured) for metric in measured[0]}
+
+    traced_event = make_sqs_event(scenario.batch_size, scenario.body_size, scenario.groups, seed=seed)
+    tracemalloc.start()
+    try:
+        handler(traced_event, LambdaContext())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result['traced_peak_bytes_per_record'] = peak / scenario.batch_size
+    result['peak_rss_bytes'] = peak_rss_bytes()
+    return result
+
+
+def regressions(result: Dict[str, float], baseline: Dict[str, float], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Describe metrics worse than the baseline by more than the tolerance.
+    """
+    found = []
+    for metric, higher_is_better in METRICS.items():
+        if metric not in baseline:
+            continue
+        expected, actual = baseline[metric], result[metric]
+        limit = expected * (1 - tolerance) if higher_is_better else expected * (1 + tolerance)
+        if (higher_is_better and actual < limit) or (not higher_is_better and actual > limit):
+            found.append(f'{metric}: {actual:.3f} vs baseline {expected:.3f}')
+    return found
+
+
+def load_baselines(path: str = DEFAULT_BASELINE_PATH) -> Dict[str, Dict[str, float]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(baselines: Dict[str, Dict[str, float]], path: str = DEFAULT_BASELINE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
@@ -0,0 +1,36 @@
+import json
+import os
+
+import pytest
+
+from lambda_handlers.hello_world import app
+from tests.benchmark.harness import (DEFAULT_BASELINE_PATH, DEFAULT_TOLERANCE, SCENARIOS, load_baselines,
+                                     quiet_output, regressions, run_scenario, save_baselines)
+
+pytestmark = pytest.mark.skipif(not os.environ.get('BENCHMARK'), reason='Set BENCHMARK=1 to run benchmarks')
+
+BASELINE_PATH = os.environ.get('BENCHMARK_BASELINE_PATH', DEFAULT_BASELINE_PATH)
+TOLERANCE = float(os.environ.get('BENCHMARK_TOLERANCE', DEFAULT_TOLERANCE))
+
+
+@pytest.fixture(scope='module')
+def baselines():
+    baselines = load_baselines(BASELINE_PATH)
+    yield baselines
+    if os.environ.get('BENCHMARK_SAVE'):
+        save_baselines(baselines, BASELINE_PATH)
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS, ids=[scenario.name for scenario in SCENARIOS])
+def test_lambda_handler_benchmark(scenario, baselines):
+    with quiet_output(app.logger.logger.name):
+        result = run_scenario(app.lambda_handler, scenario)
+    print(f'\n{scenario.name}: {json.dumps({k: round(v, 3) for k, v in result.items()})}')
+
+    if os.environ.get('BENCHMARK_SAVE'):
+        baselines[scenario.name] = result
+        return
+    if scenario.name not in baselines:
+        pytest.skip(f'No baseline of {scenario.name}. Run with BENCHMARK_SAVE=1 to save one.')
+    found = regressions(result, baselines[scenario.name], TOLERANCE)
+    assert not found, f'{scenario.name} regressed: {", ".join(found)}'
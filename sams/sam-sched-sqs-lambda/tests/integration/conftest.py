@@ -1,11 +1,18 @@
 """
 Make sure env variable AWS_SAM_STACK_NAME exists with the name of the stack we are going to test.
+
+Each queue test gets its own FIFO queue with the attributes of the queue invoking the function,
+so tests can run in parallel: python -mpytest -n auto tests/integration
 """
+import math
 import os
 
 import boto3
 import pytest
 
+from laur.stack import stack_outputs
+from laur.testqueues import QueueFactory
+
 
 def get_stack_name() -> str:
     """
@@ -16,35 +23,16 @@ def get_stack_name() -> str:
 
 def get_stack_outputs(stack_name: str) -> dict:
     """
-    Get the stack outputs from AWS CloudFormation stack
+    Get the stack outputs from AWS CloudFormation stack, fetched once and cached by laur.stack
     """
-    if stack_name is None:
-        raise ValueError('Please set the AWS_SAM_STACK_NAME environment variable to the name of your stack')
-
-    client = boto3.client("cloudformation")
-
-    try:
-        response = client.describe_stacks(StackName=stack_name)
-    except Exception as e:
-        raise Exception(
-            f"Cannot find stack {stack_name} \n" f'Please make sure a stack with the name "{stack_name}" exists'
-        ) from e
-
-    stacks = response["Stacks"]
-    return stacks[0]["Outputs"]
+    return stack_outputs(stack_name).all()
 
 
 def get_output_value_from_stack(stack_name: str, key_name: str) -> str:
     """
     Get the output value from AWS CloudFormation stack
     """
-    stack_outputs = get_stack_outputs(stack_name)
-    data = [output for output in stack_outputs if output["OutputKey"] == key_name]
-
-    if not data:
-        raise KeyError(f"{key_name} not found in stack {stack_name}")
-
-    return data[0]["OutputValue"]
+    return stack_outputs(stack_name).get(key_name)
 
 
 @pytest.fixture()
@@ -55,17 +43,44 @@ def lambda_function_name():
     return get_output_value_from_stack(get_stack_name(), 'HelloWorldFunctionName')
 
 
+@pytest.fixture(scope='session')
+def queue_factory(request):
+    """
+    A factory of queues with the attributes of the queue invoking the function, which no function consumes.
+    The queues this worker is expected to need are created at once, and all of them are deleted at the end.
+    """
+    stack_name = get_stack_name()
+    source_name = get_output_value_from_stack(stack_name, 'InvokeHelloWorldFifoQueueName')
+    source_url = get_output_value_from_stack(stack_name, 'InvokeHelloWorldFifoQueueUrl')
+    factory = QueueFactory.from_queue(boto3.client('sqs'), source_url,
+                                      prefix=source_name[:-len('.fifo')] + '-test')
+    factory.delete_stale()
+    using = sum(1 for item in request.session.items if {'queue_name', 'queue_url'} & set(item.fixturenames))
+    workers = int(os.environ.get('PYTEST_XDIST_WORKER_COUNT', '1'))
+    factory.prefill(math.ceil(using / workers))
+    yield factory
+    factory.delete_all()
+
+
+@pytest.fixture()
+def test_queue(queue_factory):
+    """
+    A queue of the test alone.
+    """
+    return queue_factory.take()
+
+
 @pytest.fixture()
-def queue_name():
+def queue_name(test_queue):
     """
-    Get the queue name from AWS CloudFormation stack
+    Get the name of the queue of the test
     """
-    return get_output_value_from_stack(get_stack_name(), 'InvokeHelloWorldFifoQueueName')
+    return test_queue.name
 
 
 @pytest.fixture()
-def queue_url():
+def queue_url(test_queue):
     """
-    Get the queue url from AWS CloudFormation stack
+    Get the url of the queue of the test
     """
-    return get_output_value_from_stack(get_stack_name(), 'InvokeHelloWorldFifoQueueUrl')
+    return test_queue.url
@@ -0,0 +1,141 @@
+import io
+import json
+
+import pytest
+
+from laur.advisor import Settings, advise, collect, load_samples, main, sample_metrics
+from laur.localsqs import LocalSqs, VirtualClock
+
+
+def make_samples(visible, not_visible=5, interval=60, **metrics):
+    samples = []
+    for idx, count in enumerate(visible):
+        sample = {'at': 1700000000 + idx * interval, 'visible': count, 'notVisible': not_visible, 'delayed': 0}
+        if idx:
+            sample.update(metrics)
+        samples.append(sample)
+    return samples
+
+
+class FakeCloudWatch:
+    def __init__(self, values):
+        self.values = values
+        self.calls = []
+
+    def get_metric_statistics(self, Namespace, MetricName, Dimensions, StartTime, EndTime, Period, **kwargs):
+        self.calls.append((Namespace, MetricName, Period))
+        value = self.values.get(MetricName)
+        if value is None:
+            return {'Datapoints': []}
+        datapoint = dict(value, Timestamp=EndTime)
+        return {'Datapoints': [datapoint]}
+
+
+def test_collect_samples_a_local_queue():
+    clock = VirtualClock(0)
+    sqs = LocalSqs(clock=clock)
+    queue_url = sqs.create_queue(QueueName='q')['QueueUrl']
+    for idx in range(3):
+        sqs.send_message(QueueUrl=queue_url, MessageBody=str(idx))
+    sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=1)
+    stream = io.StringIO()
+
+    samples = collect(sqs, queue_url, count=2, interval=10, stream=stream, clock=clock)
+
+    assert samples == [{'at': 0, 'visible': 2, 'notVisible': 1, 'delayed': 0},
+                       {'at': 10, 'visible': 2, 'notVisible': 1, 'delayed': 0}]
+    assert [json.loads(line) for line in stream.getvalue().splitlines()] == samples
+
+
+def test_sample_metrics_of_the_function_and_the_queue():
+    cloudwatch = FakeCloudWatch({
+        'Invocations': {'Sum': 12.0},
+        'Duration': {'Average': 300.0, 'Maximum': 1200.0, 'ExtendedStatistics': {'p99': 900.0}},
+        'BatchSize': {'Sum': 110.0},
+        'NumberOfMessagesDeleted': {'Sum': 100.0},
+    })
+
+    sample = sample_metrics(cloudwatch, 1700000000, 1700000060, function_name='f', queue_name='q.fifo',
+                            metrics_namespace='app')
+
+    assert sample == {'invocations': 12, 'durationMs': {'avg': 300.0, 'p99': 900.0, 'max': 1200.0},
+                      'records': 110, 'deleted': 100}
+    assert ('AWS/SQS', 'NumberOfMessagesSent', 60) in cloudwatch.calls
+
+
+def test_a_growing_backlog_needs_more_concurrency():
+    # 10 records per invocation of 500 ms, 2 invocations at once: 40 messages/s, with 60 arriving per second.
+    samples = make_samples([0, 1200, 2400], not_visible=20, invocations=240, records=2400,
+                           durationMs={'avg': 500.0, 'p99': 800.0, 'max': 1000.0})
+
+    advice = advise(samples, Settings(maximum_concurrency=2), target_drain_seconds=300)
+
+    measured = advice.measured
+    assert measured['throughputPerSecond'] == 40
+    assert measured['arrivalRatePerSecond'] == 60
+    assert measured['drainSeconds'] is None
+    assert any('not draining' in reason for reason in advice.reasons)
+    # 60 + 2400 / 300 = 68 messages/s at 0.5 s per batch of 10, with head room.
+    assert advice.recommended.maximum_concurrency == 5
+    assert advice.recommended.batch_size == 10
+    assert advice.recommended.maximum_batching_window == 0
+    assert advice.recommended.function_timeout == 3
+    assert advice.recommended.visibility_timeout == 18
+    assert advice.changes == {'MaximumConcurrency': 5, 'Timeout': 3, 'VisibilityTimeout': 18}
+
+
+def test_deleted_and_sent_messages_give_throughput_and_drain_time():
+    samples = make_samples([600, 300], deleted=600, sent=300, invocations=60,
+                           durationMs={'avg': 1000.0, 'p99': 2000.0, 'max': 2500.0})
+
+    measured = advise(samples).measured
+
+    assert measured['throughputPerSecond'] == 10
+    assert measured['arrivalRatePerSecond'] == 5
+    assert measured['drainSeconds'] == 60
+    assert measured['meanConcurrency'] == 1
+
+
+def test_fifo_concurrency_is_bounded_by_active_groups():
+    samples = make_samples([0, 6000], not_visible=10, invocations=60, records=600,
+                           durationMs={'avg': 1000.0, 'p99': 1000.0, 'max': 1000.0})
+
+    advice = advise(samples, groups=4)
+
+    assert advice.recommended.maximum_concurrency == 4
+    assert any('4 active message groups' in reason for reason in advice.reasons)
+
+
+def test_a_standard_queue_with_slow_arrivals_gets_larger_batches_and_a_window():
+    # 5 ms per record, 2 messages/s.
+    samples = make_samples([0, 0], not_visible=0, invocations=120, records=120, sent=120, deleted=120,
+                           durationMs={'avg': 5.0, 'p99': 10.0, 'max': 20.0})
+
+    advice = advise(samples, Settings(fifo=False), target_invocation_seconds=1)
+
+    assert advice.recommended.batch_size == 200
+    assert advice.recommended.maximum_batching_window == 5
+    assert advice.measured['drainSeconds'] == 0
+
+
+def test_without_durations_only_the_visibility_timeout_is_checked():
+    advice = advise(make_samples([10, 10]), Settings(function_timeout=10, visibility_timeout=10))
+
+    assert advice.changes == {'VisibilityTimeout': 60}
+    assert advice.measured['throughputPerSecond'] is None
+
+
+def test_at_least_two_samples_are_needed():
+    with pytest.raises(ValueError):
+        advise(make_samples([10]))
+
+
+def test_advise_from_recorded_samples(tmp_path, capsys):
+    path = tmp_path / 'samples.jsonl'
+    samples = make_samples([100, 50], deleted=100, sent=50, invocations=10,
+                           durationMs={'avg': 200.0, 'p99': 400.0, 'max': 500.0})
+    path.write_text(''.join(json.dumps(sample) + '\n' for sample in reversed(samples)))
+
+    assert load_samples([str(path)]) == samples
+    assert main(['advise', str(path), '--groups', '3']) == 0
+    assert json.loads(capsys.readouterr().out)['measured']['backlog'] == 50
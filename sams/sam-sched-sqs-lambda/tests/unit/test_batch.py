@@ -0,0 +1,189 @@
+import threading
+import time
+
+import pytest
+
+from laur.batch import BatchProcessor, Deadline, group_records
+from laur.events import LambdaContext
+from laur.localsqs import VirtualClock
+
+
+def make_record(message_id, group_id=None, body=''):
+    attributes = {
+        'ApproximateReceiveCount': '1',
+        'SentTimestamp': '1545082649183',
+    }
+    if group_id is not None:
+        attributes['MessageGroupId'] = group_id
+    return {
+        'messageId': message_id,
+        'receiptHandle': f'receipt-{message_id}',
+        'body': body,
+        'attributes': attributes,
+        'messageAttributes': {},
+        'eventSource': 'aws:sqs',
+    }
+
+
+def failures(response):
+    return [item['itemIdentifier'] for item in response['batchItemFailures']]
+
+
+def test_group_records_keeps_order_in_a_group():
+    records = [make_record('1', 'a'), make_record('2', 'b'), make_record('3', 'a'), make_record('4')]
+    groups = group_records(records)
+    assert [[r['messageId'] for r in group] for group in groups] == [['1', '3'], ['2'], ['4']]
+
+
+def test_no_failures():
+    processor = BatchProcessor(lambda record: None)
+    response = processor.process([make_record('1', 'a'), make_record('2', 'b')])
+    assert response == {'batchItemFailures': []}
+
+
+def test_following_records_in_a_failed_group_are_reported_without_being_attempted():
+    attempted = []
+
+    def handler(record):
+        attempted.append(record['messageId'])
+        if record['body'] == 'fail':
+            raise RuntimeError('failed')
+
+    records = [
+        make_record('1', 'a'),
+        make_record('2', 'b'),
+        make_record('3', 'a', body='fail'),
+        make_record('4', 'b'),
+        make_record('5', 'a'),
+    ]
+    response = BatchProcessor(handler, max_workers=2).process(records)
+
+    assert failures(response) == ['3', '5']
+    assert '5' not in attempted
+    assert sorted(attempted) == ['1', '2', '3', '4']
+
+
+def test_groups_run_in_parallel_and_records_in_a_group_run_in_order():
+    lock = threading.Lock()
+    order = {}
+    running = []
+    peak = []
+
+    def handler(record):
+        with lock:
+            running.append(record['messageId'])
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(record['messageId'])
+            order.setdefault(record['attributes']['MessageGroupId'], []).append(record['messageId'])
+
+    records = [make_record(f'{group}-{idx}', group) for idx in range(3) for group in 'abc']
+    response = BatchProcessor(handler, max_workers=3).process(records)
+
+    assert failures(response) == []
+    assert max(peak) > 1
+    for group in 'abc':
+        assert order[group] == [f'{group}-0', f'{group}-1', f'{group}-2']
+
+
+def test_max_workers_must_be_positive():
+    with pytest.raises(ValueError):
+        BatchProcessor(lambda record: None, max_workers=0)
+
+
+def test_records_are_not_started_close_to_the_deadline():
+    clock = VirtualClock()
+    attempted = []
+
+    def handler(record):
+        attempted.append(record['messageId'])
+        clock.advance(1)
+
+    processor = BatchProcessor(handler, max_workers=1, safety_margin_ms=500, clock=clock)
+    records = [make_record(str(idx)) for idx in range(8)]
+
+    response = processor.process(records, LambdaContext(timeout_ms=5000, clock=clock))
+
+    # The 5th record would start with 1000 ms left, less than the margin and the average of 1000 ms.
+    assert attempted == ['0', '1', '2', '3']
+    assert failures(response) == ['4', '5', '6', '7']
+
+
+def test_records_following_a_not_started_record_in_a_group_are_reported():
+    clock = VirtualClock()
+    processor = BatchProcessor(lambda record: clock.advance(2), max_workers=1, safety_margin_ms=0, clock=clock)
+    records = [make_record('1', 'a'), make_record('2', 'b'), make_record('3', 'a'), make_record('4', 'a')]
+
+    response = processor.process(records, LambdaContext(timeout_ms=5000, clock=clock))
+
+    # Group a takes 4 s of 5 s, so neither its last record nor group b is started.
+    assert failures(response) == ['2', '4']
+
+
+def test_deadline_averages_records_of_all_workers():
+    clock = VirtualClock()
+    context = LambdaContext(timeout_ms=3000, clock=clock)
+    deadline = Deadline(context, safety_margin_ms=1000, clock=clock)
+
+    assert deadline.can_start()
+    deadline.run(lambda record: clock.advance(0.5), {})
+    deadline.run(lambda record: clock.advance(1.5), {})
+    with pytest.raises(ValueError):
+        deadline.run(lambda record: int('x'), {})
+
+    assert deadline.records == 3
+    assert deadline.average_ms == pytest.approx(2000 / 3)
+    # 1000 ms remain.
+    assert not deadline.can_start()
+
+
+def test_a_context_without_a_deadline_is_ignored():
+    response = BatchProcessor(lambda record: None).process([make_record('1')], context='')
+    assert response == {'batchItemFailures': []}
+
+
+def test_records_whose_writes_failed_are_reported_with_the_following_records_of_their_group():
+    from laur.sink import BatchSink, SqliteWriter
+
+    class FailingWriter(SqliteWriter):
+        def batch_write(self, request_items):
+            kept = {table_name: [r for r in requests if r['PutRequest']['Item']['id']['S'] != 'item-2']
+                    for table_name, requests in request_items.items()}
+            super().batch_write(kept)
+            return {table_name: [r for r in requests if r['PutRequest']['Item']['id']['S'] == 'item-2']
+                    for table_name, requests in request_items.items() if len(requests) > len(kept[table_name])}
+
+    records = [make_record('1', 'a'), make_record('2', 'a'), make_record('3', 'a'), make_record('4', 'b')]
+    writer = FailingWriter()
+    sink = BatchSink(writer, max_attempts=2, backoff_base=0)
+    raised_of_failures = []
+
+    def handle(record):
+        sink.put('items', {'id': {'S': f"item-{record['messageId']}"}}, record)
+
+    def failure_handler(failed, raised):
+        raised_of_failures.append(sorted(raised))
+        return [record['messageId'] for record in failed]
+
+    processor = BatchProcessor(handle, max_workers=2, failure_handler=failure_handler, sink=sink)
+
+    assert failures(processor.process(records)) == ['2', '3']
+    assert raised_of_failures == [['2']]
+    assert writer.count('items') == 3
+
+
+def test_success_handler_gets_only_the_records_that_succeeded():
+    records = [make_record('1', 'a'), make_record('2', 'a'), make_record('3', 'b')]
+    succeeded = []
+
+    def handle(record):
+        if record['messageId'] == '1':
+            raise ValueError('failed')
+
+    # Failed records are moved away by the failure handler rather than reported, but did not succeed either.
+    processor = BatchProcessor(handle, failure_handler=lambda failed, raised: [],
+                               success_handler=lambda records: succeeded.extend(r['messageId'] for r in records))
+
+    assert failures(processor.process(records)) == []
+    assert succeeded == ['3']
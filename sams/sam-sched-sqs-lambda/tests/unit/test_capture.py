@@ -0,0 +1,74 @@
+import io
+import json
+
+import pytest
+
+from laur.capture import CAPTURE_KEY, Recorder
+from laur.events import make_sqs_event
+from laur.localsqs import VirtualClock
+
+
+def failing(message_ids):
+    def handler(event, context):
+        return {'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in event['Records']
+                                      if record['messageId'] in message_ids]}
+
+    return handler
+
+
+def test_recorder_captures_invocations_to_a_file(tmp_path):
+    path = str(tmp_path / 'capture.jsonl')
+    event = make_sqs_event(3, seed=0)
+    failed_id = event['Records'][1]['messageId']
+    recorder = Recorder(path=path, clock=VirtualClock(1000))
+
+    handler = recorder.record(failing({failed_id}))
+    handler(event, None)
+    recorder.close()
+
+    with open(path) as f:
+        capture, = [json.loads(line) for line in f]
+    assert capture['capturedAt'] == 1000
+    assert capture['batchItemFailures'] == [failed_id]
+    assert capture['event'] == event
+    assert capture['durationMs'] >= 0
+
+
+def test_recorder_captures_an_invocation_that_raised_to_the_log():
+    stream = io.StringIO()
+    recorder = Recorder(stream=stream)
+
+    @recorder.record
+    def handler(event, context):
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        handler({'Records': []}, None)
+
+    capture = json.loads(stream.getvalue())[CAPTURE_KEY]
+    assert capture['error'] == 'RuntimeError'
+    assert 'batchItemFailures' not in capture
+
+
+def test_recorder_skips_invocations_out_of_the_sample():
+    stream = io.StringIO()
+    handler = Recorder(stream=stream, sample_rate=0.000001).record(failing(set()))
+
+    for _ in range(10):
+        handler({'Records': []}, None)
+
+    assert stream.getvalue() == ''
+
+
+def test_recorder_from_env(monkeypatch):
+    monkeypatch.delenv('CAPTURE_PATH', raising=False)
+    monkeypatch.delenv('CAPTURE_SAMPLE_RATE', raising=False)
+    assert Recorder.from_env() is None
+
+    monkeypatch.setenv('CAPTURE_SAMPLE_RATE', '0')
+    assert Recorder.from_env() is None
+
+    monkeypatch.setenv('CAPTURE_SAMPLE_RATE', '0.5')
+    recorder = Recorder.from_env()
+    assert recorder.path is None
+    assert recorder.sample_rate == 0.5
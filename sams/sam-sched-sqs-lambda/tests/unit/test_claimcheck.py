@@ -0,0 +1,206 @@
+import io
+import json
+import os
+
+import pytest
+
+from laur.claimcheck import CLAIM_CHECK, BlobCache, ClaimCheck, LocalBlobStore, S3BlobStore
+from laur.codec import encode_message
+from laur.events import make_sqs_record, record_from_message
+from laur.localsqs import LocalSqs, VirtualClock
+from laur.producer import BatchProducer
+from laur.records import SqsRecord
+
+
+class CountingStore(LocalBlobStore):
+    def __init__(self, root):
+        super().__init__(root)
+        self.opened = []
+
+    def open(self, key):
+        self.opened.append(key)
+        return super().open(key)
+
+
+@pytest.fixture()
+def store(tmp_path):
+    return CountingStore(str(tmp_path / 'blobs'))
+
+
+@pytest.fixture()
+def claim_check(store):
+    return ClaimCheck(store, threshold=100)
+
+
+def pointer_record(claim_check, body):
+    entry, uri = claim_check.offload({'MessageBody': body})
+    attributes = {name: {'dataType': a['DataType'], 'stringValue': a['StringValue']}
+                  for name, a in entry['MessageAttributes'].items()}
+    return make_sqs_record(entry['MessageBody'], message_attributes=attributes), uri
+
+
+def test_short_bodies_are_sent_as_they_are(claim_check):
+    entry = {'MessageBody': 'short'}
+
+    assert claim_check.offload(entry) == (entry, None)
+
+
+def test_long_bodies_are_replaced_with_a_pointer(claim_check, store):
+    body = json.dumps({'payload': 'x' * 1000})
+
+    entry, uri = claim_check.offload({'MessageBody': body, 'MessageGroupId': 'g'})
+
+    assert entry['MessageGroupId'] == 'g'
+    assert entry['MessageAttributes'][CLAIM_CHECK]['StringValue'] == uri
+    assert len(entry['MessageBody']) < 200
+    assert uri.startswith('file://')
+    with store.open(store.key_of(uri)) as f:
+        assert f.read().decode() == body
+
+
+def test_payload_is_fetched_lazily_and_cached(claim_check, store):
+    body = json.dumps({'payload': 'x' * 1000})
+    raw, uri = pointer_record(claim_check, body)
+
+    record = SqsRecord(raw, claim_check)
+    assert record.claim_check_uri == uri
+    assert store.opened == []
+
+    assert record.body == {'payload': 'x' * 1000}
+    assert SqsRecord(raw, claim_check).text == body
+    assert len(store.opened) == 1
+
+
+def test_compressed_payloads_are_decoded_after_fetching(claim_check):
+    entry = encode_message({'payload': 'abc' * 5000}, compress_threshold=10)
+    offloaded, _ = ClaimCheck(claim_check.store, threshold=10).offload(entry)
+    attributes = {name: {'dataType': a['DataType'], 'stringValue': a['StringValue']}
+                  for name, a in offloaded['MessageAttributes'].items()}
+
+    record = SqsRecord(make_sqs_record(offloaded['MessageBody'], message_attributes=attributes), claim_check)
+
+    assert record.body == {'payload': 'abc' * 5000}
+
+
+def test_payload_can_be_streamed(claim_check):
+    raw, _ = pointer_record(claim_check, 'line\n' * 100)
+
+    with SqsRecord(raw, claim_check).open_payload() as stream:
+        assert stream.readline() == b'line\n'
+
+
+def test_blobs_of_records_are_deleted(claim_check, store):
+    raw, uri = pointer_record(claim_check, 'x' * 1000)
+    assert SqsRecord(raw, claim_check).text == 'x' * 1000
+
+    claim_check.discard_blobs([raw, make_sqs_record('short')])
+
+    with pytest.raises(FileNotFoundError):
+        store.open(store.key_of(uri))
+    assert claim_check.cache.get(uri) is None
+
+
+def test_blobs_are_kept_until_the_writes_of_their_records_are_flushed(claim_check, store):
+    from laur.batch import BatchProcessor
+    from laur.sink import BatchSink, SqliteWriter
+
+    class FailingWriter(SqliteWriter):
+        def batch_write(self, request_items):
+            raise ConnectionError('DynamoDB is unavailable')
+
+    records = [pointer_record(claim_check, body * 1000) for body in ('x', 'y')]
+    sink = BatchSink(FailingWriter(), max_attempts=1, backoff_base=0)
+    blobs_at_flush = []
+
+    def handle(record):
+        payload = SqsRecord(record, claim_check).text
+        if payload.startswith('x'):
+            sink.put('items', {'id': {'S': payload[:1]}}, record)
+
+    def failure_handler(failed, raised):
+        blobs_at_flush.append(len(os.listdir(store.root)))
+        return [record['messageId'] for record in failed]
+
+    processor = BatchProcessor(handle, max_workers=1, failure_handler=failure_handler, sink=sink,
+                               success_handler=claim_check.discard_blobs)
+    response = processor.process([raw for raw, _ in records])
+
+    assert [item['itemIdentifier'] for item in response['batchItemFailures']] == [records[0][0]['messageId']]
+    assert blobs_at_flush == [2]
+    # The blob of the record whose write failed is kept for its retry, the other one is deleted.
+    with store.open(store.key_of(records[0][1])) as f:
+        assert f.read() == b'x' * 1000
+    with pytest.raises(FileNotFoundError):
+        store.open(store.key_of(records[1][1]))
+
+
+def test_producer_offloads_and_the_event_source_record_resolves(claim_check, store):
+    sqs = LocalSqs(clock=VirtualClock())
+    queue_url = sqs.create_queue(QueueName='test.fifo', Attributes={'FifoQueue': 'true'})['QueueUrl']
+    producer = BatchProducer(queue_url, client=sqs, claim_check=claim_check)
+
+    too_large = {'DataType': 'String', 'StringValue': 'x' * 300000}
+
+    result = producer.send([
+        {'MessageBody': 'x' * 1000, 'MessageGroupId': 'g'},
+        {'MessageBody': 'y' * 1000, 'MessageGroupId': 'g', 'MessageAttributes': {'a': too_large}},
+    ])
+
+    assert len(result.successful) == 1
+    # The blob of the message that failed to be sent is deleted.
+    assert len(os.listdir(store.root)) == 1
+    message = sqs.receive_message(QueueUrl=queue_url, MessageAttributeNames=['All'], AttributeNames=['All'])
+    record = record_from_message(message['Messages'][0], sqs.queue_arn('test.fifo'))
+    assert SqsRecord(record, claim_check).text == 'x' * 1000
+
+
+def test_blob_cache_evicts_least_recently_used():
+    cache = BlobCache(max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    cache.get('a')
+    cache.put('c', b'1234')
+
+    assert cache.get('a') == b'1234'
+    assert cache.get('b') is None
+    assert cache.size == 8
+    cache.put('huge', b'x' * 11)
+    assert cache.get('huge') is None
+
+
+def test_s3_blob_store_keys():
+    store = S3BlobStore('bucket', prefix='claim-check/', client=object())
+
+    assert store.uri('abc') == 's3://bucket/claim-check/abc'
+    assert store.key_of('s3://bucket/claim-check/abc') == 'abc'
+    with pytest.raises(ValueError):
+        store.key_of('s3://other/claim-check/abc')
+
+
+def test_s3_blob_store_streams_objects():
+    class Client:
+        def get_object(self, Bucket, Key):
+            assert (Bucket, Key) == ('bucket', 'p/abc')
+            return {'Body': io.BytesIO(b'payload')}
+
+    assert S3BlobStore('bucket', prefix='p/', client=Client()).open('abc').read() == b'payload'
+
+
+def test_local_blob_store_rejects_keys_outside_the_root(store):
+    with pytest.raises(ValueError):
+        store.put('../escape', b'x')
+
+
+def test_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv('CLAIM_CHECK_BUCKET', raising=False)
+    monkeypatch.delenv('CLAIM_CHECK_DIR', raising=False)
+    assert ClaimCheck.from_env() is None
+
+    monkeypatch.setenv('CLAIM_CHECK_DIR', str(tmp_path))
+    monkeypatch.setenv('CLAIM_CHECK_THRESHOLD', '10')
+    claim_check = ClaimCheck.from_env()
+    assert isinstance(claim_check.store, LocalBlobStore)
+    assert claim_check.threshold == 10
+
+    monkeypatch.setenv('CLAIM_CHECK_BUCKET', 'bucket')
+    assert ClaimCheck.from_env().store.bucket == 'bucket'
@@ -0,0 +1,44 @@
+import gzip
+
+import pytest
+
+from laur.codec import decode_attribute, decode_body, encode_body, encode_message, json_loads, register_encoding
+
+
+def test_small_body_is_not_compressed():
+    assert encode_body({'a': 1}, compress_threshold=100) == ('{"a":1}', None)
+
+
+def test_large_body_is_compressed_and_decoded():
+    obj = {'items': ['x' * 10] * 1000}
+    body, encoding = encode_body(obj, compress_threshold=100)
+
+    assert encoding == 'gzip'
+    assert len(body) < 1000
+    assert json_loads(decode_body(body, encoding)) == obj
+
+
+def test_encode_message_records_content_encoding():
+    message = encode_message('y' * 1000, compress_threshold=10, message_attributes={
+        'Source': {'DataType': 'String', 'StringValue': 'test'},
+    })
+    assert message['MessageAttributes']['ContentEncoding'] == {'DataType': 'String', 'StringValue': 'gzip'}
+    assert message['MessageAttributes']['Source']['StringValue'] == 'test'
+
+
+def test_registered_encoding():
+    register_encoding('test-gzip', gzip.compress, gzip.decompress)
+    body, encoding = encode_body('z' * 1000, compress_threshold=10, encoding='test-gzip')
+    assert decode_body(body, encoding) == 'z' * 1000
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        decode_body('body', 'no-such-encoding')
+
+
+def test_decode_attribute():
+    assert decode_attribute({'dataType': 'Binary', 'binaryValue': 'aGVsbG8='}) == b'hello'
+    assert decode_attribute({'dataType': 'Number', 'stringValue': '12'}) == 12
+    assert decode_attribute({'dataType': 'Number.float', 'stringValue': '1.5'}) == 1.5
+    assert decode_attribute({'dataType': 'String', 'stringValue': 'text'}) == 'text'
@@ -0,0 +1,185 @@
+import json
+import threading
+
+from laur.config import Config, ConfigBackend, FileBackend, SsmBackend, main
+from laur.localsqs import VirtualClock
+
+
+class DictBackend(ConfigBackend):
+    """
+    Serves values from a dict of paths, or raises while broken. A refresh blocks while gate is cleared.
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.broken = False
+        self.gate = threading.Event()
+        self.gate.set()
+        self.calls = []
+
+    def load(self, path):
+        self.calls.append(path)
+        self.gate.wait()
+        if self.broken:
+            raise ConnectionError('Parameter Store is unavailable')
+        return dict(self.values.get(path, {}))
+
+
+class FakeSsm:
+    def __init__(self, parameters):
+        self.parameters = parameters
+        self.calls = 0
+
+    def get_parameters_by_path(self, Path, Recursive, WithDecryption, MaxResults, NextToken='0'):
+        self.calls += 1
+        matching = [parameter for parameter in self.parameters if parameter['Name'].startswith(Path + '/')]
+        start = int(NextToken)
+        response = {'Parameters': matching[start:start + MaxResults]}
+        if start + MaxResults < len(matching):
+            response['NextToken'] = str(start + MaxResults)
+        return response
+
+
+def make_config(backend, clock=None, **kwargs):
+    return Config(backend, app_id='tryaws', app_env='dev', clock=clock or VirtualClock(0), **kwargs)
+
+
+def test_environment_values_override_the_defaults():
+    backend = DictBackend({
+        '/tryaws/dev': {'features/new-parser': 'true'},
+        '/tryaws/default': {'features/new-parser': 'false', 'endpoint': 'https://example.com'},
+    })
+    config = make_config(backend)
+
+    assert config.get_bool('features/new-parser') is True
+    assert config.get('/endpoint') == 'https://example.com'
+    assert config.get('missing', 'fallback') == 'fallback'
+    assert backend.calls == ['/tryaws/dev', '/tryaws/default']
+
+
+def test_values_are_cached_until_the_ttl_and_then_refreshed_in_the_background():
+    clock = VirtualClock(0)
+    backend = DictBackend({'/tryaws/dev': {'threshold': '10'}})
+    config = make_config(backend, clock=clock, ttl_seconds=60)
+    assert config.get_int('threshold') == 10
+
+    backend.values['/tryaws/dev']['threshold'] = '20'
+    clock.advance(59)
+    assert config.get_int('threshold') == 10
+    assert len(backend.calls) == 2
+
+    clock.advance(1)
+    backend.gate.clear()
+    # The stale value is served while the refresh waits for the backend.
+    assert config.get_int('threshold') == 10
+    assert config.get_int('threshold') == 10
+    backend.gate.set()
+    config.join()
+
+    assert config.get_int('threshold') == 20
+    assert len(backend.calls) == 4
+    assert config.loads == 2
+
+
+def test_the_last_known_values_are_kept_while_the_backend_fails():
+    clock = VirtualClock(0)
+    backend = DictBackend({'/tryaws/dev': {'endpoint': 'https://example.com'}})
+    config = make_config(backend, clock=clock, ttl_seconds=60, retry_seconds=10)
+    config.get('endpoint')
+
+    backend.broken = True
+    clock.advance(60)
+    config.get('endpoint')
+    config.join()
+    assert config.get('endpoint') == 'https://example.com'
+    assert config.failures == 1
+
+    # Retried after retry_seconds rather than on every access.
+    calls = len(backend.calls)
+    clock.advance(5)
+    config.get('endpoint')
+    assert len(backend.calls) == calls
+
+    backend.broken = False
+    clock.advance(5)
+    config.get('endpoint')
+    config.join()
+    assert config.loads == 2
+
+
+def test_defaults_are_used_when_the_first_load_fails():
+    backend = DictBackend({})
+    backend.broken = True
+    config = make_config(backend)
+
+    assert config.get_int('threshold', 5) == 5
+    assert config.get_int('threshold', 5) == 5
+    assert len(backend.calls) == 1
+
+
+def test_invalid_values_fall_back_to_the_default():
+    backend = DictBackend({'/tryaws/dev': {'threshold': 'ten', 'flag': 'maybe', 'hosts': 'a, b,', 'limits': '{"x": 1}'}})
+    config = make_config(backend)
+
+    assert config.get_int('threshold', 3) == 3
+    assert config.get_bool('flag', True) is True
+    assert config.get_list('hosts') == ['a', 'b']
+    assert config.get_json('limits') == {'x': 1}
+
+
+def test_without_a_backend_every_key_has_its_default():
+    config = Config()
+
+    assert config.get('anything') is None
+    assert config.get_float('ratio', 0.5) == 0.5
+
+
+def test_ssm_backend_pages_through_the_parameters_of_a_path():
+    ssm = FakeSsm([{'Name': f'/tryaws/dev/keys/{idx}', 'Value': str(idx)} for idx in range(25)]
+                  + [{'Name': '/tryaws/stg/keys/0', 'Value': 'other'}])
+
+    values = SsmBackend(ssm).load('/tryaws/dev')
+
+    assert values == {f'keys/{idx}': str(idx) for idx in range(25)}
+    assert ssm.calls == 3
+
+
+def test_file_backend_flattens_nested_objects(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({
+        'tryaws': {
+            'default': {'features': {'new-parser': False}, 'hosts': ['a', 'b']},
+            'dev': {'features/new-parser': True},
+        },
+        '/tryaws/dev/endpoint': 'https://example.com',
+    }))
+    backend = FileBackend(str(path))
+
+    assert backend.load('/tryaws/dev') == {'features/new-parser': 'true', 'endpoint': 'https://example.com'}
+    assert backend.load('/tryaws/default') == {'features/new-parser': 'false', 'hosts': '["a", "b"]'}
+
+
+def test_from_env(monkeypatch, tmp_path):
+    for name in ('CONFIG_BACKEND', 'CONFIG_FILE', 'CONFIG_TTL_SECONDS', 'CONFIG_RETRY_SECONDS'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('APP_ID', 'tryaws')
+    monkeypatch.setenv('APP_ENV', 'stg')
+    assert Config.from_env().backend is None
+
+    monkeypatch.setenv('CONFIG_FILE', str(tmp_path / 'config.json'))
+    monkeypatch.setenv('CONFIG_TTL_SECONDS', '120')
+    config = Config.from_env()
+    assert isinstance(config.backend, FileBackend)
+    assert config.paths == ['/tryaws/stg', '/tryaws/default']
+    assert config.ttl_seconds == 120
+
+    monkeypatch.setenv('CONFIG_BACKEND', 'ssm')
+    assert isinstance(Config.from_env().backend, SsmBackend)
+
+
+def test_main_prints_the_resolved_config(tmp_path, capsys):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({'tryaws': {'default': {'a': '1', 'b': '2'}, 'dev': {'b': '3'}}}))
+
+    assert main(['--file', str(path), '--app-id', 'tryaws', '--app-env', 'dev']) == 0
+    assert json.loads(capsys.readouterr().out) == {'a': '1', 'b': '3'}
@@ -0,0 +1,108 @@
+import pytest
+
+from laur.drain import DrainResult, QueueDrainer, drain_queue
+from laur.localsqs import LocalSqs, VirtualClock
+
+
+@pytest.fixture()
+def sqs():
+    return LocalSqs(clock=VirtualClock())
+
+
+@pytest.fixture()
+def fifo_queue_url(sqs):
+    return sqs.create_queue(QueueName='test.fifo', Attributes={
+        'FifoQueue': 'true',
+        'ContentBasedDeduplication': 'true',
+        'VisibilityTimeout': '10',
+    })['QueueUrl']
+
+
+def send(sqs, queue_url, count, groups):
+    for n in range(count):
+        sqs.send_message(QueueUrl=queue_url, MessageBody=f'message-{n}', MessageGroupId=f'group-{n % groups}')
+
+
+def test_drain_deletes_all_messages(sqs, fifo_queue_url):
+    send(sqs, fifo_queue_url, 55, groups=5)
+
+    result = drain_queue(fifo_queue_url, client=sqs, receivers=3, clock=sqs.clock)
+
+    assert result.empty is True
+    assert result.deleted == 55
+    assert sqs.receive_message(QueueUrl=fifo_queue_url, WaitTimeSeconds=0) == {}
+
+
+def test_drain_waits_for_messages_in_flight_only_until_their_visibility_timeout(sqs, fifo_queue_url):
+    send(sqs, fifo_queue_url, 4, groups=2)
+    # A consumer received a message and went away without deleting it, so its group is locked.
+    sqs.receive_message(QueueUrl=fifo_queue_url)
+    started_at = sqs.clock.time()
+
+    result = drain_queue(fifo_queue_url, client=sqs, receivers=1, clock=sqs.clock)
+
+    assert result.empty is True
+    assert result.deleted == 4
+    assert sqs.clock.time() - started_at < 20
+
+
+def test_drain_gives_up_at_the_timeout(sqs, fifo_queue_url):
+    send(sqs, fifo_queue_url, 1, groups=1)
+    sqs.receive_message(QueueUrl=fifo_queue_url, VisibilityTimeout=600)
+
+    result = QueueDrainer(fifo_queue_url, client=sqs, receivers=1, timeout=30, clock=sqs.clock).drain()
+
+    assert result.empty is False
+    assert result.deleted == 0
+
+
+def test_failed_deletes_are_released(sqs, fifo_queue_url):
+    class FailingDeletes:
+        def __init__(self):
+            self.released = []
+
+        def delete_message_batch(self, QueueUrl, Entries):
+            return {'Successful': [], 'Failed': [{'Id': e['Id'], 'Code': 'InternalError', 'SenderFault': False}
+                                                 for e in Entries]}
+
+        def change_message_visibility_batch(self, QueueUrl, Entries):
+            self.released.extend(Entries)
+            return sqs.change_message_visibility_batch(QueueUrl=QueueUrl, Entries=Entries)
+
+    client = FailingDeletes()
+    drainer = QueueDrainer(fifo_queue_url, client=client, clock=sqs.clock)
+    send(sqs, fifo_queue_url, 1, groups=1)
+    messages = sqs.receive_message(QueueUrl=fifo_queue_url)['Messages']
+
+    result = DrainResult()
+    drainer._delete(messages, result)
+
+    assert result.released == 1
+    assert [entry['VisibilityTimeout'] for entry in client.released] == [0]
+    assert len(sqs.receive_message(QueueUrl=fifo_queue_url, WaitTimeSeconds=0)['Messages']) == 1
+
+
+def test_messages_are_released_when_a_delete_raises(sqs, fifo_queue_url):
+    class FlakyDeletes:
+        def __init__(self):
+            self.raised = False
+
+        def delete_message_batch(self, QueueUrl, Entries):
+            if not self.raised:
+                self.raised = True
+                raise ConnectionError('Connection reset by peer')
+            return sqs.delete_message_batch(QueueUrl=QueueUrl, Entries=Entries)
+
+        def __getattr__(self, name):
+            return getattr(sqs, name)
+
+    send(sqs, fifo_queue_url, 4, groups=1)
+    started_at = sqs.clock.time()
+
+    result = drain_queue(fifo_queue_url, client=FlakyDeletes(), receivers=1, clock=sqs.clock)
+
+    assert result.empty is True
+    assert result.released == 4
+    assert result.deleted == 4
+    # The group was not locked for the visibility timeout of 10 seconds.
+    assert sqs.clock.time() - started_at < 10
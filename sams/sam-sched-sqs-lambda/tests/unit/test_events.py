@@ -0,0 +1,37 @@
+import json
+
+from laur.events import LambdaContext, make_sqs_event
+from laur.localsqs import VirtualClock
+
+
+def test_make_sqs_event_of_fifo_queue():
+    event = make_sqs_event(batch_size=10, body_size=1024, groups=3, seed=1)
+
+    records = event['Records']
+    assert len(records) == 10
+    assert len({record['messageId'] for record in records}) == 10
+    assert [record['attributes']['MessageGroupId'] for record in records[:4]] == [
+        'message-group-id-0', 'message-group-id-1', 'message-group-id-2', 'message-group-id-0'
+    ]
+    assert records[0]['eventSourceARN'].endswith('.fifo')
+    assert abs(len(records[0]['body']) - 1024) < 4
+    assert json.loads(records[3]['body'])['RecordNumber'] == 3
+
+
+def test_make_sqs_event_of_standard_queue():
+    event = make_sqs_event(batch_size=2, body_size=10)
+
+    record = event['Records'][0]
+    assert 'MessageGroupId' not in record['attributes']
+    assert not record['eventSourceARN'].endswith('.fifo')
+    assert set(json.loads(record['body'])) == {'RecordNumber', 'TimeStamp', 'RequestCode'}
+
+
+def test_lambda_context_counts_down():
+    clock = VirtualClock()
+    context = LambdaContext(timeout_ms=3000, clock=clock)
+
+    clock.advance(1)
+    assert context.get_remaining_time_in_millis() == 2000
+    clock.advance(5)
+    assert context.get_remaining_time_in_millis() == 0
@@ -0,0 +1,113 @@
+from laur.batch import BatchProcessor
+from laur.events import record_from_message
+from laur.eventsource import EventSourceMappingSimulator, main
+
+
+def succeed(event, context):
+    return {'batchItemFailures': []}
+
+
+def fixed(seconds):
+    return lambda records: seconds
+
+
+def test_all_messages_are_processed():
+    simulator = EventSourceMappingSimulator(succeed, fifo=True, duration=fixed(0.05))
+
+    report = simulator.run(rate=50, seconds=10, groups=5, seed=1)
+
+    assert report.sent > 400
+    assert report.processed == report.sent
+    assert report.remaining == 0
+    assert report.failed == 0
+    assert report.to_dict()['queueAgeSeconds']['p99'] < 1
+
+
+def test_fifo_concurrency_is_limited_by_groups():
+    simulator = EventSourceMappingSimulator(succeed, fifo=True, batch_size=1, duration=fixed(1))
+
+    report = simulator.run(rate=50, seconds=5, groups=3, seed=1)
+
+    assert report.max_concurrency == 3
+    assert report.processed == report.sent
+
+
+def test_maximum_concurrency_caps_invocations_and_queue_age_grows():
+    simulator = EventSourceMappingSimulator(succeed, fifo=False, batch_size=10, maximum_concurrency=2,
+                                            duration=fixed(1))
+
+    report = simulator.run(rate=100, seconds=10, seed=1)
+
+    assert report.max_concurrency == 2
+    assert report.saturated_seconds > 10
+    assert report.processed == report.sent
+    assert report.to_dict()['queueAgeSeconds']['max'] > 10
+
+
+def test_batching_window_fills_batches():
+    without_window = EventSourceMappingSimulator(succeed, fifo=False, duration=fixed(0.01))
+    with_window = EventSourceMappingSimulator(succeed, fifo=False, maximum_batching_window=5, duration=fixed(0.01))
+
+    assert without_window.run(rate=5, seconds=60, seed=1).to_dict()['meanBatchSize'] < 2
+    assert with_window.run(rate=5, seconds=60, seed=1).to_dict()['meanBatchSize'] > 9
+
+
+def test_failed_records_are_retried_after_visibility_timeout():
+    def fail_first_receive(record):
+        if record['attributes']['ApproximateReceiveCount'] == '1':
+            raise ValueError('first receive')
+
+    processor = BatchProcessor(fail_first_receive, max_workers=1)
+    simulator = EventSourceMappingSimulator(lambda event, context: processor.process(event['Records']),
+                                            visibility_timeout=5, duration=fixed(0.1))
+
+    report = simulator.run(rate=10, seconds=5, groups=2, seed=1)
+
+    assert report.failed == report.sent
+    assert report.processed == report.sent
+    assert report.to_dict()['queueAgeSeconds']['max'] >= 5
+
+
+def test_records_failing_too_often_are_dead_lettered():
+    def fail(event, context):
+        raise RuntimeError('broken')
+
+    simulator = EventSourceMappingSimulator(fail, visibility_timeout=1, max_receive_count=3, duration=fixed(0.1))
+
+    report = simulator.run(rate=10, seconds=2, groups=2, seed=1)
+
+    assert report.processed == 0
+    assert report.dead_lettered == report.sent
+    assert report.remaining == 0
+
+
+def test_timed_out_invocations_fail():
+    simulator = EventSourceMappingSimulator(succeed, function_timeout=1, duration=fixed(2))
+
+    report = simulator.run(rate=10, seconds=1, seed=1, timeout=5)
+
+    assert report.invocations > 0
+    assert report.errors == report.invocations
+    assert report.processed == 0
+
+
+def test_record_from_message():
+    message = {
+        'MessageId': 'id', 'ReceiptHandle': 'handle', 'MD5OfBody': 'md5', 'Body': '{}',
+        'Attributes': {'ApproximateReceiveCount': '1', 'MessageGroupId': 'group'},
+        'MessageAttributes': {'encoding': {'DataType': 'Binary', 'BinaryValue': b'\x00'}},
+    }
+
+    record = record_from_message(message, 'arn:aws:sqs:us-east-1:123456789012:q.fifo')
+
+    assert record['messageId'] == 'id'
+    assert record['attributes']['MessageGroupId'] == 'group'
+    assert record['messageAttributes']['encoding'] == {
+        'stringListValues': [], 'binaryListValues': [], 'dataType': 'Binary', 'binaryValue': 'AA=='}
+    assert record['awsRegion'] == 'us-east-1'
+
+
+def test_main(capsys):
+    assert main(['tests.unit.test_eventsource:succeed', '--rate', '10', '--seconds', '2', '--duration', '0.1',
+                 '--seed', '1']) == 0
+    assert '"processed"' in capsys.readouterr().out
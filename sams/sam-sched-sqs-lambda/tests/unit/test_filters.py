@@ -0,0 +1,172 @@
+import json
+
+import pytest
+
+from laur import filters
+from laur.claimcheck import CLAIM_CHECK, ClaimCheck, LocalBlobStore
+from laur.events import make_sqs_record
+from laur.filters import EventFilter, FilterPatternError, main, parse_pattern
+
+
+def record(body, **attributes):
+    raw = make_sqs_record(body if isinstance(body, str) else json.dumps(body), group_id='group-a')
+    raw['attributes'].update(attributes)
+    return raw
+
+
+def matches(pattern, raw) -> bool:
+    return EventFilter([pattern]).matches(raw)
+
+
+@pytest.mark.parametrize('matcher, value, expected', [
+    ('AAAA', 'AAAA', True),
+    ('AAAA', 'BBBB', False),
+    (None, None, True),
+    ('', '', True),
+    (1, 1.0, True),
+    (1, True, False),
+    ({'prefix': 'AA'}, 'AAAA', True),
+    ({'prefix': 'AA'}, 'BAAA', False),
+    ({'suffix': 'AB'}, 'AAAB', True),
+    ({'equals-ignore-case': 'aaaa'}, 'AaAa', True),
+    ({'numeric': ['>', 0, '<=', 5]}, 5, True),
+    ({'numeric': ['>', 0, '<=', 5]}, 0, False),
+    ({'numeric': ['=', 5]}, '5', False),
+    ({'anything-but': ['AAAA', 'BBBB']}, 'CCCC', True),
+    ({'anything-but': 'AAAA'}, 'AAAA', False),
+    ({'anything-but': {'prefix': 'A'}}, 'BAAA', True),
+    ({'anything-but': {'prefix': 'A'}}, 'AAAA', False),
+    ({'exists': True}, 'anything', True),
+])
+def test_matchers(matcher, value, expected):
+    assert matches({'body': {'RequestCode': [matcher]}}, record({'RequestCode': value})) is expected
+
+
+def test_exists_false_matches_a_missing_key():
+    assert matches({'body': {'RequestCode': [{'exists': False}]}}, record({'RecordNumber': 1}))
+    assert not matches({'body': {'RequestCode': [{'exists': False}]}}, record({'RequestCode': 'AAAA'}))
+    assert not matches({'body': {'RequestCode': [{'exists': True}]}}, record({'RecordNumber': 1}))
+
+
+def test_matchers_of_a_key_are_or_ed_and_keys_are_and_ed():
+    pattern = {'body': {'RequestCode': ['AAAA', {'prefix': 'B'}], 'RecordNumber': [{'numeric': ['<', 10]}]}}
+
+    assert matches(pattern, record({'RequestCode': 'BCCC', 'RecordNumber': 1}))
+    assert not matches(pattern, record({'RequestCode': 'BCCC', 'RecordNumber': 11}))
+    assert not matches(pattern, record({'RequestCode': 'CCCC', 'RecordNumber': 1}))
+
+
+def test_patterns_are_or_ed():
+    event_filter = EventFilter(['{"body": {"RequestCode": ["AAAA"]}}', {'attributes': {'MessageGroupId': ['group-b']}}])
+
+    assert event_filter.matches(record({'RequestCode': 'AAAA'}))
+    assert event_filter.matches(record({'RequestCode': 'BBBB'}, MessageGroupId='group-b'))
+    assert not event_filter.matches(record({'RequestCode': 'BBBB'}))
+
+
+def test_arrays_in_a_body_match_any_element():
+    pattern = {'body': {'items': {'kind': ['book']}}}
+
+    assert matches(pattern, record({'items': [{'kind': 'pen'}, {'kind': 'book'}]}))
+    assert not matches(pattern, record({'items': [{'kind': 'pen'}]}))
+
+
+def test_a_body_not_json_is_matched_as_a_string():
+    assert matches({'body': [{'prefix': 'hello'}]}, record('hello world'))
+    assert not matches({'body': {'message': ['hello world']}}, record('hello world'))
+
+
+def test_body_is_not_parsed_when_attributes_do_not_match(monkeypatch):
+    def fail(body):
+        raise AssertionError('The body was parsed')
+
+    monkeypatch.setattr(filters, '_decode_body', fail)
+    event_filter = EventFilter([{'body': {'RequestCode': ['AAAA']}, 'attributes': {'MessageGroupId': ['group-b']}}])
+
+    assert not event_filter.matches(record({'RequestCode': 'AAAA'}))
+
+
+def test_body_is_parsed_once_for_all_its_key_paths(monkeypatch):
+    parsed = []
+
+    def decode_body(body):
+        parsed.append(body)
+        return json.loads(body)
+
+    monkeypatch.setattr(filters, '_decode_body', decode_body)
+    event_filter = EventFilter([{'body': {'RequestCode': ['AAAA'], 'RecordNumber': [{'numeric': ['>', 0]}]}},
+                                {'body': {'TimeStamp': [{'exists': True}]}}])
+
+    assert event_filter.matches(record({'RequestCode': 'BBBB', 'RecordNumber': 1, 'TimeStamp': 'now'}))
+    assert len(parsed) == 1
+
+
+def test_body_conditions_match_the_payload_of_a_claim_check(tmp_path):
+    claim_check = ClaimCheck(LocalBlobStore(str(tmp_path)), threshold=10)
+    pointer, uri = claim_check.offload({'MessageBody': json.dumps({'RequestCode': 'AAAA', 'padding': 'x' * 100})})
+    raw = record(pointer['MessageBody'])
+    raw['messageAttributes'] = {CLAIM_CHECK: {'stringValue': uri, 'dataType': 'String'}}
+    pattern = {'body': {'RequestCode': ['AAAA']}}
+
+    # Like FilterCriteria, a filter without the claim check only sees the pointer.
+    assert not EventFilter([pattern]).matches(raw)
+    assert EventFilter([pattern], claim_check=claim_check).matches(raw)
+    assert claim_check.cache.get(uri) is not None
+
+
+def test_paths_are_shared_by_patterns():
+    event_filter = EventFilter([{'body': {'RequestCode': ['AAAA']}}, {'body': {'RequestCode': ['BBBB']}}])
+
+    assert event_filter.paths == [('body', 'RequestCode')]
+
+
+def test_filter_keeps_order():
+    records = [record({'RequestCode': code}) for code in ('AAAA', 'BBBB', 'AAAA')]
+
+    kept = EventFilter([{'body': {'RequestCode': ['AAAA']}}]).filter(records)
+
+    assert kept == [records[0], records[2]]
+
+
+@pytest.mark.parametrize('pattern', [
+    'not json',
+    {},
+    {'body': 'AAAA'},
+    {'body': {'RequestCode': []}},
+    {'body': {'RequestCode': [{'prefix': 1}]}},
+    {'body': {'RequestCode': [{'numeric': ['>', 'a']}]}},
+    {'body': {'RequestCode': [{'numeric': ['~', 1]}]}},
+    {'body': {'RequestCode': [{'exists': 'yes'}]}},
+    {'body': {'RequestCode': [{'wildcard': '*'}]}},
+    {'body': {'RequestCode': [{'prefix': 'A', 'suffix': 'B'}]}},
+])
+def test_invalid_patterns(pattern):
+    with pytest.raises(FilterPatternError):
+        EventFilter([pattern])
+
+
+def test_parse_pattern():
+    assert parse_pattern('{"body": {"a": {"b": [1]}}, "attributes": {"MessageGroupId": ["g"]}}') == [
+        (('body', 'a', 'b'), [1]),
+        (('attributes', 'MessageGroupId'), ['g']),
+    ]
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.delenv('EVENT_FILTER_PATTERNS', raising=False)
+    assert EventFilter.from_env() is None
+
+    monkeypatch.setenv('EVENT_FILTER_PATTERNS', '["{\\"body\\": {\\"RequestCode\\": [\\"AAAA\\"]}}"]')
+    assert EventFilter.from_env().matches(record({'RequestCode': 'AAAA'}))
+
+
+def test_main(tmp_path, capsys):
+    path = tmp_path / 'event.json'
+    path.write_text(json.dumps({'Records': [record({'RequestCode': 'AAAA'}), record({'RequestCode': 'BBBB'})]}))
+
+    assert main([str(path), '--pattern', '{"body": {"RequestCode": ["AAAA"]}}']) == 0
+
+    out = capsys.readouterr().out
+    assert out.count('MATCH') == 1
+    assert out.count('DROP') == 1
+    assert '1 of 2 records matched' in out
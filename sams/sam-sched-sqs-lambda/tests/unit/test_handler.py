@@ -1,8 +1,15 @@
+import io
 import json
+import os
+import subprocess
+import sys
 
 import pytest
 
 from lambda_handlers.hello_world import app
+from laur.claimcheck import ClaimCheck, LocalBlobStore
+from laur.events import LambdaContext, make_sqs_record
+from laur.filters import EventFilter
 
 
 @pytest.fixture()
@@ -43,3 +50,74 @@ def test_lambda_handler(sqs_event):
     assert 'batchItemFailures' in ret
     assert ret.get('batchItemFailures') is not None
     assert ret.get('batchItemFailures') == []
+
+
+def test_lambda_handler_drops_records_not_matching_filter_patterns(sqs_event, monkeypatch):
+    processed = []
+    monkeypatch.setattr(app, 'event_filter', EventFilter(['{"body": {"RequestCode": ["BBBB"]}}']))
+    monkeypatch.setattr(app.processor, 'record_handler', processed.append)
+
+    ret = app.lambda_handler(sqs_event, "")
+
+    assert ret.get('batchItemFailures') == []
+    assert processed == []
+
+
+def test_lambda_handler_deletes_the_blobs_of_records_it_drops(monkeypatch, tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    claim_check = ClaimCheck(store, threshold=100)
+    records = []
+    for code in ('AAAA', 'BBBB'):
+        entry, _ = claim_check.offload({'MessageBody': json.dumps({'RequestCode': code, 'padding': 'x' * 1000})})
+        attributes = {name: {'dataType': a['DataType'], 'stringValue': a['StringValue']}
+                      for name, a in entry['MessageAttributes'].items()}
+        records.append(make_sqs_record(entry['MessageBody'], message_attributes=attributes))
+    monkeypatch.setattr(app, 'claim_check', claim_check)
+    monkeypatch.setattr(app, 'event_filter', EventFilter(['{"body": {"RequestCode": ["AAAA"]}}'], claim_check))
+    monkeypatch.setattr(app.processor, 'success_handler', claim_check.discard_blobs)
+
+    ret = app.lambda_handler({'Records': records}, "")
+
+    assert ret.get('batchItemFailures') == []
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_lambda_handler_emits_metrics(sqs_event, monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setattr(app.metrics, 'stream', stream)
+
+    app.lambda_handler(sqs_event, "")
+
+    document = json.loads(stream.getvalue().splitlines()[0])
+    assert document['BatchSize'] == 1
+    assert document['Succeeded'] == 1
+    assert document['Failed'] == 0
+    assert len(document['MessageAge']) == 1
+
+
+def test_lambda_handler_reports_records_it_has_no_time_for(sqs_event):
+    ret = app.lambda_handler(sqs_event, LambdaContext(timeout_ms=100))
+
+    assert ret == {'batchItemFailures': [{'itemIdentifier': sqs_event['Records'][0]['messageId']}]}
+
+
+def test_the_first_report_has_the_init_phases_of_the_handler():
+    # A fresh interpreter, since this one imported the handler long before.
+    code = 'from lambda_handlers.hello_world import app; app.lambda_handler({"Records": []}, None)'
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+
+    report, = [json.loads(line) for line in result.stdout.splitlines() if '"Cold start"' in line]
+    assert report['cold'] is True
+    assert {'import', 'metrics', 'config', 'idempotency', 'claimCheck', 'sink', 'eventFilter', 'retryHandler',
+            'processor'} <= set(report['phasesMs'])
+    assert report['sinceImportMs'] >= sum(report['phasesMs'].values())
+
+
+def test_capture_is_not_imported_at_a_sample_rate_of_0():
+    code = 'import sys; from lambda_handlers.hello_world import app; print("laur.capture" in sys.modules)'
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), CAPTURE_SAMPLE_RATE='0')
+    env.pop('CAPTURE_PATH', None)
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+
+    assert result.stdout.splitlines()[-1] == 'False'
@@ -0,0 +1,148 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from laur.events import LambdaContext
+from laur.httpclient import DeadlineExceeded, HttpClient, get_http_client
+from laur.localsqs import VirtualClock
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Statuses to respond with before 200.
+    statuses = []
+
+    def do_GET(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture()
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    Handler.statuses = []
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture()
+def client():
+    client = HttpClient(clock=VirtualClock())
+    yield client
+    client.close()
+
+
+def test_connections_are_reused(server, client):
+    for _ in range(5):
+        assert client.get(f'{server}/items').json() == {'ok': True}
+
+    assert client.stats.to_dict() == {'requests': 5, 'connections': 1, 'reused': 4, 'retries': 0}
+
+
+def test_parallel_requests_open_a_connection_per_thread_at_most(server):
+    client = HttpClient(pool_maxsize=4)
+    barrier = threading.Barrier(4)
+
+    def call():
+        barrier.wait()
+        for _ in range(5):
+            client.get(f'{server}/items')
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    client.close()
+
+    assert client.stats.requests == 20
+    assert 1 <= client.stats.connections <= 4
+
+
+def test_backoff_has_full_jitter(client):
+    delays = [client.backoff(3) for _ in range(200)]
+
+    assert 0 <= min(delays) < max(delays) <= client.backoff_base * 8
+
+
+def test_retries_with_backoff(server, client):
+    Handler.statuses = [503, 429]
+
+    response = client.get(f'{server}/items')
+
+    assert response.status_code == 200
+    assert client.stats.retries == 2
+    assert client.stats.requests == 3
+
+
+def test_retries_are_bounded(server, client):
+    Handler.statuses = [503] * 5
+
+    assert client.get(f'{server}/items').status_code == 503
+    assert client.stats.retries == client.max_retries
+
+
+def test_post_is_not_retried_unless_asked(server, client):
+    Handler.statuses = [503, 503]
+
+    assert client.post(f'{server}/items', json={}).status_code == 503
+    assert client.post(f'{server}/items', json={}, retry=True).status_code == 200
+
+
+def test_connection_errors_are_retried(client):
+    with pytest.raises(requests.ConnectionError):
+        # Nothing listens on the port 9 of localhost.
+        client.get('http://127.0.0.1:9/items')
+
+    assert client.stats.retries == client.max_retries
+    assert client.stats.connections == client.max_retries + 1
+
+
+def test_requests_are_bounded_by_the_deadline(server, client):
+    clock = client.clock
+    client.bind(LambdaContext(timeout_ms=1000, clock=clock))
+
+    assert client._timeout(None) == (0.8, 0.8)
+    client.get(f'{server}/items')
+
+    clock.advance(0.9)
+    with pytest.raises(DeadlineExceeded):
+        client.get(f'{server}/items')
+    assert client.stats.requests == 1
+
+
+def test_retries_stop_at_the_deadline(server, client, monkeypatch):
+    monkeypatch.setattr(client, 'backoff', lambda attempt: 10)
+    client.bind(LambdaContext(timeout_ms=1000, clock=client.clock))
+    Handler.statuses = [503]
+
+    with pytest.raises(DeadlineExceeded):
+        client.get(f'{server}/items')
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv('HTTP_TIMEOUT', '1.5')
+    monkeypatch.setenv('HTTP_MAX_RETRIES', '0')
+    monkeypatch.setenv('BATCH_MAX_WORKERS', '3')
+
+    client = HttpClient.from_env()
+
+    assert (client.timeout, client.max_retries) == (1.5, 0)
+    assert client.session.get_adapter('https://example.com')._pool_maxsize == 3
+    assert get_http_client() is get_http_client()
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+from laur.idempotency import (COMPLETED, IN_PROGRESS, Entry, Idempotency, IdempotencyInProgressError, MemoryTier,
+                              SqliteStore, deduplication_id_key)
+from laur.localsqs import VirtualClock
+
+
+def make_record(message_id, deduplication_id=None):
+    attributes = {}
+    if deduplication_id is not None:
+        attributes['MessageDeduplicationId'] = deduplication_id
+    return {'messageId': message_id, 'body': '', 'attributes': attributes}
+
+
+@pytest.fixture()
+def clock():
+    return VirtualClock(start=1000)
+
+
+def test_completed_record_is_skipped(clock):
+    calls = []
+    idempotency = Idempotency(clock=clock)
+    handler = idempotency.record_handler(lambda record: calls.append(record['messageId']) or len(calls))
+
+    assert handler(make_record('m1')) == 1
+    assert handler(make_record('m1')) == 1
+    assert handler(make_record('m2')) == 2
+    assert calls == ['m1', 'm2']
+
+
+def test_completion_expires_after_ttl(clock):
+    calls = []
+    handler = Idempotency(ttl_seconds=60, clock=clock).record_handler(lambda record: calls.append(1))
+    handler(make_record('m1'))
+    clock.advance(60)
+    handler(make_record('m1'))
+    assert len(calls) == 2
+
+
+def test_failed_record_is_retried(clock):
+    attempts = []
+
+    def handler(record):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('failed')
+
+    wrapped = Idempotency(clock=clock).record_handler(handler)
+    with pytest.raises(RuntimeError):
+        wrapped(make_record('m1'))
+    wrapped(make_record('m1'))
+    assert len(attempts) == 2
+
+
+def test_concurrent_duplicate_fails_while_in_progress(clock):
+    idempotency = Idempotency(clock=clock)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(record):
+        started.set()
+        release.wait(5)
+
+    handler = idempotency.record_handler(slow)
+    thread = threading.Thread(target=handler, args=(make_record('m1'),))
+    thread.start()
+    started.wait(5)
+    try:
+        with pytest.raises(IdempotencyInProgressError):
+            handler(make_record('m1'))
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_persistent_store_is_shared_between_instances(clock, tmp_path):
+    path = str(tmp_path / 'idempotency.db')
+    calls = []
+    first = Idempotency(store=SqliteStore(path), clock=clock).record_handler(lambda record: calls.append(1))
+    second = Idempotency(store=SqliteStore(path), clock=clock).record_handler(lambda record: calls.append(2))
+
+    first(make_record('m1'))
+    second(make_record('m1'))
+    assert calls == [1]
+
+
+def test_sqlite_lease_is_taken_once_until_it_expires(clock):
+    store = SqliteStore()
+    now = clock.time()
+    assert store.acquire(Entry('k', IN_PROGRESS, now + 10), now) is True
+    assert store.acquire(Entry('k', IN_PROGRESS, now + 10), now) is False
+    assert store.acquire(Entry('k', IN_PROGRESS, now + 20), now + 10) is True
+
+    store.put(Entry('k', COMPLETED, now + 100, {'done': True}))
+    assert store.get('k', now).result == {'done': True}
+
+
+def test_memory_tier_evicts_least_recently_used():
+    memory = MemoryTier(max_items=2)
+    for key in ['a', 'b']:
+        memory.put(Entry(key, COMPLETED, 100))
+    memory.get('a', 0)
+    memory.put(Entry('c', COMPLETED, 100))
+    assert memory.get('a', 0) is not None
+    assert memory.get('b', 0) is None
+
+
+def test_memory_tier_lease_is_taken_by_one_of_concurrent_threads():
+    class SlowEntries(OrderedDict):
+        """
+        Widens the window between checking for a live entry and putting the new one.
+        """
+
+        def get(self, key, default=None):
+            value = super().get(key, default)
+            time.sleep(0.001)
+            return value
+
+    for _ in range(20):
+        memory = MemoryTier()
+        memory._entries = SlowEntries()
+        barrier = threading.Barrier(8)
+        acquired = []
+
+        def acquire():
+            barrier.wait()
+            acquired.append(memory.acquire(Entry('k', IN_PROGRESS, 100), 0))
+
+        threads = [threading.Thread(target=acquire) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(acquired) == [False] * 7 + [True]
+
+
+def test_deduplication_id_key():
+    assert deduplication_id_key(make_record('m1', 'd1')) == 'd1'
+    assert deduplication_id_key(make_record('m1')) == 'm1'
+
+
+def test_forgotten_record_is_processed_again(clock, tmp_path):
+    calls = []
+    idempotency = Idempotency(store=SqliteStore(str(tmp_path / 'idempotency.db')), clock=clock)
+    handler = idempotency.record_handler(lambda record: calls.append(record['messageId']))
+
+    handler(make_record('m1'))
+    idempotency.forget(make_record('m1'))
+    handler(make_record('m1'))
+    assert calls == ['m1', 'm1']
@@ -0,0 +1,97 @@
+import io
+import json
+import logging
+
+import pytest
+
+from laur.jsonlog import JsonFormatter, LogContext, StructuredLogger, get_logger
+
+
+class FakeContext:
+    aws_request_id = 'request-id'
+
+
+@pytest.fixture()
+def stream():
+    return io.StringIO()
+
+
+def lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def make_logger(stream, name, level=logging.INFO, sample_rate=0.0, **kwargs):
+    context = LogContext()
+    logger = logging.getLogger(name)
+    logger.handlers = []
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter(context=context, **kwargs))
+    logger.addHandler(handler)
+    logger.propagate = False
+    logger.setLevel(level)
+    return StructuredLogger(logger, sample_rate=sample_rate, context=context)
+
+
+def test_fields_and_context_are_emitted(stream):
+    logger = make_logger(stream, 'test.jsonlog.fields')
+    logger.bind_invocation(FakeContext())
+    logger.bind_record({'messageId': 'm1', 'attributes': {'MessageGroupId': 'g1'}})
+
+    logger.info('Processed %s', 'a record', size=3)
+
+    line = lines(stream)[0]
+    assert line['message'] == 'Processed a record'
+    assert line['level'] == 'INFO'
+    assert line['size'] == 3
+    assert line['requestId'] == 'request-id'
+    assert line['messageId'] == 'm1'
+    assert line['messageGroupId'] == 'g1'
+
+
+def test_fields_are_not_serialized_when_the_level_is_disabled(stream):
+    class Unserializable:
+        def __str__(self):
+            raise AssertionError('must not be serialized')
+
+    logger = make_logger(stream, 'test.jsonlog.disabled')
+    logger.debug('Received event', event=Unserializable())
+    assert stream.getvalue() == ''
+
+
+def test_long_strings_are_truncated_and_keys_are_redacted(stream):
+    logger = make_logger(stream, 'test.jsonlog.truncate', max_field_length=10, redact_keys=['receiptHandle'])
+    logger.info('Record', record={'body': 'x' * 30, 'receiptHandle': 'secret'})
+
+    record = lines(stream)[0]['record']
+    assert record['body'] == 'x' * 10 + '...(+20 chars)'
+    assert record['receiptHandle'] == '[REDACTED]'
+
+
+def test_sampled_debug(stream):
+    never = make_logger(stream, 'test.jsonlog.never', level=logging.DEBUG, sample_rate=0.0)
+    always = make_logger(stream, 'test.jsonlog.always', level=logging.DEBUG, sample_rate=1.0)
+    for _ in range(5):
+        never.sampled_debug('never')
+        always.sampled_debug('always')
+    assert [line['message'] for line in lines(stream)] == ['always'] * 5
+    assert all(line['sampled'] for line in lines(stream))
+
+
+def test_sampled_debug_bypasses_the_level(stream):
+    logger = make_logger(stream, 'test.jsonlog.sampled', level=logging.INFO, sample_rate=1.0)
+    logger.debug('not sampled')
+    logger.sampled_debug('sampled', size=3)
+
+    line, = lines(stream)
+    assert line['message'] == 'sampled'
+    assert line['level'] == 'DEBUG'
+    assert line['size'] == 3
+
+
+def test_get_logger_adds_a_handler_once(stream, monkeypatch):
+    monkeypatch.setenv('LOG_LEVEL', 'WARNING')
+    first = get_logger('test.jsonlog.once', stream=stream)
+    get_logger('test.jsonlog.once', stream=stream)
+    first.warning('once')
+    assert len(lines(stream)) == 1
+    assert first.isEnabledFor(logging.INFO) is False
@@ -0,0 +1,120 @@
+import os
+import sys
+
+import pytest
+
+from laur import layerbuild
+
+
+def write(path, text=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def install_fake(target, name, top_level, version='1.0'):
+    dist_info = os.path.join(target, f'{name.replace("-", "_")}-{version}.dist-info')
+    write(os.path.join(target, top_level, '__init__.py'), 'VALUE = 1\n')
+    write(os.path.join(dist_info, 'METADATA'), f'Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n')
+    write(os.path.join(dist_info, 'LICENSE'), 'license')
+    write(os.path.join(dist_info, 'WHEEL'), 'wheel')
+    write(os.path.join(dist_info, 'RECORD'), '\n'.join([
+        f'{top_level}/__init__.py,sha256=x,10',
+        f'{os.path.basename(dist_info)}/METADATA,,',
+        '../../bin/tool,,',
+    ]))
+
+
+def test_drop_distributions(tmp_path):
+    target = str(tmp_path)
+    install_fake(target, 'python-dateutil', 'dateutil')
+    install_fake(target, 'requests', 'requests')
+
+    dropped = layerbuild.drop_distributions(target, layerbuild.RUNTIME_PROVIDED)
+
+    assert dropped == ['python-dateutil']
+    assert sorted(os.listdir(target)) == ['requests', 'requests-1.0.dist-info']
+
+
+def test_strip(tmp_path):
+    target = str(tmp_path)
+    install_fake(target, 'requests', 'requests')
+    write(os.path.join(target, 'requests', 'tests', 'test_a.py'), 'x' * 100)
+    write(os.path.join(target, 'requests', 'api.pyi'), 'x' * 10)
+    write(os.path.join(target, 'bin', 'tool'), 'x')
+
+    removed = layerbuild.strip(target)
+
+    assert removed >= 110
+    assert sorted(os.listdir(os.path.join(target, 'requests'))) == ['__init__.py']
+    assert sorted(os.listdir(os.path.join(target, 'requests-1.0.dist-info'))) == ['LICENSE', 'METADATA']
+    assert not os.path.exists(os.path.join(target, 'bin'))
+
+
+@pytest.mark.skipif(sys.version_info[:2] != layerbuild.TARGET_VERSION, reason='Not the version of the runtime')
+def test_precompile_writes_unchecked_hash_based_pycs(tmp_path):
+    target = str(tmp_path)
+    write(os.path.join(target, 'pkg', '__init__.py'), 'VALUE = 1\n')
+
+    assert layerbuild.precompile(target)
+
+    cache = os.path.join(target, 'pkg', '__pycache__')
+    pyc, = os.listdir(cache)
+    with open(os.path.join(cache, pyc), 'rb') as f:
+        header = f.read(8)
+    # The flags of PEP 552: hash based and not checked against the source.
+    assert int.from_bytes(header[4:8], 'little') == 0b01
+
+
+def test_parse_import_times():
+    stderr = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       120 |        120 |     _json',
+        'import time:       300 |        420 |   json',
+        'import time:        50 |        470 | laur.jsonlog',
+        'unrelated',
+    ])
+
+    assert layerbuild.parse_import_times(stderr) == {
+        '_json': {'selfUs': 120, 'cumulativeUs': 120},
+        'json': {'selfUs': 300, 'cumulativeUs': 420},
+        'laur.jsonlog': {'selfUs': 50, 'cumulativeUs': 470},
+    }
+
+
+def test_build_without_requirements(tmp_path):
+    package = os.path.join(str(tmp_path), 'src', 'laur')
+    write(os.path.join(package, '__init__.py'))
+    write(os.path.join(package, 'a.py'), 'import json\n')
+    write(os.path.join(package, '__pycache__', 'stale.pyc'), 'x')
+    output = os.path.join(str(tmp_path), 'layer', 'python')
+
+    report = layerbuild.build(output, None, package, precompiled=False)
+
+    assert list(report['importTimesUs']) == ['laur.a']
+    assert report['importTimesUs']['laur.a']['cumulativeUs'] > 0
+    assert list(report['packages']) == ['laur']
+    assert report['layerBytes'] == report['packages']['laur']
+    assert not os.path.exists(os.path.join(output, 'laur', '__pycache__', 'stale.pyc'))
+
+
+def test_dev_modules_are_left_out_of_the_layer(tmp_path):
+    package = os.path.join(str(tmp_path), 'src', 'laur')
+    for name in ('__init__', 'capture', 'replay', 'localsqs'):
+        write(os.path.join(package, f'{name}.py'))
+    output = os.path.join(str(tmp_path), 'layer', 'python')
+
+    report = layerbuild.build(output, None, package, precompiled=False)
+
+    assert list(report['importTimesUs']) == ['laur.capture']
+    assert sorted(os.listdir(os.path.join(output, 'laur'))) == ['__init__.py', 'capture.py']
+
+
+def test_no_module_of_the_layer_imports_a_dev_module(tmp_path):
+    package = os.path.dirname(layerbuild.__file__)
+    layerbuild.copy_package(package, str(tmp_path))
+    modules = layerbuild.laur_modules(package)
+
+    times = layerbuild.measure_import_times(modules, [str(tmp_path)])
+
+    assert set(modules) <= set(times)
@@ -0,0 +1,120 @@
+import json
+
+import boto3
+import pytest
+
+from laur.localsqs import LocalSqs, LocalSqsError, LocalSqsServer, VirtualClock
+
+
+@pytest.fixture()
+def sqs():
+    return LocalSqs(clock=VirtualClock(start=1700000000))
+
+
+@pytest.fixture()
+def fifo_queue_url(sqs):
+    return sqs.create_queue(QueueName='test.fifo', Attributes={
+        'FifoQueue': 'true',
+        'ContentBasedDeduplication': 'true',
+        'MessageRetentionPeriod': '60',
+        'ReceiveMessageWaitTimeSeconds': '10',
+        'VisibilityTimeout': '10',
+    })['QueueUrl']
+
+
+def bodies(response):
+    return [message['Body'] for message in response.get('Messages', [])]
+
+
+def test_group_is_locked_while_a_message_is_in_flight(sqs, fifo_queue_url):
+    for body in ['a1', 'a2', 'b1']:
+        sqs.send_message(QueueUrl=fifo_queue_url, MessageBody=body, MessageGroupId=body[0])
+
+    first = sqs.receive_message(QueueUrl=fifo_queue_url)
+    assert bodies(first) == ['a1']
+    assert bodies(sqs.receive_message(QueueUrl=fifo_queue_url, MaxNumberOfMessages=10)) == ['b1']
+
+    sqs.delete_message(QueueUrl=fifo_queue_url, ReceiptHandle=first['Messages'][0]['ReceiptHandle'])
+    assert bodies(sqs.receive_message(QueueUrl=fifo_queue_url, WaitTimeSeconds=0)) == ['a2']
+
+
+def test_long_polling_advances_the_virtual_clock_until_visibility_timeout(sqs, fifo_queue_url):
+    sqs.send_message(QueueUrl=fifo_queue_url, MessageBody='a', MessageGroupId='g')
+    sqs.receive_message(QueueUrl=fifo_queue_url)
+    started_at = sqs.clock.time()
+
+    response = sqs.receive_message(QueueUrl=fifo_queue_url, WaitTimeSeconds=20,
+                                   MessageSystemAttributeNames=['ApproximateReceiveCount'])
+
+    assert bodies(response) == ['a']
+    assert response['Messages'][0]['Attributes'] == {'ApproximateReceiveCount': '2'}
+    assert sqs.clock.time() - started_at == 10
+
+
+def test_content_based_deduplication_interval(sqs, fifo_queue_url):
+    sent1 = sqs.send_message(QueueUrl=fifo_queue_url, MessageBody='same', MessageGroupId='g1')
+    sent2 = sqs.send_message(QueueUrl=fifo_queue_url, MessageBody='same', MessageGroupId='g2')
+    assert sent1['MessageId'] == sent2['MessageId']
+
+    sqs.clock.advance(300)
+    sqs.send_message(QueueUrl=fifo_queue_url, MessageBody='same', MessageGroupId='g2')
+    assert bodies(sqs.receive_message(QueueUrl=fifo_queue_url, MaxNumberOfMessages=10)) == ['same']
+
+
+def test_messages_expire_after_retention_period(sqs, fifo_queue_url):
+    sqs.send_message(QueueUrl=fifo_queue_url, MessageBody='a', MessageGroupId='g')
+    sqs.clock.advance(60)
+    assert sqs.receive_message(QueueUrl=fifo_queue_url, WaitTimeSeconds=0) == {}
+
+
+def test_delay_seconds_of_a_standard_queue(sqs):
+    queue_url = sqs.create_queue(QueueName='standard')['QueueUrl']
+    sqs.send_message(QueueUrl=queue_url, MessageBody='a', DelaySeconds=5)
+
+    attributes = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['All'])['Attributes']
+    assert attributes['ApproximateNumberOfMessagesDelayed'] == '1'
+    assert sqs.receive_message(QueueUrl=queue_url, WaitTimeSeconds=0) == {}
+    assert bodies(sqs.receive_message(QueueUrl=queue_url, WaitTimeSeconds=5)) == ['a']
+
+
+def test_fifo_queue_requires_message_group_id(sqs, fifo_queue_url):
+    with pytest.raises(LocalSqsError) as ex_info:
+        sqs.send_message(QueueUrl=fifo_queue_url, MessageBody='a')
+    assert ex_info.value.code == 'MissingParameter'
+
+
+def test_redrive_policy_moves_a_message_to_the_dead_letter_queue(sqs):
+    dlq_url = sqs.create_queue(QueueName='dlq')['QueueUrl']
+    queue_url = sqs.create_queue(QueueName='source', Attributes={
+        'VisibilityTimeout': '0',
+        'RedrivePolicy': json.dumps({'deadLetterTargetArn': sqs.queue_arn('dlq'), 'maxReceiveCount': 2}),
+    })['QueueUrl']
+    sqs.send_message(QueueUrl=queue_url, MessageBody='poison')
+
+    assert bodies(sqs.receive_message(QueueUrl=queue_url)) == ['poison']
+    assert bodies(sqs.receive_message(QueueUrl=queue_url)) == ['poison']
+    assert sqs.receive_message(QueueUrl=queue_url) == {}
+    assert bodies(sqs.receive_message(QueueUrl=dlq_url)) == ['poison']
+
+
+def test_boto3_client_factory(sqs, fifo_queue_url):
+    client = sqs.client()
+    client.send_message(QueueUrl=fifo_queue_url, MessageBody='a', MessageGroupId='g')
+    assert bodies(client.receive_message(QueueUrl=fifo_queue_url)) == ['a']
+
+    with pytest.raises(client.exceptions.QueueDoesNotExist) as ex_info:
+        client.get_queue_url(QueueName='no-such-queue')
+    assert ex_info.value.response['Error']['Code'] == 'AWS.SimpleQueueService.NonExistentQueue'
+
+
+def test_endpoint_url(sqs):
+    with LocalSqsServer(sqs) as server:
+        client = boto3.client('sqs', endpoint_url=server.endpoint_url, region_name='us-east-1',
+                              aws_access_key_id='local', aws_secret_access_key='local')
+        queue_url = client.create_queue(QueueName='served')['QueueUrl']
+        client.send_message(QueueUrl=queue_url, MessageBody='a')
+        assert bodies(client.receive_message(QueueUrl=queue_url)) == ['a']
+
+        with pytest.raises(client.exceptions.QueueDoesNotExist) as ex_info:
+            client.get_queue_url(QueueName='no-such-queue')
+        assert ex_info.value.response['Error']['Code'] == 'AWS.SimpleQueueService.NonExistentQueue'
@@ -0,0 +1,98 @@
+import io
+import json
+
+from laur.events import make_sqs_record
+from laur.metrics import MAX_VALUES, EmfMetrics
+
+
+def test_documents_follow_the_embedded_metric_format():
+    metrics = EmfMetrics(namespace='ns', dimensions={'AppId': 'app', 'AppEnv': 'dev'})
+    metrics.count('Failed')
+    metrics.count('Failed', 2)
+    metrics.observe('RecordProcessingTime', 1.5)
+    metrics.set_property('requestId', 'request-1')
+
+    document, = metrics.documents(timestamp=1700000000)
+
+    assert document == {
+        'requestId': 'request-1',
+        'AppId': 'app',
+        'AppEnv': 'dev',
+        'Failed': 3,
+        'RecordProcessingTime': [1.5],
+        '_aws': {
+            'Timestamp': 1700000000000,
+            'CloudWatchMetrics': [{
+                'Namespace': 'ns',
+                'Dimensions': [['AppId', 'AppEnv']],
+                'Metrics': [{'Name': 'Failed', 'Unit': 'Count'}, {'Name': 'RecordProcessingTime', 'Unit': 'Milliseconds'}],
+            }],
+        },
+    }
+    assert metrics.documents() == []
+
+
+def test_long_distributions_are_split_over_documents():
+    metrics = EmfMetrics()
+    metrics.count('BatchSize', 250)
+    for value in range(250):
+        metrics.observe('RecordProcessingTime', value)
+
+    documents = metrics.documents()
+
+    assert [len(document['RecordProcessingTime']) for document in documents] == [MAX_VALUES, MAX_VALUES, 50]
+    assert [document.get('BatchSize') for document in documents] == [250, None, None]
+    assert [len(document['_aws']['CloudWatchMetrics'][0]['Metrics']) for document in documents] == [2, 1, 1]
+
+
+def test_observe_records():
+    metrics = EmfMetrics()
+    records = [make_sqs_record('{}', sent_timestamp=1000), make_sqs_record('{}', sent_timestamp=2000)]
+
+    metrics.observe_records(records, now=3)
+
+    document, = metrics.documents()
+    assert document['BatchSize'] == 2
+    assert document['QueueDwellTime'] == [2, 2]
+    assert document['MessageAge'] == [2000, 1000]
+
+
+def test_timed_observes_calls_that_raise():
+    metrics = EmfMetrics()
+
+    @metrics.timed('Elapsed')
+    def fail():
+        raise ValueError()
+
+    for _ in range(2):
+        try:
+            fail()
+        except ValueError:
+            pass
+
+    assert len(metrics.documents()[0]['Elapsed']) == 2
+
+
+def test_flush_writes_json_lines():
+    stream = io.StringIO()
+    metrics = EmfMetrics(stream=stream)
+    metrics.count('Succeeded', 10)
+
+    metrics.flush()
+    metrics.flush()
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])['Succeeded'] == 10
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv('METRICS_NAMESPACE', 'my-app')
+    monkeypatch.setenv('APP_ID', 'my-app')
+    monkeypatch.delenv('APP_ENV', raising=False)
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'my-function')
+
+    metrics = EmfMetrics.from_env()
+
+    assert metrics.namespace == 'my-app'
+    assert dict(metrics.dimensions) == {'AppId': 'my-app', 'FunctionName': 'my-function'}
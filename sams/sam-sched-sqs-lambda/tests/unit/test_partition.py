@@ -0,0 +1,73 @@
+import pytest
+
+from laur.partition import GroupPartitioner, SkewReport, jump_hash, key_hash
+
+KEYS = [f'customer-{idx}' for idx in range(20000)]
+
+
+def test_key_hash_is_stable():
+    assert key_hash('customer-1') == key_hash('customer-1')
+    assert key_hash('customer-1') != key_hash('customer-2')
+    assert 0 <= key_hash('customer-1') < 2 ** 64
+
+
+def test_jump_hash_stays_in_range():
+    assert {jump_hash(key_hash(key), 7) for key in KEYS} == set(range(7))
+    assert jump_hash(key_hash('customer-1'), 1) == 0
+    with pytest.raises(ValueError):
+        jump_hash(1, 0)
+
+
+def test_an_entity_always_maps_to_the_same_group():
+    partitioner = GroupPartitioner(groups=100)
+
+    assert partitioner.group_id('customer-1') == GroupPartitioner(groups=100).group_id('customer-1')
+    assert partitioner.group_id('customer-1').startswith('message-group-id-')
+
+
+def test_keys_spread_evenly():
+    report = GroupPartitioner(groups=100).skew(KEYS)
+
+    assert report.total == len(KEYS)
+    assert report.empty_groups == 0
+    assert report.ratio < 1.3
+
+
+def test_resizing_moves_few_keys():
+    partitioner = GroupPartitioner(groups=100)
+
+    # Growing from 100 to 110 groups must move about 10 / 110 of keys, and never between old groups.
+    moved = partitioner.moved_fraction(KEYS, 110)
+    assert 0.06 < moved < 0.12
+    grown = partitioner.resized(110)
+    for key in KEYS[:2000]:
+        new_index = grown.group_index(key)
+        assert new_index == partitioner.group_index(key) or new_index >= 100
+
+
+def test_assign_sets_message_group_ids():
+    entries = [{'MessageBody': '{}', 'customer': 'customer-1'}, {'MessageBody': '{}', 'customer': 'customer-2'}]
+
+    assigned = GroupPartitioner(groups=10, prefix='g-').assign(entries, key_of=lambda entry: entry['customer'])
+
+    assert [entry['MessageGroupId'] for entry in assigned] == [
+        GroupPartitioner(10, 'g-').group_id('customer-1'), GroupPartitioner(10, 'g-').group_id('customer-2')]
+    assert 'MessageGroupId' not in entries[0]
+
+
+def test_skew_with_weights_finds_hot_groups():
+    partitioner = GroupPartitioner(groups=10)
+    keys = KEYS[:1000]
+    weights = [100 if key == 'customer-0' else 1 for key in keys]
+
+    report = partitioner.skew(keys, weights)
+
+    assert report.total == 1099
+    assert partitioner.group_index('customer-0') in report.hot_groups()
+
+
+def test_skew_report():
+    report = SkewReport([2, 0, 4, 2])
+
+    assert report.to_dict() == {'groups': 4, 'total': 8, 'mean': 2.0, 'max': 4, 'ratio': 2.0, 'emptyGroups': 1,
+                                'hotGroups': [2]}
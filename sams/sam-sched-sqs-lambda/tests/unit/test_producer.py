@@ -0,0 +1,130 @@
+import pytest
+
+from laur.localsqs import LocalSqs, VirtualClock
+from laur.producer import MAX_BATCH_BYTES, PRECEDING_MESSAGE_FAILED, BatchProducer
+
+
+@pytest.fixture()
+def sqs():
+    return LocalSqs(clock=VirtualClock())
+
+
+@pytest.fixture()
+def fifo_queue_url(sqs):
+    return sqs.create_queue(QueueName='test.fifo', Attributes={'FifoQueue': 'true'})['QueueUrl']
+
+
+class CountingClient:
+    def __init__(self, sqs, fail_once=()):
+        self.sqs = sqs
+        self.calls = []
+        self.fail_once = set(fail_once)
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.calls.append([entry['Id'] for entry in Entries])
+        failing = [entry for entry in Entries if entry['Id'] in self.fail_once]
+        self.fail_once.difference_update(entry['Id'] for entry in failing)
+        response = self.sqs.send_message_batch(QueueUrl=QueueUrl, Entries=[e for e in Entries if e not in failing])
+        response['Failed'].extend({'Id': e['Id'], 'Code': 'InternalError', 'SenderFault': False} for e in failing)
+        return response
+
+
+def receive_all(sqs, queue_url):
+    bodies = []
+    while True:
+        messages = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=0).get('Messages')
+        if not messages:
+            return bodies
+        for message in messages:
+            bodies.append(message['Body'])
+            sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=message['ReceiptHandle'])
+
+
+def test_messages_are_packed_into_batches(sqs, fifo_queue_url):
+    client = CountingClient(sqs)
+    producer = BatchProducer(fifo_queue_url, client=client, max_workers=1)
+
+    result = producer.send({'MessageBody': f'{n}', 'MessageGroupId': 'g'} for n in range(25))
+
+    assert len(result.successful) == 25
+    assert result.calls == 3
+    assert [len(call) for call in client.calls] == [10, 10, 5]
+    assert receive_all(sqs, fifo_queue_url) == [str(n) for n in range(25)]
+
+
+def test_order_in_a_group_is_kept_across_workers(sqs, fifo_queue_url):
+    producer = BatchProducer(fifo_queue_url, client=sqs.client(), max_workers=4)
+    messages = [{'MessageBody': f'{group}-{n}', 'MessageGroupId': group} for n in range(15) for group in 'abcde']
+
+    result = producer.send(messages)
+
+    assert result.failed == []
+    received = receive_all(sqs, fifo_queue_url)
+    for group in 'abcde':
+        assert [body for body in received if body.startswith(group)] == [f'{group}-{n}' for n in range(15)]
+
+
+def test_batches_respect_the_size_limit():
+    body = 'x' * (MAX_BATCH_BYTES // 3)
+    batches = BatchProducer.pack([{'Id': str(n), 'MessageBody': body} for n in range(7)])
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+
+def test_only_failed_entries_are_retried(sqs, fifo_queue_url):
+    client = CountingClient(sqs, fail_once={'1', '3'})
+    producer = BatchProducer(fifo_queue_url, client=client, max_workers=1)
+
+    result = producer.send({'MessageBody': f'{n}', 'MessageGroupId': f'g{n}'} for n in range(5))
+
+    assert [entry['Id'] for entry in result.successful] == ['0', '1', '2', '3', '4']
+    assert client.calls == [['0', '1', '2', '3', '4'], ['1', '3']]
+
+
+def test_unique_deduplication_sends_the_same_body_twice(sqs, fifo_queue_url):
+    content = BatchProducer(fifo_queue_url, client=sqs.client())
+    content.send([{'MessageBody': 'same', 'MessageGroupId': 'g1'}, {'MessageBody': 'same', 'MessageGroupId': 'g2'}])
+    assert receive_all(sqs, fifo_queue_url) == ['same']
+
+    unique = BatchProducer(fifo_queue_url, client=sqs.client(), deduplication='unique')
+    unique.send([{'MessageBody': 'same', 'MessageGroupId': 'g1'}, {'MessageBody': 'same', 'MessageGroupId': 'g2'}])
+    assert receive_all(sqs, fifo_queue_url) == ['same', 'same']
+
+
+def test_too_large_message_fails_without_a_call(sqs, fifo_queue_url):
+    client = CountingClient(sqs)
+    result = BatchProducer(fifo_queue_url, client=client).send(
+        [{'MessageBody': 'x' * (MAX_BATCH_BYTES + 1), 'MessageGroupId': 'g'}])
+
+    assert result.failed[0]['SenderFault'] is True
+    assert client.calls == []
+
+
+def test_a_failure_in_the_middle_of_a_group_stops_the_group(sqs, fifo_queue_url):
+    client = CountingClient(sqs, fail_once={'2'})
+    producer = BatchProducer(fifo_queue_url, client=client, max_workers=1)
+    messages = [{'MessageBody': f'g-{n}', 'MessageGroupId': 'g'} for n in range(15)]
+    messages.insert(3, {'MessageBody': 'h-0', 'MessageGroupId': 'h'})
+    messages.append({'MessageBody': 'h-1', 'MessageGroupId': 'h'})
+
+    result = producer.send(messages)
+
+    # 2 is not retried after later entries of its group were accepted, and the next batch of the group is not sent.
+    assert client.calls == [[str(n) for n in range(10)], ['16']]
+    assert [entry['Id'] for entry in result.failed] == ['2'] + [str(n) for n in range(10, 16)]
+    assert result.failed[0]['Code'] == 'InternalError'
+    assert {entry['Code'] for entry in result.failed[1:]} == {PRECEDING_MESSAGE_FAILED}
+    assert receive_all(sqs, fifo_queue_url) == ['g-0', 'g-1', 'h-0'] + [f'g-{n}' for n in range(3, 9)] + ['h-1']
+
+
+def test_a_too_large_message_fails_the_rest_of_its_group(sqs, fifo_queue_url):
+    client = CountingClient(sqs)
+    result = BatchProducer(fifo_queue_url, client=client, max_workers=1).send([
+        {'MessageBody': 'a-0', 'MessageGroupId': 'a'},
+        {'MessageBody': 'x' * (MAX_BATCH_BYTES + 1), 'MessageGroupId': 'a'},
+        {'MessageBody': 'a-2', 'MessageGroupId': 'a'},
+        {'MessageBody': 'b-0', 'MessageGroupId': 'b'},
+    ])
+
+    assert [(entry['Id'], entry['Code']) for entry in result.failed] == [
+        ('1', 'InvalidParameterValue'), ('2', PRECEDING_MESSAGE_FAILED)]
+    assert receive_all(sqs, fifo_queue_url) == ['a-0', 'b-0']
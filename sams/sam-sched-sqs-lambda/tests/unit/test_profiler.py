@@ -0,0 +1,118 @@
+import io
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from laur.batch import BatchProcessor
+from laur.events import LambdaContext, make_sqs_event
+from laur.profiler import PROFILE_KEY, Profiler, StackSampler, collapse
+
+
+def slow_handler(event, context):
+    # Allocate and spin in a function of its own, so that it shows in every part of the profile.
+    held = [bytearray(1024) for _ in range(256)]
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    return {'batchItemFailures': [], 'held': len(held)}
+
+
+def test_collapse_lists_the_stack_outermost_first():
+    def inner():
+        return collapse(sys._getframe())
+
+    labels = inner().split(';')
+
+    assert labels[-1].startswith('inner (test_profiler.py:')
+    assert labels[-2].startswith('test_collapse_lists_the_stack_outermost_first (test_profiler.py:')
+
+
+def test_stack_sampler_samples_workers_but_not_idle_threads():
+    stop = threading.Event()
+    idle = threading.Thread(target=stop.wait, name='idle')
+    idle.start()
+    processor = BatchProcessor(lambda record: slow_handler(None, None), max_workers=2)
+    sampler = StackSampler(interval=0.002)
+    try:
+        sampler.start()
+        processor.process(make_sqs_event(4, groups=2)['Records'])
+    finally:
+        sampler.stop()
+        stop.set()
+        idle.join()
+        processor.shutdown()
+
+    collapsed = sampler.collapsed()
+    assert sampler.samples > 0
+    assert any('process_group (batch.py' in line and 'slow_handler (test_profiler.py' in line for line in collapsed)
+    # The idle thread only ever runs the standard library.
+    assert all('test_profiler.py' in line or 'batch.py' in line for line in collapsed)
+
+
+def test_slow_invocations_are_dumped_to_the_log():
+    stream = io.StringIO()
+    handler = Profiler(threshold_ms=10, interval_ms=1, stream=stream).profile(slow_handler)
+
+    assert handler({}, LambdaContext())['held'] == 256
+
+    profile = json.loads(stream.getvalue())[PROFILE_KEY]
+    assert profile['durationMs'] >= 50
+    assert any('slow_handler (test_profiler.py' in line for line in profile['collapsed'])
+    assert any(function['function'].startswith('slow_handler') for function in profile['topFunctions'])
+    assert any('test_profiler.py' in allocation['location'] for allocation in profile['topAllocations'])
+    assert not tracemalloc.is_tracing()
+
+
+def test_fast_invocations_are_not_dumped():
+    stream = io.StringIO()
+    handler = Profiler(threshold_ms=60000, stream=stream).profile(lambda event, context: 'done')
+
+    assert handler({}, None) == 'done'
+    assert stream.getvalue() == ''
+
+
+def test_invocations_out_of_the_sample_are_not_profiled(monkeypatch):
+    profiler = Profiler(sample_rate=0.000001, threshold_ms=0, stream=io.StringIO())
+    monkeypatch.setattr(profiler, '_run', None)
+
+    assert profiler.profile(lambda event, context: 'done')({}, None) == 'done'
+
+
+def test_profiles_are_written_to_a_directory_and_the_oldest_removed(tmp_path):
+    output = str(tmp_path / 'profiles')
+    handler = Profiler(threshold_ms=0, output=output, max_profiles=2).profile(slow_handler)
+
+    for idx in range(3):
+        context = LambdaContext()
+        context.aws_request_id = f'request-{idx}'
+        handler({}, context)
+        # Modification times of files written within the same tick would tie.
+        os.utime(os.path.join(output, f'request-{idx}.json'), (1000 + idx, 1000 + idx))
+
+    assert sorted(os.listdir(output)) == [
+        'request-1.collapsed', 'request-1.json', 'request-1.pstats',
+        'request-2.collapsed', 'request-2.json', 'request-2.pstats',
+    ]
+    with open(os.path.join(output, 'request-2.collapsed')) as f:
+        assert all(line.rsplit(' ', 1)[1].strip().isdigit() for line in f)
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.delenv('PROFILE_SAMPLE_RATE', raising=False)
+    monkeypatch.setenv('APP_ENV', 'prd')
+    monkeypatch.setenv('PROFILE_ENVS', 'dev, stg')
+    assert Profiler.from_env() is None
+
+    monkeypatch.setenv('PROFILE_SAMPLE_RATE', '0.5')
+    assert Profiler.from_env() is None
+
+    monkeypatch.setenv('APP_ENV', 'stg')
+    monkeypatch.setenv('PROFILE_THRESHOLD_MS', '250')
+    monkeypatch.setenv('PROFILE_OUTPUT', '/tmp/profiles')
+    profiler = Profiler.from_env()
+    assert profiler.sample_rate == 0.5
+    assert profiler.threshold_ms == 250
+    assert profiler.output == '/tmp/profiles'
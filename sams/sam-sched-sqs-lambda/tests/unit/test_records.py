@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from laur.codec import encode_message
+from laur.records import SqsRecord
+
+
+def make_raw(body, message_attributes=None):
+    return {
+        'messageId': '059f36b4-87a3-44ab-83d2-661975830a7d',
+        'receiptHandle': 'AQEBwJnKyrHigUMZj6rYigCgxlaS3SLy0a...',
+        'body': body,
+        'attributes': {
+            'ApproximateReceiveCount': '2',
+            'SentTimestamp': '1545082649183',
+            'ApproximateFirstReceiveTimestamp': '1545082649185',
+            'MessageGroupId': 'group-1',
+        },
+        'messageAttributes': message_attributes or {},
+        'eventSource': 'aws:sqs',
+    }
+
+
+def test_attributes_are_converted():
+    record = SqsRecord(make_raw('{}'))
+    assert record.sent_timestamp == 1545082649183
+    assert record.approximate_receive_count == 2
+    assert record.approximate_first_receive_timestamp == 1545082649185
+    assert record.group_id == 'group-1'
+    assert record.deduplication_id is None
+
+
+def test_body_is_not_parsed_until_accessed():
+    record = SqsRecord(make_raw('not json'))
+    assert record.approximate_receive_count == 2
+    with pytest.raises(ValueError):
+        record.body
+
+
+def test_body_is_parsed_once():
+    record = SqsRecord(make_raw(json.dumps({'RecordNumber': 1234})))
+    assert record.body == {'RecordNumber': 1234}
+    assert record.body is record.body
+
+
+def test_compressed_body():
+    obj = {'payload': 'x' * 1000}
+    message = encode_message(obj, compress_threshold=100)
+    attributes = {name: {'dataType': a['DataType'], 'stringValue': a['StringValue']}
+                  for name, a in message['MessageAttributes'].items()}
+
+    record = SqsRecord(make_raw(message['MessageBody'], attributes))
+
+    assert record.content_encoding == 'gzip'
+    assert record.body == obj
+    assert record.message_attributes == {'ContentEncoding': 'gzip'}
+
+
+def test_records_have_no_dict():
+    record = SqsRecord(make_raw('{}'))
+    assert not hasattr(record, '__dict__')
+
+
+def test_from_event():
+    records = SqsRecord.from_event({'Records': [make_raw('{}'), make_raw('[]')]})
+    assert [record.body for record in records] == [{}, []]
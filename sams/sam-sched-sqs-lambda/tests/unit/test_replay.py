@@ -0,0 +1,138 @@
+import io
+import json
+import os
+import threading
+
+from lambda_handlers.hello_world import app
+from laur.capture import CAPTURE_KEY
+from laur.events import make_sqs_event
+from laur.localsqs import VirtualClock
+from laur.replay import ReplayReport, compare, iter_lines, paced, read_captures, replay, run
+
+SAMPLE_CAPTURE = os.path.join(os.path.dirname(__file__), '..', '..', 'events', 'capture.jsonl')
+
+
+def failing(message_ids):
+    def handler(event, context):
+        return {'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in event['Records']
+                                      if record['messageId'] in message_ids]}
+
+    return handler
+
+
+def write_captures(path, events, step=1.0):
+    with open(path, 'w') as f:
+        for idx, event in enumerate(events):
+            f.write(json.dumps({'capturedAt': 1000 + idx * step, 'batchItemFailures': [], 'event': event}) + '\n')
+
+
+def test_iter_lines_skips_blank_lines_and_reads_a_last_line_without_newline(tmp_path):
+    path = tmp_path / 'lines'
+    path.write_bytes(b'a\n\n  \nb\nc')
+    (tmp_path / 'empty').write_bytes(b'')
+
+    assert list(iter_lines(str(path))) == [b'a', b'b', b'c']
+    assert list(iter_lines(str(tmp_path / 'empty'))) == []
+
+
+def test_read_captures_from_log_lines(tmp_path):
+    path = tmp_path / 'log'
+    capture = {'capturedAt': 1, 'event': {'Records': []}}
+    path.write_text('\n'.join([
+        '2023-01-01T00:00:00 ' + json.dumps({CAPTURE_KEY: capture}),
+        'START RequestId: 1',
+        '{"not": "a capture"}',
+        json.dumps(capture),
+    ]))
+
+    assert list(read_captures([str(path)])) == [capture, capture]
+
+
+def test_paced_compresses_captured_time():
+    clock = VirtualClock()
+    captures = [{'capturedAt': at} for at in (100, 101, 104)]
+
+    replayed_at = []
+    for _ in paced(captures, speed=2, clock=clock):
+        replayed_at.append(clock.monotonic())
+
+    assert [at - replayed_at[0] for at in replayed_at] == [0, 0.5, 2]
+
+
+def test_paced_without_speed_does_not_wait():
+    clock = VirtualClock(0)
+
+    assert len(list(paced([{'capturedAt': at} for at in (0, 100)], None, clock))) == 2
+    assert clock.monotonic() == 0
+
+
+def test_replay_in_parallel_keeps_the_order_of_captures():
+    events = [make_sqs_event(2, seed=idx) for idx in range(20)]
+    threads = set()
+
+    def handler(event, context):
+        threads.add(threading.get_ident())
+        return {'batchItemFailures': []}
+
+    results = list(replay(handler, ({'event': event} for event in events), workers=4))
+
+    assert [result.index for result in results] == list(range(20))
+    assert len(threads) > 1
+
+
+def test_replay_reports_every_record_of_an_invocation_that_raised():
+    event = make_sqs_event(2, seed=0)
+
+    def handler(event, context):
+        raise RuntimeError('boom')
+
+    result, = replay(handler, [{'event': event}])
+
+    assert result.error == 'RuntimeError'
+    assert result.failures == [record['messageId'] for record in event['Records']]
+
+
+def test_run_reports_failures_and_mismatches_with_the_capture(tmp_path):
+    path = str(tmp_path / 'capture.jsonl')
+    events = [make_sqs_event(2, seed=idx) for idx in range(3)]
+    write_captures(path, events)
+    failed_id = events[1]['Records'][0]['messageId']
+
+    report = run(failing({failed_id}), [path]).to_dict()
+
+    assert report['invocations'] == 3
+    assert report['records'] == 6
+    assert report['failedRecords'] == 1
+    assert report['captureMismatches'] == 1
+    assert report['failures'] == {'1': [failed_id]}
+    assert {'p50Ms', 'p95Ms', 'p99Ms'} <= set(report)
+
+
+def test_compare_finds_different_failures_and_slower_percentiles():
+    baseline = {'invocations': 3, 'failures': {'1': ['a']}, 'p50Ms': 1.0, 'p95Ms': 2.0, 'p99Ms': 3.0}
+
+    assert compare(dict(baseline, p99Ms=3.5), baseline) == []
+    assert compare({'invocations': 3, 'failures': {'2': ['b']}, 'p50Ms': 1.0, 'p95Ms': 4.0, 'p99Ms': 3.0},
+                   baseline) == [
+        "invocation 1: batchItemFailures [] vs baseline ['a']",
+        "invocation 2: batchItemFailures ['b'] vs baseline []",
+        'p95Ms: 4.000 vs baseline 2.000',
+    ]
+
+
+def test_report_without_invocations():
+    assert ReplayReport().to_dict() == {
+        'invocations': 0, 'records': 0, 'failedRecords': 0, 'errors': 0, 'captureMismatches': 0,
+        'wallSeconds': 0.0, 'recordsPerSec': 0, 'failures': {},
+    }
+
+
+def test_sample_capture_replays_through_lambda_handler(monkeypatch):
+    monkeypatch.setattr(app.metrics, 'stream', io.StringIO())
+
+    report = run(app.lambda_handler, [SAMPLE_CAPTURE], workers=2).to_dict()
+
+    assert report['invocations'] == 5
+    assert report['records'] == 21
+    assert report['failedRecords'] == 0
+    assert report['captureMismatches'] == 0
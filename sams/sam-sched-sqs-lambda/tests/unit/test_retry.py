@@ -0,0 +1,157 @@
+import json
+import random
+
+import pytest
+
+from laur.batch import BatchProcessor
+from laur.events import record_from_message
+from laur.localsqs import LocalSqs, VirtualClock
+from laur.retry import RetryHandler, RetryPolicy, main, redrive
+
+
+@pytest.fixture()
+def sqs():
+    return LocalSqs(clock=VirtualClock())
+
+
+@pytest.fixture()
+def queues(sqs):
+    attributes = {'FifoQueue': 'true', 'ContentBasedDeduplication': 'true', 'VisibilityTimeout': '10'}
+    queue_url = sqs.create_queue(QueueName='source.fifo', Attributes=attributes)['QueueUrl']
+    dead_letter_queue_url = sqs.create_queue(QueueName='dlq.fifo', Attributes=attributes)['QueueUrl']
+    return queue_url, dead_letter_queue_url
+
+
+def receive_records(sqs, queue_url, max_number=10):
+    messages = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=max_number, AttributeNames=['All'],
+                                   MessageAttributeNames=['All']).get('Messages', [])
+    return [record_from_message(message, sqs.queue_arn(queue_url.rsplit('/', 1)[1])) for message in messages]
+
+
+def test_backoff_grows_exponentially_with_equal_jitter():
+    policy = RetryPolicy(base_seconds=10, max_seconds=60, rng=random.Random(1))
+
+    for receive_count, ceiling in [(1, 10), (2, 20), (3, 40), (4, 60), (10, 60)]:
+        backoffs = [policy.backoff(receive_count) for _ in range(50)]
+        assert ceiling / 2 - 1 <= min(backoffs) and max(backoffs) <= ceiling
+
+
+def test_failed_records_are_backed_off_and_the_rest_of_the_group_released(sqs, queues):
+    queue_url, _ = queues
+    for body in ['fail', 'next']:
+        sqs.send_message(QueueUrl=queue_url, MessageBody=body, MessageGroupId='g')
+    sqs.send_message(QueueUrl=queue_url, MessageBody='ok', MessageGroupId='h')
+
+    def handler(record):
+        if record['body'] == 'fail':
+            raise ValueError(record['body'])
+
+    policy = RetryPolicy(base_seconds=100, max_seconds=100, rng=random.Random(1))
+    processor = BatchProcessor(handler, max_workers=1, failure_handler=RetryHandler(policy, client=sqs))
+    records = receive_records(sqs, queue_url)
+
+    response = processor.process(records)
+
+    assert [item['itemIdentifier'] for item in response['batchItemFailures']] == [
+        records[0]['messageId'], records[1]['messageId']]
+    sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=records[2]['receiptHandle'])
+    # The group is held by the failed record well beyond the visibility timeout of the queue, 10 seconds.
+    sqs.clock.advance(30)
+    assert receive_records(sqs, queue_url) == []
+    sqs.clock.advance(100)
+    assert [record['body'] for record in receive_records(sqs, queue_url)] == ['fail', 'next']
+
+
+def test_poison_records_are_quarantined(sqs, queues):
+    queue_url, dead_letter_queue_url = queues
+    sqs.send_message(QueueUrl=queue_url, MessageBody='poison', MessageGroupId='g',
+                     MessageAttributes={'kind': {'DataType': 'String', 'StringValue': 'test'}})
+    sqs.send_message(QueueUrl=queue_url, MessageBody='next', MessageGroupId='g')
+
+    def handler(record):
+        if record['body'] == 'poison':
+            raise ValueError()
+
+    retry_handler = RetryHandler(RetryPolicy(base_seconds=0, max_attempts=3), dead_letter_queue_url, client=sqs)
+    processor = BatchProcessor(handler, max_workers=1, failure_handler=retry_handler)
+
+    for attempt in range(1, 4):
+        records = receive_records(sqs, queue_url)
+        assert records[0]['attributes']['ApproximateReceiveCount'] == str(attempt)
+        response = processor.process(records)
+        failures = [item['itemIdentifier'] for item in response['batchItemFailures']]
+        for record in records:
+            if record['messageId'] not in failures:
+                sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=record['receiptHandle'])
+
+    # The poison record was reported as a success, and the record after it was released at once.
+    assert failures == [records[1]['messageId']]
+    assert [record['body'] for record in receive_records(sqs, queue_url)] == ['next']
+    quarantined, = receive_records(sqs, dead_letter_queue_url)
+    assert quarantined['body'] == 'poison'
+    assert quarantined['attributes']['MessageGroupId'] == 'g'
+    assert quarantined['messageAttributes']['kind']['stringValue'] == 'test'
+
+
+def test_records_are_reported_when_quarantine_fails(sqs, queues):
+    queue_url, _ = queues
+    sqs.send_message(QueueUrl=queue_url, MessageBody='poison', MessageGroupId='g')
+    retry_handler = RetryHandler(RetryPolicy(max_attempts=1), 'https://sqs.us-west-2.amazonaws.com/1/none.fifo',
+                                 client=sqs)
+    records = receive_records(sqs, queue_url)
+
+    assert retry_handler(records, {records[0]['messageId']}) == [records[0]['messageId']]
+
+
+def test_redrive_moves_messages_back_in_order(sqs, queues):
+    queue_url, dead_letter_queue_url = queues
+    for idx in range(25):
+        sqs.send_message(QueueUrl=dead_letter_queue_url, MessageBody=f'{idx % 2} {idx}',
+                         MessageGroupId=f'g{idx % 2}')
+
+    result = redrive(dead_letter_queue_url, queue_url, client=sqs, wait_time_seconds=0)
+
+    assert result.to_dict() == {'moved': 25, 'failed': 0}
+    assert sqs.get_queue_attributes(QueueUrl=dead_letter_queue_url,
+                                    AttributeNames=['ApproximateNumberOfMessages'])['Attributes'] == {
+        'ApproximateNumberOfMessages': '0'}
+    bodies = []
+    while True:
+        records = receive_records(sqs, queue_url)
+        if not records:
+            break
+        for record in records:
+            bodies.append(record['body'])
+            sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=record['receiptHandle'])
+    for group in '01':
+        assert [body for body in bodies if body.startswith(group)] == [
+            f'{group} {idx}' for idx in range(25) if str(idx % 2) == group]
+
+
+def test_redrive_stops_at_max_messages(sqs, queues):
+    queue_url, dead_letter_queue_url = queues
+    for idx in range(15):
+        sqs.send_message(QueueUrl=dead_letter_queue_url, MessageBody=str(idx), MessageGroupId=str(idx))
+
+    assert redrive(dead_letter_queue_url, queue_url, client=sqs, max_messages=12).moved == 12
+
+
+def test_main(sqs, queues, monkeypatch, capsys):
+    queue_url, dead_letter_queue_url = queues
+    sqs.send_message(QueueUrl=dead_letter_queue_url, MessageBody='x', MessageGroupId='g')
+    monkeypatch.setattr('laur.runtime.get_client', lambda service_name: sqs)
+
+    assert main(['redrive', dead_letter_queue_url, queue_url]) == 0
+    assert json.loads(capsys.readouterr().out) == {'moved': 1, 'failed': 0}
+
+
+def test_from_env(monkeypatch):
+    for name in ['DLQ_URL', 'RETRY_BASE_SECONDS', 'RETRY_MAX_SECONDS', 'RETRY_MAX_ATTEMPTS']:
+        monkeypatch.delenv(name, raising=False)
+    assert RetryHandler.from_env() is None
+
+    monkeypatch.setenv('DLQ_URL', 'https://sqs/dlq.fifo')
+    monkeypatch.setenv('RETRY_MAX_ATTEMPTS', '3')
+    retry_handler = RetryHandler.from_env()
+    assert retry_handler.dead_letter_queue_url == 'https://sqs/dlq.fifo'
+    assert retry_handler.policy.max_attempts == 3
@@ -0,0 +1,66 @@
+import subprocess
+import sys
+import threading
+
+from laur.runtime import ClientRegistry, ColdStart, LazyModule
+
+
+class FakeSession:
+    def __init__(self):
+        self.created = []
+
+    def client(self, service_name, **kwargs):
+        self.created.append(('client', service_name, kwargs))
+        return object()
+
+    def resource(self, service_name, **kwargs):
+        self.created.append(('resource', service_name, kwargs))
+        return object()
+
+
+def test_clients_are_reused():
+    session = FakeSession()
+    registry = ClientRegistry(session=session)
+
+    assert registry.client('sqs') is registry.client('sqs')
+    assert registry.client('sqs') is not registry.client('sqs', region_name='us-west-2')
+    assert len(session.created) == 2
+
+
+def test_resources_are_kept_per_thread():
+    session = FakeSession()
+    registry = ClientRegistry(session=session)
+    main = registry.resource('sqs')
+    others = []
+    thread = threading.Thread(target=lambda: others.append(registry.resource('sqs')))
+    thread.start()
+    thread.join()
+
+    assert registry.resource('sqs') is main
+    assert others[0] is not main
+
+
+def test_cold_start_report_is_taken_once():
+    cold_start = ColdStart()
+    with cold_start.phase('init'):
+        pass
+
+    report = cold_start.take_report()
+    assert report['cold'] is True
+    assert 'init' in report['phasesMs']
+    assert cold_start.take_report() is None
+    assert cold_start.report()['cold'] is False
+
+
+def test_lazy_module_is_imported_on_first_access():
+    module = LazyModule('json')
+    assert 'not loaded' in repr(module)
+    assert module.dumps({}) == '{}'
+    assert 'not loaded' not in repr(module)
+
+
+def test_importing_runtime_does_not_import_boto3():
+    code = 'import sys, laur.runtime; print("botocore" in sys.modules)'
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         env={'PYTHONPATH': ':'.join(sys.path)})
+    assert out.stdout.strip() == 'False'
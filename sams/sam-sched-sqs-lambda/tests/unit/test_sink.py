@@ -0,0 +1,153 @@
+import pytest
+
+from laur.events import LambdaContext
+from laur.localsqs import VirtualClock
+from laur.sink import MAX_BATCH_WRITES, BatchSink, BatchWriter, SqliteWriter
+
+
+def make_record(message_id):
+    return {'messageId': message_id, 'body': '', 'attributes': {}}
+
+
+def item(key, value=''):
+    return {'id': {'S': key}, 'value': {'S': value}}
+
+
+class RecordingWriter(BatchWriter):
+    """
+    Leaves the items of unprocessed_keys unprocessed for the first `times` calls.
+    """
+
+    def __init__(self, unprocessed_keys=(), times=1):
+        self.unprocessed_keys = set(unprocessed_keys)
+        self.times = times
+        self.requests = []
+
+    def batch_write(self, request_items):
+        self.requests.append(request_items)
+        if len(self.requests) > self.times:
+            return {}
+        unprocessed = {}
+        for table_name, requests in request_items.items():
+            left = [request for request in requests
+                    if request.get('PutRequest', {}).get('Item', {}).get('id', {}).get('S') in self.unprocessed_keys]
+            if left:
+                unprocessed[table_name] = left
+        return unprocessed
+
+
+def test_writes_are_flushed_in_batches_of_25():
+    writer = SqliteWriter()
+    sink = BatchSink(writer)
+    for idx in range(60):
+        sink.put('items', item(str(idx)), make_record(str(idx)))
+
+    assert sink.flush() == []
+    assert sink.calls == 3
+    assert writer.count('items') == 60
+    assert len(sink) == 0
+
+
+def test_writes_of_a_key_are_coalesced_and_the_last_one_wins():
+    writer = SqliteWriter()
+    sink = BatchSink(writer)
+    sink.put('items', item('k', 'first'), make_record('1'))
+    sink.put('items', item('k', 'second'), make_record('2'))
+    sink.put('items', item('gone'), make_record('2'))
+    sink.delete('items', {'id': {'S': 'gone'}}, make_record('3'))
+
+    sink.flush()
+
+    assert sink.calls == 1
+    assert writer.get('items', {'id': {'S': 'k'}}) == item('k', 'second')
+    assert writer.get('items', {'id': {'S': 'gone'}}) is None
+
+
+def test_writes_of_excluded_records_are_dropped():
+    writer = SqliteWriter()
+    sink = BatchSink(writer)
+    sink.put('items', item('k', 'first'), make_record('1'))
+    sink.put('items', item('k', 'second'), make_record('2'))
+
+    sink.flush(exclude=['2'])
+
+    assert writer.get('items', {'id': {'S': 'k'}}) == item('k', 'first')
+
+
+def test_unprocessed_items_are_retried():
+    writer = RecordingWriter(unprocessed_keys={'b'}, times=2)
+    clock = VirtualClock(0)
+    sink = BatchSink(writer, clock=clock)
+    sink.put('items', item('a'), make_record('1'))
+    sink.put('items', item('b'), make_record('2'))
+
+    assert sink.flush() == []
+    assert [len(request['items']) for request in writer.requests] == [2, 1, 1]
+
+
+def test_items_still_unprocessed_are_mapped_back_to_their_records():
+    forgotten = []
+    writer = RecordingWriter(unprocessed_keys={'b'}, times=10)
+    sink = BatchSink(writer, max_attempts=3, backoff_base=0, on_failure=forgotten.append)
+    sink.put('items', item('a'), make_record('1'))
+    sink.put('items', item('b'), make_record('2'))
+    sink.put('items', item('b', 'again'), make_record('3'))
+
+    failed = sink.flush()
+
+    assert [record['messageId'] for record in failed] == ['2', '3']
+    assert forgotten == failed
+    assert len(writer.requests) == 3
+
+
+def test_a_request_that_raises_fails_its_records():
+    class BrokenWriter(BatchWriter):
+        def batch_write(self, request_items):
+            raise RuntimeError('ValidationException')
+
+    sink = BatchSink(BrokenWriter())
+    for idx in range(MAX_BATCH_WRITES + 1):
+        sink.put('items', item(str(idx)), make_record(str(idx)))
+
+    assert len(sink.flush()) == MAX_BATCH_WRITES + 1
+    assert sink.calls == 2
+
+
+def test_unprocessed_items_are_not_retried_past_the_deadline():
+    class AlmostExpired:
+        context = LambdaContext(timeout_ms=100)
+        safety_margin_ms = 500
+
+    writer = RecordingWriter(unprocessed_keys={'a'}, times=10)
+    sink = BatchSink(writer, backoff_base=0.01)
+    sink.put('items', item('a'), make_record('1'))
+
+    assert [record['messageId'] for record in sink.flush(deadline=AlmostExpired())] == ['1']
+    assert len(writer.requests) == 1
+
+
+def test_key_names_by_table():
+    writer = SqliteWriter(key_names={'orders': ('pk', 'sk')})
+    sink = BatchSink(writer, key_names={'orders': ('pk', 'sk')})
+    order = {'pk': {'S': 'customer'}, 'sk': {'N': '1'}}
+    sink.put('orders', order, make_record('1'))
+    sink.put('orders', dict(order, sk={'N': '2'}), make_record('2'))
+
+    sink.flush()
+
+    assert writer.count('orders') == 2
+    with pytest.raises(ValueError):
+        sink.put('orders', {'pk': {'S': 'customer'}}, make_record('3'))
+
+
+def test_from_env(monkeypatch, tmp_path):
+    for name in ('SINK_BACKEND', 'SINK_SQLITE_PATH', 'SINK_KEY_NAMES'):
+        monkeypatch.delenv(name, raising=False)
+    assert BatchSink.from_env() is None
+
+    monkeypatch.setenv('SINK_SQLITE_PATH', str(tmp_path / 'sink.db'))
+    monkeypatch.setenv('SINK_KEY_NAMES', 'pk,sk')
+    sink = BatchSink.from_env()
+    assert isinstance(sink.writer, SqliteWriter)
+    assert sink.key_names == ('pk', 'sk')
+    assert sink.writer.key_names == ('pk', 'sk')
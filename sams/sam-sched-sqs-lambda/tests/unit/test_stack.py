@@ -0,0 +1,95 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from laur.stack import StackOutputs, main
+
+
+class FakeCloudFormation:
+    def __init__(self):
+        self.calls = 0
+        self.last_updated_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def describe_stacks(self, StackName):
+        self.calls += 1
+        return {
+            'Stacks': [{
+                'StackName': StackName,
+                'LastUpdatedTime': self.last_updated_time,
+                'Outputs': [
+                    {'OutputKey': 'InvokeHelloWorldFifoQueueName', 'OutputValue': 'queue.fifo'},
+                    {'OutputKey': 'HelloWorldFunctionName', 'OutputValue': f'function-{self.calls}'},
+                ],
+            }]
+        }
+
+
+def test_outputs_are_fetched_once(tmp_path):
+    client = FakeCloudFormation()
+    outputs = StackOutputs('stack', client=client, cache_dir=str(tmp_path))
+
+    assert outputs.get('InvokeHelloWorldFifoQueueName') == 'queue.fifo'
+    assert outputs.get('HelloWorldFunctionName') == 'function-1'
+    assert client.calls == 1
+    assert outputs.last_updated_time == '2024-01-01T00:00:00+00:00'
+
+
+def test_outputs_are_read_from_the_disk_cache(tmp_path):
+    StackOutputs('stack', client=FakeCloudFormation(), cache_dir=str(tmp_path)).all()
+
+    client = FakeCloudFormation()
+    outputs = StackOutputs('stack', client=client, cache_dir=str(tmp_path))
+    assert outputs.get('HelloWorldFunctionName') == 'function-1'
+    assert client.calls == 0
+
+
+def test_expired_disk_cache_is_ignored(tmp_path):
+    StackOutputs('stack', client=FakeCloudFormation(), cache_dir=str(tmp_path)).all()
+
+    client = FakeCloudFormation()
+    StackOutputs('stack', client=client, cache_dir=str(tmp_path), max_age=-1).all()
+    assert client.calls == 1
+
+
+def test_refresh(tmp_path):
+    client = FakeCloudFormation()
+    outputs = StackOutputs('stack', client=client, cache_dir=str(tmp_path))
+    outputs.all()
+
+    client.last_updated_time = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    outputs.refresh()
+    assert outputs.get('HelloWorldFunctionName') == 'function-2'
+    assert outputs.last_updated_time == '2024-01-02T00:00:00+00:00'
+
+    reloaded = StackOutputs('stack', client=FakeCloudFormation(), cache_dir=str(tmp_path))
+    assert reloaded.get('HelloWorldFunctionName') == 'function-2'
+
+
+def test_the_disk_cache_is_trusted_until_invalidated(tmp_path):
+    StackOutputs('stack', client=FakeCloudFormation(), cache_dir=str(tmp_path)).all()
+
+    # A deployment is not noticed while the entry is fresh.
+    client = FakeCloudFormation()
+    client.last_updated_time = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    outputs = StackOutputs('stack', client=client, cache_dir=str(tmp_path))
+    assert outputs.get('HelloWorldFunctionName') == 'function-1'
+    assert outputs.last_updated_time == '2024-01-01T00:00:00+00:00'
+
+    outputs.invalidate()
+    assert outputs.get('HelloWorldFunctionName') == 'function-1'
+    assert client.calls == 1
+    assert outputs.last_updated_time == '2024-01-02T00:00:00+00:00'
+
+    assert main(['invalidate', 'stack', '--cache-dir', str(tmp_path)]) == 0
+    assert not (tmp_path / 'stack.json').exists()
+
+
+def test_missing_key(tmp_path):
+    outputs = StackOutputs('stack', client=FakeCloudFormation(), cache_dir=str(tmp_path))
+    with pytest.raises(KeyError):
+        outputs.get('NoSuchOutput')
+
+
+def test_stack_name_is_required():
+    with pytest.raises(ValueError):
+        StackOutputs(None)
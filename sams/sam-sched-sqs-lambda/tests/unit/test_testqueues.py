@@ -0,0 +1,78 @@
+import pytest
+
+from laur.localsqs import LocalSqs, VirtualClock
+from laur.testqueues import QueueFactory
+
+ATTRIBUTES = {
+    'ContentBasedDeduplication': 'true',
+    'DelaySeconds': '0',
+    'FifoQueue': 'true',
+    'MessageRetentionPeriod': '60',
+    'ReceiveMessageWaitTimeSeconds': '10',
+    'VisibilityTimeout': '10',
+}
+
+
+@pytest.fixture()
+def sqs():
+    return LocalSqs(clock=VirtualClock())
+
+
+@pytest.fixture()
+def factory(sqs):
+    source_url = sqs.create_queue(QueueName='sqs-dev-myqueue.fifo', Attributes=ATTRIBUTES)['QueueUrl']
+    return QueueFactory.from_queue(sqs, source_url, prefix='sqs-dev-myqueue-test', clock=sqs.clock)
+
+
+def test_queues_copy_the_attributes_of_the_source_queue(sqs, factory):
+    queue = factory.take()
+
+    attributes = sqs.get_queue_attributes(QueueUrl=queue.url, AttributeNames=['All'])['Attributes']
+    assert {name: attributes[name] for name in ATTRIBUTES} == ATTRIBUTES
+    assert queue.name.startswith('sqs-dev-myqueue-test-main-')
+    assert queue.name.endswith('.fifo')
+
+
+def test_each_queue_is_taken_once(factory):
+    prefilled = factory.prefill(5)
+
+    taken = [factory.take() for _ in range(7)]
+
+    assert taken[:5] == prefilled
+    assert len({queue.url for queue in taken}) == 7
+    assert len(factory.created) == 7
+
+
+def test_names_carry_the_xdist_worker(factory, monkeypatch):
+    monkeypatch.setenv('PYTEST_XDIST_WORKER', 'gw3')
+    factory.prefix = 'p' * 100
+
+    name = factory.new_name()
+
+    assert len(name) == 80
+    assert name.endswith('.fifo')
+    assert factory.take().name.startswith('p' * 10)
+
+
+def test_delete_all(sqs, factory):
+    factory.prefill(3)
+    factory.take()
+    factory.take()
+    factory.take()
+
+    factory.delete_all()
+
+    assert sqs.list_queues(QueueNamePrefix='sqs-dev-myqueue-test') == {}
+    assert factory.created == []
+    # The source queue is left alone.
+    assert sqs.get_queue_url(QueueName='sqs-dev-myqueue.fifo')
+
+
+def test_delete_stale_deletes_old_queues_only(sqs, factory):
+    factory.prefill(2)
+    sqs.clock.advance(7200)
+    fresh = [factory.create(), factory.create()]
+
+    assert factory.delete_stale(max_age=3600) == 2
+    assert sqs.list_queues(QueueNamePrefix='sqs-dev-myqueue-test')['QueueUrls'] == sorted(
+        queue.url for queue in fresh)
@@ -1,12 +1,48 @@
 """
 Make sure env variable AWS_SAM_STACK_NAME exists with the name of the stack we are going to test.
+
+Set env variable LOCAL_SQS=1 to run the tests against an in-process SQS with a virtual clock instead of the stack.
+
+Each test gets its own FIFO queue with the attributes of the queue of the stack, so tests can run in parallel:
+python -mpytest -n auto tests
 """
+import math
 import os
-import time
 
 import boto3
 import pytest
 
+from laur.stack import stack_outputs
+from laur.testqueues import QueueFactory
+
+local_sqs = None
+if os.environ.get('LOCAL_SQS', '').lower() in ('1', 'true'):
+    from laur.localsqs import LocalSqs, VirtualClock
+
+    # Installed at import time since test classes create their boto3 clients and resources when they are defined.
+    local_sqs = LocalSqs(clock=VirtualClock())
+    local_sqs.install()
+
+
+def create_local_stack_outputs() -> dict:
+    """
+    Create the queue of template.yaml with AppId=sqs and AppEnv=dev in the local SQS and return the stack outputs.
+    """
+    queue_name = 'sqs-dev-myqueue.fifo'
+    queue_url = local_sqs.create_queue(QueueName=queue_name, Attributes={
+        'ContentBasedDeduplication': 'true',
+        'DelaySeconds': '0',
+        'FifoQueue': 'true',
+        'MessageRetentionPeriod': '60',
+        'ReceiveMessageWaitTimeSeconds': '10',
+        'VisibilityTimeout': '10',
+    })['QueueUrl']
+    return {
+        'MyFifoQueueArn': local_sqs.queue_arn(queue_name),
+        'MyFifoQueueName': queue_name,
+        'MyFifoQueueUrl': queue_url,
+    }
+
 
 def get_stack_name() -> str:
     """
@@ -17,70 +53,72 @@ def get_stack_name() -> str:
 
 def get_stack_outputs(stack_name: str) -> dict:
     """
-    Get the stack outputs from AWS CloudFormation stack
+    Get the stack outputs from AWS CloudFormation stack, fetched once and cached by laur.stack
     """
-    if stack_name is None:
-        raise ValueError('Please set the AWS_SAM_STACK_NAME environment variable to the name of your stack')
-
-    client = boto3.client("cloudformation")
-
-    try:
-        response = client.describe_stacks(StackName=stack_name)
-    except Exception as e:
-        raise Exception(
-            f"Cannot find stack {stack_name} \n" f'Please make sure a stack with the name "{stack_name}" exists'
-        ) from e
-
-    stacks = response["Stacks"]
-    return stacks[0]["Outputs"]
+    return stack_outputs(stack_name).all()
 
 
 def get_output_value_from_stack(stack_name: str, key_name: str) -> str:
     """
     Get the output value from AWS CloudFormation stack
     """
-    stack_outputs = get_stack_outputs(stack_name)
-    data = [output for output in stack_outputs if output["OutputKey"] == key_name]
+    if local_sqs is not None:
+        return create_local_stack_outputs()[key_name]
 
-    if not data:
-        raise KeyError(f"{key_name} not found in stack {stack_name}")
+    return stack_outputs(stack_name).get(key_name)
 
-    return data[0]["OutputValue"]
+
+@pytest.fixture(scope='session')
+def queue_factory(request):
+    """
+    A factory of queues with the attributes of the queue of the stack.
+    The queues this worker is expected to need are created at once, and all of them are deleted at the end.
+    """
+    stack_name = get_stack_name()
+    source_name = get_output_value_from_stack(stack_name, 'MyFifoQueueName')
+    source_url = get_output_value_from_stack(stack_name, 'MyFifoQueueUrl')
+    factory = QueueFactory.from_queue(boto3.client('sqs'), source_url,
+                                      prefix=source_name[:-len('.fifo')] + '-test')
+    factory.delete_stale()
+    using = sum(1 for item in request.session.items if {'queue_name', 'queue_url'} & set(item.fixturenames))
+    workers = int(os.environ.get('PYTEST_XDIST_WORKER_COUNT', '1'))
+    factory.prefill(math.ceil(using / workers))
+    yield factory
+    factory.delete_all()
 
 
 @pytest.fixture()
-def queue_name():
+def test_queue(queue_factory):
     """
-    Get the queue name from AWS CloudFormation stack
+    A queue of the test alone.
     """
-    return get_output_value_from_stack(get_stack_name(), 'MyFifoQueueName')
+    return queue_factory.take()
 
 
 @pytest.fixture()
-def queue_url():
+def queue_name(test_queue):
     """
-    Get the queue url from AWS CloudFormation stack
+    Get the name of the queue of the test
     """
-    return get_output_value_from_stack(get_stack_name(), 'MyFifoQueueUrl')
+    return test_queue.name
 
 
-def remove_all_messages_in_the_queue():
+@pytest.fixture()
+def queue_url(test_queue):
     """
-    Remove all messages from the queue
+    Get the url of the queue of the test
     """
-    sqs = boto3.resource('sqs')
-    queue_name = get_output_value_from_stack(get_stack_name(), 'MyFifoQueueName')
-    queue = sqs.get_queue_by_name(QueueName=queue_name)
-    for message in queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=10):
-        message.delete()
+    return test_queue.url
 
 
-@pytest.fixture(scope='session', autouse=True)
-def fixture_by_session():
+@pytest.fixture(autouse=True)
+def virtual_time(request, monkeypatch):
     """
-    Fixture by a session
+    Make `time` and `datetime` of a test module read the virtual clock of the local SQS.
     """
-    remove_all_messages_in_the_queue()
-    yield
-    # Since the retention period of the queue is 60, wait for that time for the following tests.
-    time.sleep(60)
+    if local_sqs is not None:
+        clock = local_sqs.clock
+        if hasattr(request.module, 'time'):
+            monkeypatch.setattr(request.module, 'time', clock)
+        if hasattr(request.module, 'datetime'):
+            monkeypatch.setattr(request.module, 'datetime', clock.datetime)
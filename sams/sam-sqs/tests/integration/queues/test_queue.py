@@ -9,6 +9,8 @@ import boto3
 import pytest
 from botocore.exceptions import ClientError
 
+from laur.producer import BatchProducer
+
 
 class TestQueue:
     sqs = boto3.resource('sqs')
@@ -116,6 +118,32 @@ class TestQueue:
             assert message.body == expected
             message.delete()
 
+    def test_messages_sent_in_batches_are_received_in_order_in_each_group(self, queue_url):
+        """
+        Test if messages sent with SendMessageBatch are received in order in each group.
+        """
+        producer = BatchProducer(queue_url, client=self.sqs.meta.client)
+        messages = [
+            {'MessageBody': f'{uuid.uuid4().hex} {group}', 'MessageGroupId': f'message-group-id-{group}'}
+            for _ in range(3) for group in [1, 2]
+        ]
+        # sending
+        result = producer.send(messages)
+        assert result.failed == []
+        assert result.calls == 2
+        # receiving
+        queue = self.sqs.Queue(queue_url)
+        received = []
+        while len(received) < len(messages):
+            batch = queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=1)
+            assert len(batch) > 0
+            for message in batch:
+                received.append(message.body)
+                message.delete()
+        for group in [1, 2]:
+            expected = [m['MessageBody'] for m in messages if m['MessageGroupId'] == f'message-group-id-{group}']
+            assert [body for body in received if body.endswith(f' {group}')] == expected
+
     def test_following_messages_in_the_same_group_are_not_received_when_a_previous_message_in_the_queue(self,
                                                                                                         queue_name):
         """